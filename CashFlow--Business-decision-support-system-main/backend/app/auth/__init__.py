@@ -1,12 +1,25 @@
-from .jwt_handler import create_access_token, decode_access_token
+from .jwt_handler import (
+    create_access_token, decode_access_token,
+    register_revocation_check
+)
 from .jwt_bearer import JWTBearer
-from .deps import get_current_user, get_current_active_user, get_current_admin_user
+from .deps import (
+    get_current_user, get_current_active_user, get_current_admin_user,
+    get_fresh_current_user, get_current_principal, get_current_admin_principal,
+    get_user_from_token, principal_from_token
+)
 
 __all__ = [
     'create_access_token',
     'decode_access_token',
+    'register_revocation_check',
     'JWTBearer',
     'get_current_user',
     'get_current_active_user',
-    'get_current_admin_user'
+    'get_current_admin_user',
+    'get_fresh_current_user',
+    'get_current_principal',
+    'get_current_admin_principal',
+    'get_user_from_token',
+    'principal_from_token'
 ]
\ No newline at end of file
@@ -1,51 +1,123 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app.models.user import UserInDB, UserRole
-from app.services.user_service import get_user
-from .jwt_handler import decode_access_token
+from app.models.user import UserInDB, UserRole, Principal
+from app.services.user_service import get_user_cached, is_token_version_revoked
+from app.services.session_service import is_session_revoked
+from app.database import get_db
+from .jwt_handler import decode_access_token, register_revocation_check
 
 # Update the tokenUrl to include the prefix
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
-    credentials_exception = HTTPException(
+# Reject tokens older than a user's revocation point, including cached ones
+register_revocation_check(
+    lambda payload: is_token_version_revoked(payload.get("sub", ""), payload.get("ver", 0))
+)
+register_revocation_check(lambda payload: is_session_revoked(payload.get("sid")))
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def principal_from_token(token: str) -> Principal:
+    """
+    Build the authenticated principal from a verified access token.
+    Trusts the signed claims; no database lookup is made.
+    """
+    payload = decode_access_token(token) if token else None
+    if not payload:
+        raise _credentials_exception()
+    
+    user_id = payload.get("sub")
+    business_id = payload.get("business")
+    role = payload.get("role")
+    token_version = payload.get("ver", 0)
     
+    if user_id is None or business_id is None or role is None:
+        raise _credentials_exception()
+    
+    try:
+        return Principal(
+            id=user_id,
+            business_id=business_id,
+            role=role,
+            token_version=token_version,
+            session_id=payload.get("sid")
+        )
+    except Exception as e:
+        print(f"Invalid token claims: {e}")
+        raise _credentials_exception()
+
+async def _load_user(principal: Principal, fresh: bool = False) -> UserInDB:
+    """Full user record for a principal, rejecting tokens older than the user's token version"""
     try:
-        payload = decode_access_token(token)
-        if not payload:
-            raise credentials_exception
-            
-        user_id: str = payload.get("sub")
-        business_id: str = payload.get("business")
-        
-        print(f"Token payload: user_id={user_id}, business_id={business_id}")  # Add this line
-        
-        if user_id is None or business_id is None:
-            raise credentials_exception
-        
-        user = await get_user(business_id, user_id)
-        
-        # Add more detailed logging
-        if user is None:
-            print(f"User not found in database: user_id={user_id}, business_id={business_id}")
-            raise credentials_exception
-        
-        return user
+        user = await get_user_cached(
+            str(principal.business_id),
+            str(principal.id),
+            await get_db(),
+            fresh=fresh
+        )
     except Exception as e:
         print(f"Error in get_current_user: {e}")
-        raise credentials_exception
+        raise _credentials_exception()
+    
+    if user is None:
+        print(f"User not found in database: user_id={principal.id}, business_id={principal.business_id}")
+        raise _credentials_exception()
+    
+    # Tokens issued before a revocation stop working even in other processes
+    if principal.token_version < user.token_version:
+        raise _credentials_exception()
+    
+    return user
+
+async def get_user_from_token(token: str, fresh: bool = False) -> UserInDB:
+    """
+    Resolve a bearer token to its full user record.
+    Uses the short-lived user cache unless fresh=True.
+    """
+    return await _load_user(principal_from_token(token), fresh)
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """Identity from token claims only; use for routes that just need ids and role"""
+    return principal_from_token(token)
+
+async def get_current_admin_principal(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """
+    Admin identity for admin-only routes. The role and token version are
+    confirmed against the database (bypassing the user cache), so a demoted,
+    deleted or revoked admin loses access immediately in every worker.
+    """
+    if principal.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="The user doesn't have enough privileges"
+        )
+    user = await _load_user(principal, fresh=True)
+    if user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="The user doesn't have enough privileges"
+        )
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+    return await get_user_from_token(token)
+
+async def get_fresh_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+    """Full user record read straight from the database, bypassing the cache"""
+    return await get_user_from_token(token, fresh=True)
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
     return current_user
 
-async def get_current_admin_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
+async def get_current_admin_user(current_user: UserInDB = Depends(get_fresh_current_user)) -> UserInDB:
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="The user doesn't have enough privileges"
         )
-    return current_user
\ No newline at end of file
+    return current_user
@@ -1,8 +1,16 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
+import hashlib
+import time
 from jose import jwt
 from config import settings
 
+# Verified tokens: sha256(token) -> (claims, exp timestamp), least recently used first
+_TOKEN_CACHE: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+# Callables taking the claims and returning True if the token must be rejected
+_REVOCATION_CHECKS: List[Callable[[dict], bool]] = []
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -14,8 +22,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def decode_access_token(token: str):
+    """
+    Verify a token and return its claims, or None if it is invalid.
+    
+    Verified claims are cached by token digest until the token expires, so
+    repeated requests with the same token skip signature verification.
+    Revocation checks run on every call, cached or not.
+    """
+    digest = _token_digest(token)
+    now = time.time()
+    
+    cached = _TOKEN_CACHE.get(digest)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at > now:
+            _TOKEN_CACHE.move_to_end(digest)
+            if _is_revoked(payload):
+                _TOKEN_CACHE.pop(digest, None)
+                return None
+            return dict(payload)
+        _TOKEN_CACHE.pop(digest, None)
+    
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
     except jwt.JWTError:
-        return None
\ No newline at end of file
+        return None
+    
+    if _is_revoked(payload):
+        return None
+    
+    expires_at = payload.get("exp")
+    if isinstance(expires_at, (int, float)):
+        _TOKEN_CACHE[digest] = (dict(payload), float(expires_at))
+        while len(_TOKEN_CACHE) > settings.TOKEN_CACHE_MAX_ENTRIES:
+            _TOKEN_CACHE.popitem(last=False)
+    
+    return payload
+
+def register_revocation_check(check: Callable[[dict], bool]) -> None:
+    """Add a hook that can reject otherwise valid tokens, e.g. after a password reset"""
+    if check not in _REVOCATION_CHECKS:
+        _REVOCATION_CHECKS.append(check)
+
+def _is_revoked(payload: dict) -> bool:
+    return any(check(payload) for check in _REVOCATION_CHECKS)
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
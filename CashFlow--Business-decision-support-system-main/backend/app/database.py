@@ -1,5 +1,7 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 from config import settings
+from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,6 +10,9 @@ logger = logging.getLogger(__name__)
 mongodb_client = None
 mongodb = None
 
+# Set to False the first time the server rejects a transaction (standalone mongod)
+transactions_supported = True
+
 # Database dependency that can be used in routes
 async def get_db():
     return mongodb
@@ -47,11 +52,83 @@ async def connect_to_mongodb():
     except Exception as e:
         logger.error(f"⚠️ Database connection verification error: {str(e)}")
     
+    try:
+        await ensure_indexes(mongodb)
+    except Exception as e:
+        logger.error(f"⚠️ Index creation error: {str(e)}")
+    
     return mongodb
 
+# Index setup, run once at startup (create_index is a no-op for existing indexes)
+async def ensure_indexes(db):
+    from app.services.session_service import ensure_session_indexes
+    from app.services.customer_service import ensure_customer_indexes
+    from app.services.inventory_service import ensure_inventory_indexes
+    from app.services.stock_service import ensure_stock_indexes
+    from app.services.alert_service import ensure_alert_indexes
+    from app.services.reorder_service import ensure_reorder_indexes
+    from app.services.order_service import ensure_order_indexes
+    from app.services.sale_service import ensure_sale_indexes
+    from app.services.till_service import ensure_till_indexes
+    
+    await ensure_session_indexes(db)
+    await ensure_customer_indexes(db)
+    await ensure_inventory_indexes(db)
+    await ensure_stock_indexes(db)
+    await ensure_alert_indexes(db)
+    await ensure_reorder_indexes(db)
+    await ensure_order_indexes(db)
+    await ensure_sale_indexes(db)
+    await ensure_till_indexes(db)
+    logger.info("Database indexes ensured")
+
+# One-off data migrations, recorded in the migrations collection
+async def run_migration_once(db, name: str, migrate) -> bool:
+    """
+    Run `await migrate(db)` unless a migration with this name has already
+    completed, so backfills don't rescan collections on every startup.
+    The marker is written only after the migration succeeds; migrations must
+    be idempotent since two workers starting together may both run one.
+    Returns True if the migration ran.
+    """
+    if await db.migrations.find_one({"_id": name}, {"_id": 1}):
+        return False
+    
+    result = await migrate(db)
+    await db.migrations.update_one(
+        {"_id": name},
+        {"$set": {"completed_at": datetime.utcnow(), "result": result}},
+        upsert=True
+    )
+    logger.info(f"Migration {name} completed: {result}")
+    return True
+
 # Disconnect function
 async def close_mongodb_connection():
     global mongodb_client
     if mongodb_client:
         mongodb_client.close()
-        logger.info("MongoDB connection closed")
\ No newline at end of file
+        logger.info("MongoDB connection closed")
+
+# Multi-document transactions
+async def run_in_transaction(db, callback):
+    """
+    Run `await callback(session)` inside a transaction, retrying on transient errors.
+    
+    Standalone servers can't run transactions; there the callback is run once
+    with session=None so local development still works without atomicity.
+    """
+    global transactions_supported
+    
+    if transactions_supported:
+        try:
+            async with await db.client.start_session() as session:
+                return await session.with_transaction(callback)
+        except OperationFailure as e:
+            # IllegalOperation: "Transaction numbers are only allowed on a replica set member or mongos"
+            if e.code != 20:
+                raise
+            transactions_supported = False
+            logger.warning("MongoDB deployment does not support transactions, running without")
+    
+    return await callback(None)
@@ -0,0 +1,22 @@
+from pydantic import Field, BaseModel
+from typing import List, Optional
+from datetime import datetime
+from .base import PyObjectId, BaseDBModel
+
+class StockAlertModel(BaseDBModel):
+    """Low-stock state of one product; active while quantity is at or below the threshold"""
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    business_id: PyObjectId
+    product_id: PyObjectId
+    product_name: str
+    sku: Optional[str] = None
+    quantity: int           # on hand less units reserved by pending orders
+    threshold: int
+    active: bool = True
+    triggered_at: datetime = Field(default_factory=datetime.utcnow)
+    resolved_at: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class StockAlertPage(BaseModel):
+    items: List[StockAlertModel]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,28 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from enum import Enum
+
+class AnalyticsInterval(str, Enum):
+    DAY = "day"
+    WEEK = "week"    # ISO week, e.g. 2024-W07
+    MONTH = "month"
+
+class AnalyticsRow(BaseModel):
+    key: Optional[str] = None     # period, category id, payment method, hour or customer id
+    label: Optional[str] = None   # display name where the key is an id
+    sales_count: int = 0
+    quantity: int = 0
+    revenue: float = 0            # total_amount (after discount, including tax)
+    net_sales: float = 0          # subtotal - discount
+    tax: float = 0
+    discount: float = 0
+    refunds: float = 0
+
+class AnalyticsReport(BaseModel):
+    dimension: str
+    start: datetime
+    end: datetime
+    rows: List[AnalyticsRow]
+    totals: AnalyticsRow
+    elapsed_ms: float
@@ -1,7 +1,14 @@
 from pydantic import Field, BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
+from datetime import datetime
 from .base import PyObjectId, BaseDBModel
 
+class CustomerCategoryTotal(BaseModel):
+    """Net spend and quantity for one category, keyed by category id on the customer"""
+    name: Optional[str] = None
+    amount: float = 0
+    quantity: int = 0
+
 class CustomerModel(BaseDBModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     business_id: PyObjectId
@@ -10,7 +17,17 @@ class CustomerModel(BaseDBModel):
     phone: Optional[str] = None
     address: Optional[str] = None
     discount_eligibility: bool = False
+    # Most recent sale ids, newest last (bounded)
     purchase_history: List[PyObjectId] = []
+    
+    # Aggregates maintained by sales, refunds and order completion
+    purchase_count: int = 0
+    order_count: int = 0
+    lifetime_value: float = 0
+    refund_total: float = 0
+    first_purchase_at: Optional[datetime] = None
+    last_purchase_at: Optional[datetime] = None
+    category_totals: Dict[str, CustomerCategoryTotal] = {}
 
     model_config = {
         "json_schema_extra": {
@@ -38,4 +55,38 @@ class CustomerUpdate(BaseModel):
     email: Optional[str] = None
     phone: Optional[str] = None
     address: Optional[str] = None
-    discount_eligibility: Optional[bool] = None
\ No newline at end of file
+    discount_eligibility: Optional[bool] = None
+
+class CustomerSummary(BaseDBModel):
+    """Customer fields returned by paginated listing (no purchase history)"""
+    id: PyObjectId = Field(alias="_id")
+    name: str
+    email: str
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    discount_eligibility: bool = False
+    purchase_count: int = 0
+    lifetime_value: float = 0
+    last_purchase_at: Optional[datetime] = None
+
+class CustomerPage(BaseModel):
+    items: List[CustomerSummary]
+    next_cursor: Optional[str] = None
+
+class CustomerTopCategory(BaseModel):
+    category_id: str
+    name: Optional[str] = None
+    amount: float
+    quantity: int
+
+class CustomerStats(BaseModel):
+    customer_id: str
+    purchase_count: int
+    order_count: int
+    lifetime_value: float
+    refund_total: float
+    average_purchase: float
+    first_purchase_at: Optional[datetime] = None
+    last_purchase_at: Optional[datetime] = None
+    top_categories: List[CustomerTopCategory]
+    recent_purchases: List[str]
@@ -10,6 +10,7 @@ class InventoryItemModel(BaseDBModel):
     description: Optional[str] = None
     price: float
     quantity: int
+    reserved: int = 0  # Held by pending orders; available = quantity - reserved
     sku: Optional[str] = None
     barcode: Optional[str] = None  # New barcode field
     # Add category name for convenience in API responses
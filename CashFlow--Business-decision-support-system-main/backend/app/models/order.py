@@ -9,9 +9,13 @@ class OrderStatus(str, Enum):
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
+class OrderSort(str, Enum):
+    CREATED_AT = "created_at"        # newest first
+    DELIVERY_DATE = "delivery_date"  # soonest first
+
 class OrderItemCreate(BaseModel):
     product_id: str  # Accept string ID
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
     @field_validator('product_id')
     def validate_object_id(cls, v):
@@ -51,6 +55,8 @@ class OrderModel(BaseDBModel):
     delivery_date: datetime
     completed_at: Optional[datetime] = None
     sale_id: Optional[PyObjectId] = None  # Reference to the sale when order is completed
+    reserved: bool = False  # Whether the order's stock is held in inventory.reserved
+    reservation_expires_at: Optional[datetime] = None
 
     model_config = {
         "json_schema_extra": {
@@ -75,4 +81,23 @@ class OrderModel(BaseDBModel):
                 "delivery_date": "2024-02-20T10:00:00Z"
             }
         }
-    }
\ No newline at end of file
+    }
+
+class OrderSummary(BaseDBModel):
+    """Order fields returned by paginated listing (line items reduced to a count)"""
+    id: PyObjectId = Field(alias="_id")
+    customer_id: PyObjectId
+    item_count: int = 0
+    subtotal: float
+    tax_amount: float
+    discount_amount: float
+    total_amount: float
+    status: OrderStatus
+    created_at: datetime
+    delivery_date: datetime
+    completed_at: Optional[datetime] = None
+    sale_id: Optional[PyObjectId] = None
+
+class OrderPage(BaseModel):
+    items: List[OrderSummary]
+    next_cursor: Optional[str] = None
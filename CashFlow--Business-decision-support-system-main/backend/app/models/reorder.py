@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from datetime import datetime
+from enum import Enum
+
+class ReorderUrgency(str, Enum):
+    CRITICAL = "critical"   # stock runs out before a reorder could arrive
+    REORDER = "reorder"     # below the target level
+    OK = "ok"
+
+class ReorderRecommendation(BaseModel):
+    product_id: str
+    product_name: str
+    sku: Optional[str] = None
+    category: str
+    current_stock: int                    # on hand less units reserved by pending orders
+    daily_demand: float
+    forecast: Dict[str, float]            # horizon -> predicted quantity
+    days_of_cover: Optional[float] = None  # None when there is no expected demand
+    reorder_point: float
+    target_stock: float
+    suggested_quantity: int
+    suggested_cost: float
+    urgency: ReorderUrgency
+    demand_source: str                    # "model" or "history"
+
+class ReorderPage(BaseModel):
+    generated_at: Optional[datetime] = None
+    lead_time_days: int
+    target_cover_days: int
+    low_stock_threshold: int
+    items: List[ReorderRecommendation]
+    next_cursor: Optional[str] = None
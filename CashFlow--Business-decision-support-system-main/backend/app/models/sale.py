@@ -32,6 +32,7 @@ class SaleItemModel(BaseModel):
     subtotal: float
     product_name: str
     category_name: str  # Add category name for reference
+    refunded_quantity: int = 0  # Units of this line refunded so far (sale lines only)
 
 class SaleStatus(str, Enum):
     COMPLETED = "completed"
@@ -53,6 +54,7 @@ class SaleModel(BaseDBModel):
     status: SaleStatus = SaleStatus.COMPLETED
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     is_refunded: bool = False
+    refund_total: float = 0  # Sum of total_refund over the sale's refunds
     order_id: Optional[PyObjectId] = None
     notes: Optional[str] = None
 
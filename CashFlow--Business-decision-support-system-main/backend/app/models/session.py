@@ -0,0 +1,32 @@
+from pydantic import Field, BaseModel
+from typing import Optional
+from datetime import datetime
+from .base import PyObjectId, BaseDBModel
+
+class SessionModel(BaseDBModel):
+    """A refresh-token session; only a hash of the current refresh secret is stored"""
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    business_id: PyObjectId
+    user_id: PyObjectId
+    token_hash: str
+    previous_hash: Optional[str] = None
+    token_version: int = 0
+    user_agent: Optional[str] = None
+    ip_address: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+    rotation_count: int = 0
+
+class SessionInfo(BaseModel):
+    """Session details safe to return to clients"""
+    id: str
+    user_agent: Optional[str] = None
+    ip_address: Optional[str] = None
+    created_at: datetime
+    last_used_at: datetime
+    expires_at: datetime
+    current: bool = False
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
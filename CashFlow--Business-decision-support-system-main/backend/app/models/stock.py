@@ -0,0 +1,101 @@
+from pydantic import Field, BaseModel, model_validator
+from typing import List, Optional
+from datetime import datetime
+from enum import Enum
+from .base import PyObjectId, BaseDBModel
+
+class StockAdjustmentMode(str, Enum):
+    DELTA = "delta"    # lines carry quantity changes
+    COUNT = "count"    # lines carry counted quantities (stocktake)
+
+class StockAdjustmentLine(BaseModel):
+    """One product, identified by id, SKU or barcode, with a delta or a counted quantity"""
+    product_id: Optional[str] = None
+    sku: Optional[str] = None
+    barcode: Optional[str] = None
+    delta: Optional[int] = None
+    counted: Optional[int] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def check_reference(self):
+        if not (self.product_id or self.sku or self.barcode):
+            raise ValueError("One of product_id, sku or barcode is required")
+        if self.product_id and not PyObjectId.is_valid(self.product_id):
+            raise ValueError("Invalid product_id")
+        return self
+
+class StockAdjustmentRequest(BaseModel):
+    mode: StockAdjustmentMode = StockAdjustmentMode.DELTA
+    reason: str = Field(default="adjustment", max_length=100)
+    notes: Optional[str] = None
+    lines: List[StockAdjustmentLine] = Field(..., min_length=1, max_length=20000)
+
+class StockVarianceLine(BaseModel):
+    product_id: PyObjectId
+    product_name: str
+    sku: Optional[str] = None
+    before: int
+    after: int
+    variance: int
+    unit_price: float = 0
+    value_variance: float = 0
+
+class StockAdjustmentModel(BaseDBModel):
+    """Ledger entry for one applied adjustment batch"""
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    business_id: PyObjectId
+    mode: StockAdjustmentMode
+    reason: str
+    notes: Optional[str] = None
+    performed_by: PyObjectId
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    lines: List[StockVarianceLine]
+    lines_changed: int = 0
+    total_variance: int = 0
+    total_value_variance: float = 0
+
+class StockAdjustmentSummary(BaseDBModel):
+    """Ledger entry without its lines, for listing"""
+    id: PyObjectId = Field(alias="_id")
+    mode: StockAdjustmentMode
+    reason: str
+    notes: Optional[str] = None
+    performed_by: PyObjectId
+    timestamp: datetime
+    lines_changed: int = 0
+    total_variance: int = 0
+    total_value_variance: float = 0
+
+class StockAdjustmentPage(BaseModel):
+    items: List[StockAdjustmentSummary]
+    next_cursor: Optional[str] = None
+
+class StockMovementType(str, Enum):
+    INITIAL = "initial"
+    SALE = "sale"
+    REFUND = "refund"
+    MANUAL = "manual"
+    ADJUSTMENT = "adjustment"
+    STOCKTAKE = "stocktake"
+    IMPORT = "import"
+
+class StockMovementModel(BaseDBModel):
+    """Append-only record of one change to a product's stock"""
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    business_id: PyObjectId
+    product_id: PyObjectId
+    type: StockMovementType
+    delta: int
+    quantity_after: int
+    reference_id: Optional[PyObjectId] = None
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class StockMovementPage(BaseModel):
+    items: List[StockMovementModel]
+    next_cursor: Optional[str] = None
+
+class StockLevel(BaseModel):
+    product_id: str
+    quantity: int
+    as_of: datetime
+    source: str  # "movement", "snapshot" or "current"
@@ -0,0 +1,53 @@
+from pydantic import Field, BaseModel
+from typing import List, Optional
+from datetime import datetime
+from .base import PyObjectId, BaseDBModel
+
+class TillTotals(BaseModel):
+    """Takings for one payment method (or all methods) over a day or period"""
+    payment_method: Optional[str] = None  # None for the all-methods total
+    sales_count: int = 0
+    gross: float = 0        # sale total_amount, tax included
+    subtotal: float = 0
+    discount: float = 0
+    tax: float = 0
+    refund_count: int = 0
+    refunds: float = 0      # total_refund paid out through this method
+    refund_tax: float = 0
+    net: float = 0          # gross - refunds
+
+class TillReport(BaseModel):
+    start_date: str         # business days, YYYY-MM-DD, inclusive
+    end_date: str
+    methods: List[TillTotals]
+    totals: TillTotals
+    closed: bool = False    # day reports: a Z-report exists for the day
+    z_report_id: Optional[str] = None
+
+class ZReportModel(BaseDBModel):
+    """Snapshot of a day's takings taken when the till was closed"""
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    business_id: PyObjectId
+    date: str
+    methods: List[TillTotals]
+    totals: TillTotals
+    closed_at: datetime = Field(default_factory=datetime.utcnow)
+    closed_by: PyObjectId
+    notes: Optional[str] = None
+
+class TillCloseRequest(BaseModel):
+    date: Optional[str] = None  # defaults to today
+    notes: Optional[str] = None
+
+class TillDiscrepancy(BaseModel):
+    date: str
+    payment_method: str
+    field: str
+    stored: float
+    recomputed: float
+
+class TillRecomputeResult(BaseModel):
+    start_date: str
+    end_date: str
+    days: int
+    discrepancies: List[TillDiscrepancy]
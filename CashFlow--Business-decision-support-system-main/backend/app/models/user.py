@@ -14,6 +14,7 @@ class UserModel(BaseDBModel):
     email: str
     role: UserRole
     hashed_password: str
+    token_version: int = 0
 
     model_config = {
         "json_schema_extra": {
@@ -46,6 +47,14 @@ class PasswordChange(BaseModel):
 class PasswordReset(BaseModel):
     password: str
 
+class Principal(BaseModel):
+    """Authenticated identity taken from verified access-token claims (no database lookup)"""
+    id: PyObjectId
+    business_id: PyObjectId
+    role: UserRole
+    token_version: int = 0
+    session_id: Optional[str] = None
+
 class UserInDB(UserModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     business_id: PyObjectId
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, Query
+from app.auth import get_current_principal
+from app.models.user import Principal
+from app.models.analytics import AnalyticsInterval, AnalyticsReport
+from app.services.analytics_service import (
+    get_revenue_by_period, get_revenue_by_category, get_revenue_by_payment_method,
+    get_revenue_by_hour, get_revenue_by_customer
+)
+from app.database import get_db
+from datetime import datetime
+from typing import Optional
+
+router = APIRouter()
+
+# All reports default to the last 30 days; start is inclusive and end exclusive.
+
+@router.get("/revenue", response_model=AnalyticsReport)
+async def revenue_by_period(
+    interval: AnalyticsInterval = AnalyticsInterval.DAY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    timezone: str = Query("UTC", description="Olson timezone used to bucket days"),
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Revenue per day, week or month"""
+    return await get_revenue_by_period(str(current_user.business_id), interval, start, end, timezone, db)
+
+@router.get("/categories", response_model=AnalyticsReport)
+async def revenue_by_category(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Revenue and quantity per category"""
+    return await get_revenue_by_category(str(current_user.business_id), start, end, db)
+
+@router.get("/payment-methods", response_model=AnalyticsReport)
+async def revenue_by_payment_method(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Revenue and refunds per payment method"""
+    return await get_revenue_by_payment_method(str(current_user.business_id), start, end, db)
+
+@router.get("/hours", response_model=AnalyticsReport)
+async def revenue_by_hour(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    timezone: str = Query("UTC", description="Olson timezone used for the hour of day"),
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Revenue per hour of day"""
+    return await get_revenue_by_hour(str(current_user.business_id), start, end, timezone, db)
+
+@router.get("/customers", response_model=AnalyticsReport)
+async def revenue_by_customer(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=200),
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Top customers by revenue"""
+    return await get_revenue_by_customer(str(current_user.business_id), start, end, limit, db)
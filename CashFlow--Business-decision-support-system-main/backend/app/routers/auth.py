@@ -1,15 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app.models.business import BusinessCreate
-from app.models.user import UserCreate, UserRole
+from app.models.user import UserCreate, UserRole, UserInDB, Principal
+from app.models.session import SessionInfo, RefreshRequest
 from app.services.business_service import create_business
-from app.services.user_service import create_user, authenticate_user
+from app.services.user_service import create_user, authenticate_user, get_user_cached
+from app.services.session_service import (
+    create_session, rotate_session, list_sessions, revoke_session,
+    revoke_refresh_token, revoke_all_sessions
+)
 from app.auth.jwt_handler import create_access_token
-from app.auth import get_current_user, get_current_admin_user
+from app.auth import get_current_user, get_current_admin_user, get_current_principal
 from app.database import get_db  # Import the database dependency
+from typing import List
 
 router = APIRouter()
 
+def _issue_access_token(user: UserInDB, session_id) -> str:
+    return create_access_token(data={
+        "sub": str(user.id),
+        "business": str(user.business_id),
+        "role": user.role,
+        "ver": user.token_version,
+        "sid": str(session_id)
+    })
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def register_business(
     business: BusinessCreate,
@@ -42,6 +64,7 @@ async def register_business(
 
 @router.post("/login")
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db = Depends(get_db)  # Add db dependency
 ):
@@ -53,11 +76,93 @@ async def login(
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        access_token = create_access_token(data={"sub": str(user.id), "business": str(user.business_id), "role": user.role})
-        return {"access_token": access_token, "token_type": "bearer"}
+        refresh_token, session = await create_session(
+            user,
+            user_agent=request.headers.get("user-agent"),
+            ip_address=request.client.host if request.client else None,
+            db=db
+        )
+        return {
+            "access_token": _issue_access_token(user, session.id),
+            "refresh_token": refresh_token,
+            "token_type": "bearer"
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Login error: {e}")  # Debug print
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred during login: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/refresh")
+async def refresh_access_token(
+    body: RefreshRequest,
+    db = Depends(get_db)
+):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    No password check is made; the old refresh token stops working.
+    """
+    rotated = await rotate_session(body.refresh_token, db)
+    if rotated is None:
+        raise _invalid_refresh_token()
+    refresh_token, session = rotated
+    
+    # Re-read the user so role changes and revocations since login apply
+    user = await get_user_cached(str(session.business_id), str(session.user_id), db, fresh=True)
+    if not user or user.token_version != session.token_version:
+        await revoke_session(str(session.business_id), str(session.user_id), str(session.id), db)
+        raise _invalid_refresh_token()
+    
+    return {
+        "access_token": _issue_access_token(user, session.id),
+        "refresh_token": refresh_token,
+        "token_type": "bearer"
+    }
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    body: RefreshRequest,
+    db = Depends(get_db)
+):
+    """End the session a refresh token belongs to"""
+    await revoke_refresh_token(body.refresh_token, db)
+
+@router.get("/sessions", response_model=List[SessionInfo])
+async def read_sessions(
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """List the current user's active sessions"""
+    return await list_sessions(
+        str(current_user.business_id),
+        str(current_user.id),
+        current_user.session_id,
+        db
+    )
+
+@router.delete("/sessions", status_code=status.HTTP_200_OK)
+async def delete_other_sessions(
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Sign out every session of the current user except this one"""
+    revoked = await revoke_all_sessions(
+        str(current_user.business_id),
+        str(current_user.id),
+        except_session_id=current_user.session_id,
+        db=db
+    )
+    return {"revoked": revoked}
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(
+    session_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Sign out one of the current user's sessions"""
+    if not await revoke_session(str(current_user.business_id), str(current_user.id), session_id, db):
+        raise HTTPException(status_code=404, detail="Session not found")
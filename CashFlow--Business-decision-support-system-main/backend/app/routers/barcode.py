@@ -1,10 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import (
+    APIRouter, Depends, HTTPException, Body, File, Query, Request,
+    UploadFile, WebSocket, WebSocketDisconnect, status
+)
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
+import asyncio
+import logging
 
-from app.services.barcode_service import barcode_service
+from app.services.barcode_service import barcode_service, BarcodeScanSession
 from app.services import inventory_service
-from app.auth.deps import get_current_user
+from app.auth.deps import get_current_principal, principal_from_token
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Largest encoded image accepted by the binary upload endpoints
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# Most frames accepted by one multi-frame request
+MAX_CAPTURE_FRAMES = 5
 
 router = APIRouter(
     prefix="/barcode",
@@ -16,81 +30,176 @@ class BarcodeBase64Request(BaseModel):
     image: str
 
 class BarcodeFrameRequest(BaseModel):
-    frames: List[str] = Field(..., min_items=1, max_items=5)
+    frames: List[str] = Field(..., min_items=1, max_items=MAX_CAPTURE_FRAMES)
+
+def _scan_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Shape single-image scan results the same way for every upload format"""
+    if not results:
+        return {
+            "success": False,
+            "message": "No barcodes detected",
+            "barcodes": []
+        }
+    
+    return {
+        "success": True,
+        "message": f"Detected {len(results)} barcode(s)",
+        "barcodes": results
+    }
+
+async def _read_upload(upload: UploadFile) -> bytes:
+    """Read a multipart image part, rejecting non-images and oversized files"""
+    if upload.content_type and not upload.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type: {upload.content_type}"
+        )
+    
+    data = await upload.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Image too large"
+        )
+    return data
 
 @router.post("/scan", response_description="Process single barcode image")
 async def scan_barcode(
     data: BarcodeBase64Request = Body(...),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
 ):
     """
     Process a single barcode image and return detected barcode(s).
     """
     try:
-        # Process the image
-        results = barcode_service.decode_image(data.image)
-        
-        if not results:
-            return {
-                "success": False,
-                "message": "No barcodes detected",
-                "barcodes": []
-            }
-        
-        return {
-            "success": True,
-            "message": f"Detected {len(results)} barcode(s)",
-            "barcodes": results
-        }
+        # Process the image off the event loop
+        results = await run_in_threadpool(barcode_service.decode_image, data.image)
+        return _scan_response(results)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing barcode: {str(e)}")
 
+@router.post("/scan-upload", response_description="Process a single barcode image uploaded as multipart/form-data")
+async def scan_barcode_upload(
+    file: UploadFile = File(...),
+    current_user = Depends(get_current_principal)
+):
+    """
+    Process a single binary image upload and return detected barcode(s).
+    Avoids the base64 overhead of /scan.
+    """
+    data = await _read_upload(file)
+    
+    try:
+        results = await run_in_threadpool(barcode_service.decode_bytes, memoryview(data))
+        return _scan_response(results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing barcode: {str(e)}")
+
+@router.post("/scan-raw", response_description="Process a single barcode image sent as a raw image/* body")
+async def scan_barcode_raw(
+    request: Request,
+    current_user = Depends(get_current_principal)
+):
+    """
+    Process an image sent as the raw request body (Content-Type: image/jpeg, image/png, ...).
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Request body must be an image/* content type"
+        )
+    
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Image too large"
+        )
+    
+    body = await request.body()
+    if len(body) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Image too large"
+        )
+    
+    try:
+        results = await run_in_threadpool(barcode_service.decode_bytes, memoryview(body))
+        return _scan_response(results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing barcode: {str(e)}")
+
 @router.post("/scan-capture", response_description="Process multiple frames for barcode detection")
 async def scan_captured_frames(
     data: List[BarcodeBase64Request] = Body(...),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
 ):
     """
     Process multiple captured frames for product management.
     Takes multiple frames and processes them to find the most reliable barcode.
     """
     try:
-        all_results = []
-        barcode_counts = {}
-        
-        # Process each frame
-        for frame_data in data:
-            results = barcode_service.decode_image(frame_data.image)
-            all_results.extend(results)
-            
-            # Count occurrences of each barcode
-            for result in results:
-                barcode = result['data']
-                barcode_counts[barcode] = barcode_counts.get(barcode, 0) + 1
+        # Decode frames concurrently and stop once enough frames agree
+        detection_result = await run_in_threadpool(
+            barcode_service.process_multi_frame_detection,
+            [frame_data.image for frame_data in data]
+        )
         
-        if not all_results:
+        if not detection_result['success']:
             return {
                 "success": False,
-                "message": "No barcodes detected in any frames",
+                "message": detection_result['message'],
                 "barcode": None,
-                "confidence": 0
+                "confidence": 0,
+                "agreement": 0,
+                "frames": detection_result['frames']
             }
         
-        # Find the most frequent barcode
-        most_common_barcode = max(barcode_counts.items(), key=lambda x: x[1])
-        barcode_value = most_common_barcode[0]
-        occurrence_count = most_common_barcode[1]
+        return {
+            "success": True,
+            "message": detection_result['message'],
+            "barcode": detection_result['detection'],
+            "confidence": detection_result['confidence'],
+            "agreement": detection_result['agreement'],
+            "frames": detection_result['frames']
+        }
         
-        # Get the complete data for the most common barcode
-        detected_barcodes = [r for r in all_results if r['data'] == barcode_value]
-        best_detection = detected_barcodes[0] if detected_barcodes else None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing frames: {str(e)}")
+
+@router.post("/scan-capture-upload", response_description="Process multiple uploaded frames for barcode detection")
+async def scan_captured_frames_upload(
+    files: List[UploadFile] = File(...),
+    current_user = Depends(get_current_principal)
+):
+    """
+    Multipart variant of /scan-capture: each part is one binary frame
+    (at most MAX_CAPTURE_FRAMES).
+    """
+    # Checked before any part is read into memory
+    if len(files) > MAX_CAPTURE_FRAMES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_CAPTURE_FRAMES} frames per request"
+        )
+    
+    frames = [memoryview(await _read_upload(upload)) for upload in files]
+    
+    try:
+        detection_result = await run_in_threadpool(
+            barcode_service.process_multi_frame_detection,
+            frames
+        )
         
         return {
-            "success": True,
-            "message": f"Detected barcode in {occurrence_count} frame(s)",
-            "barcode": best_detection,
-            "confidence": occurrence_count / len(data)
+            "success": detection_result['success'],
+            "message": detection_result['message'],
+            "barcode": detection_result['detection'],
+            "confidence": detection_result['confidence'],
+            "agreement": detection_result['agreement'],
+            "frames": detection_result['frames']
         }
         
     except Exception as e:
@@ -99,7 +208,7 @@ async def scan_captured_frames(
 @router.post("/verify", response_description="Verify barcode through multiple frame processing")
 async def verify_barcode(
     request: BarcodeFrameRequest,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
 ):
     """
     Verify barcode by processing multiple frames
@@ -109,7 +218,10 @@ async def verify_barcode(
     """
     try:
         # Process frames for barcode detection
-        detection_result = barcode_service.process_multi_frame_detection(request.frames)
+        detection_result = await run_in_threadpool(
+            barcode_service.process_multi_frame_detection,
+            request.frames
+        )
         
         # Check if barcode detection was successful
         if not detection_result['success']:
@@ -133,7 +245,7 @@ async def verify_barcode(
             }
         
         # Check if barcode exists in inventory
-        business_id = current_user["business_id"]
+        business_id = str(current_user.business_id)
         existing_product = await inventory_service.get_inventory_item_by_barcode(business_id, barcode)
         
         return {
@@ -141,11 +253,160 @@ async def verify_barcode(
             'barcode': barcode,
             'exists': bool(existing_product),
             'product': existing_product,
-            'confidence': detection_result.get('confidence', 0)
+            'confidence': detection_result.get('confidence', 0),
+            'frames': detection_result.get('frames', [])
         }
     
     except Exception as e:
         raise HTTPException(
             status_code=500, 
             detail=f"Barcode verification error: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# Seconds a stream connection has to send its authentication message
+STREAM_AUTH_TIMEOUT = 10
+# Queued after a reset request so an idle frame processor wakes up to apply it
+_RESET = object()
+
+async def _authenticate_stream(websocket: WebSocket):
+    """
+    Read the {"type": "auth", "token": ...} message that must open a stream,
+    so the access token never appears in the URL (and access logs)
+    """
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), STREAM_AUTH_TIMEOUT)
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            return None
+        return principal_from_token(str(message.get("token") or ""))
+    except (asyncio.TimeoutError, HTTPException, ValueError, KeyError, WebSocketDisconnect):
+        return None
+
+@router.websocket("/stream")
+async def stream_frames(
+    websocket: WebSocket,
+    min_agreement: Optional[int] = Query(None, ge=1, le=10),
+    db = Depends(get_db)
+):
+    """
+    Continuous scanning session over a WebSocket.
+    
+    The first message must be {"type": "auth", "token": "<access token>"};
+    the user is authenticated once for the whole session and a "ready"
+    message is sent back. Then send each frame as a binary message (encoded
+    JPEG/PNG). The session tracks the barcode's position so later frames
+    only decode the tracked region, and frames that arrive while one is
+    being decoded are dropped in favour of the newest. Each decoded frame is
+    answered with a "frame" message; once min_agreement frames agree a
+    "result" message with the inventory match is pushed. Text commands:
+    "reset", "close".
+    """
+    await websocket.accept()
+    current_user = await _authenticate_stream(websocket)
+    if current_user is None:
+        try:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        except RuntimeError:
+            # Client already disconnected
+            pass
+        return
+    
+    await websocket.send_json({"type": "ready"})
+    business_id = str(current_user.business_id)
+    session = BarcodeScanSession(barcode_service, min_agreement)
+    logger.info(f"Barcode stream opened for user {current_user.id}")
+    
+    # Holds only the newest undecoded frame; older ones are dropped
+    latest_frame: asyncio.Queue = asyncio.Queue(maxsize=1)
+    dropped = 0
+    # Session state is only touched by the processor, between frames
+    reset_requested = False
+    
+    async def receive_frames():
+        nonlocal dropped, reset_requested
+        while True:
+            message = await websocket.receive()
+            
+            if message.get("type") == "websocket.disconnect":
+                break
+            
+            text = message.get("text")
+            if text is not None:
+                command = text.strip().lower()
+                if command == "close":
+                    break
+                if command == "reset":
+                    reset_requested = True
+                    if latest_frame.empty():
+                        latest_frame.put_nowait(_RESET)
+                    continue
+                await websocket.send_json({"type": "error", "message": "Send frames as binary messages"})
+                continue
+            
+            data = message.get("bytes")
+            if not data:
+                continue
+            if len(data) > MAX_UPLOAD_BYTES:
+                await websocket.send_json({"type": "error", "message": "Image too large"})
+                continue
+            
+            if latest_frame.full():
+                if latest_frame.get_nowait() is not _RESET:
+                    dropped += 1
+            latest_frame.put_nowait(data)
+        
+        await latest_frame.put(None)
+    
+    async def process_frames():
+        nonlocal reset_requested
+        while True:
+            data = await latest_frame.get()
+            if data is None:
+                break
+            
+            if reset_requested:
+                reset_requested = False
+                session.reset()
+                await websocket.send_json({"type": "reset"})
+            if data is _RESET:
+                continue
+            
+            img = await run_in_threadpool(barcode_service.load_image_bytes, memoryview(data))
+            if img is None:
+                await websocket.send_json({"type": "error", "message": "Could not decode image"})
+                continue
+            
+            frame_result = await run_in_threadpool(session.process_frame, img)
+            consensus = frame_result.pop("consensus")
+            await websocket.send_json({"type": "frame", **frame_result, "dropped": dropped})
+            
+            if consensus:
+                barcode = consensus["barcode"]
+                product = await inventory_service.get_inventory_item_by_barcode(business_id, barcode, db)
+                await websocket.send_json({
+                    "type": "result",
+                    "success": True,
+                    "barcode": barcode,
+                    "detection": consensus["detection"],
+                    "valid": barcode_service.verify_product_barcode(barcode),
+                    "confidence": consensus["votes"] / max(consensus["frames"], 1),
+                    "exists": bool(product),
+                    "product": product.model_dump(mode="json") if product else None
+                })
+    
+    receiver = asyncio.create_task(receive_frames())
+    processor = asyncio.create_task(process_frames())
+    
+    try:
+        done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        for task in (receiver, processor):
+            task.cancel()
+        logger.info(
+            f"Barcode stream closed for user {current_user.id}: "
+            f"{session.frames_seen} frame(s) decoded, {dropped} dropped"
+        )
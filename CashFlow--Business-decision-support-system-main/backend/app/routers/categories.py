@@ -6,8 +6,8 @@ from app.services.category_service import (
     create_category,
     update_category
 )
-from app.auth import get_current_user, get_current_admin_user
-from app.models.user import UserInDB
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
 from typing import List
 import logging
 from app.database import get_db  # Import the database dependency
@@ -25,7 +25,7 @@ router = APIRouter()
     response_description="List all categories"
 )
 async def list_categories(
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Get all categories for the current business"""
@@ -42,7 +42,7 @@ async def list_categories(
 )
 async def create_new_category(
     category: CategoryCreate,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Create a new category (admin only)"""
@@ -56,7 +56,7 @@ async def create_new_category(
 )
 async def get_single_category(
     category_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Get a specific category by ID"""
@@ -71,7 +71,7 @@ async def get_single_category(
 async def update_existing_category(
     category_id: str,
     category: CategoryUpdate,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Update an existing category (admin only)"""
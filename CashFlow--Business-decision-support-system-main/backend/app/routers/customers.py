@@ -1,32 +1,41 @@
 # app/routers/customers.py
 import re
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
 from app.models import settings
 from app.models.base import PyObjectId
-from app.models.customer import CustomerCreate, CustomerUpdate, CustomerModel
-from app.services.customer_service import get_customers, get_customer, create_customer, update_customer, delete_customer, search_customers
-from app.auth import get_current_user, get_current_admin_user
-from app.models.user import UserInDB
-from typing import List
+from app.models.customer import CustomerCreate, CustomerUpdate, CustomerModel, CustomerPage, CustomerStats
+from app.models.imports import ImportResult
+from app.services.customer_service import (
+    get_customers, get_customers_page, get_customer, create_customer, update_customer,
+    delete_customer, search_customers, import_customers,
+    get_customer_stats, rebuild_customer_stats
+)
+from app.utils.import_parser import ImportFormatError, detect_import_format, iter_import_rows
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
+from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.database import get_db  # Import the database dependency
 
 # Remove the prefix - it's already added in main.py
 router = APIRouter()
 
+MAX_IMPORT_BYTES = 20 * 1024 * 1024
+
 # Search endpoint (must come before {customer_id} routes)
 @router.get("/search")
 async def search_customers_endpoint(
     query: str,
-    current_user: UserInDB = Depends(get_current_user),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """
-    Search customers by name, email, or phone number.
+    Search customers by name, email, or phone number (prefix match, ranked).
     Uses the database dependency for MongoDB connection.
     """
     try:
-        return await search_customers(str(current_user.business_id), query, db)
+        return await search_customers(str(current_user.business_id), query, db, limit)
     except Exception as e:
         print(f"Search error: {str(e)}")  # Debug log
         raise HTTPException(
@@ -34,9 +43,53 @@ async def search_customers_endpoint(
             detail=f"Error searching customers: {str(e)}"
         )
 
+@router.get("/page", response_model=CustomerPage)
+async def read_customers_page(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """List customers a page at a time; pass next_cursor back to continue"""
+    return await get_customers_page(str(current_user.business_id), limit, cursor, db)
+
+@router.post("/import", response_model=ImportResult)
+async def import_customers_endpoint(
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """
+    Bulk-create customers from a CSV (with a header row) or NDJSON file.
+    Columns: name, email, phone, address, discount_eligibility.
+    """
+    content = await file.read(MAX_IMPORT_BYTES + 1)
+    if len(content) > MAX_IMPORT_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Import file too large"
+        )
+    
+    try:
+        fmt = detect_import_format(file.filename, file.content_type)
+        rows = list(iter_import_rows(content, fmt))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return await import_customers(str(current_user.business_id), rows, db)
+
+@router.post("/stats/rebuild")
+async def rebuild_customer_stats_endpoint(
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """Recompute all customers' purchase aggregates from sales, refunds and orders"""
+    updated = await rebuild_customer_stats(str(current_user.business_id), db)
+    return {"customers_updated": updated}
+
 @router.get("", response_model=List[CustomerModel])
 async def read_customers(
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await get_customers(str(current_user.business_id), db)
@@ -44,7 +97,7 @@ async def read_customers(
 @router.post("", response_model=CustomerModel)
 async def create_new_customer(
     customer: CustomerCreate,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await create_customer(str(current_user.business_id), customer, db)
@@ -52,7 +105,7 @@ async def create_new_customer(
 @router.get("/{customer_id}", response_model=CustomerModel)
 async def read_customer(
     customer_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     customer = await get_customer(str(current_user.business_id), customer_id, db)
@@ -60,11 +113,23 @@ async def read_customer(
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
 
+@router.get("/{customer_id}/stats", response_model=CustomerStats)
+async def read_customer_stats(
+    customer_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Lifetime value, purchase counts, top categories and recent purchases"""
+    stats = await get_customer_stats(str(current_user.business_id), customer_id, db)
+    if not stats:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return stats
+
 @router.put("/{customer_id}", response_model=CustomerModel)
 async def update_existing_customer(
     customer_id: str,
     customer: CustomerUpdate,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     updated_customer = await update_customer(str(current_user.business_id), customer_id, customer, db)
@@ -75,7 +140,7 @@ async def update_existing_customer(
 @router.delete("/{customer_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_existing_customer(
     customer_id: str,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     if not await delete_customer(str(current_user.business_id), customer_id, db):
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from app.auth import get_current_admin_principal
+from app.models.user import Principal
+from app.services.export_service import EXPORT_COLUMNS, iter_export_rows
+from app.utils.export_writer import EXPORT_MEDIA_TYPES, ExportFormatError, check_export_format, encode_rows
+from app.database import get_db
+from datetime import datetime
+from typing import Optional
+
+router = APIRouter()
+
+@router.get("/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """
+    Stream an export of sales, sale_items, refunds or refund_items.
+    
+    - format: csv, ndjson or parquet
+    - start / end: optional date range (start inclusive, end exclusive)
+    """
+    if dataset not in EXPORT_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown export dataset: {dataset}"
+        )
+    try:
+        check_export_format(format)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    rows = iter_export_rows(str(current_user.business_id), dataset, start, end, db)
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    return StreamingResponse(
+        encode_rows(rows, format, EXPORT_COLUMNS[dataset]),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}_{stamp}.{format}"'}
+    )
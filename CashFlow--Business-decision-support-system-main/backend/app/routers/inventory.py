@@ -1,23 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
 from app.models.inventory import InventoryItemCreate, InventoryItemUpdate, InventoryItemModel
+from app.models.alert import StockAlertPage
+from app.models.stock import StockAdjustmentRequest, StockAdjustmentModel, StockAdjustmentPage, StockMovementPage, StockLevel
 from app.services.inventory_service import (
     get_inventory_items,
     get_inventory_item,
     get_inventory_item_by_barcode,
     create_inventory_item,
     update_inventory_item,
-    delete_inventory_item
+    delete_inventory_item,
+    import_inventory_items
 )
-from app.auth import get_current_user, get_current_admin_user
-from app.models.user import UserInDB
-from typing import List, Optional
+from app.services.stock_service import (
+    apply_stock_adjustments, get_stock_adjustments, get_stock_adjustment,
+    get_stock_movements, get_stock_at, get_stock_levels_at
+)
+from app.services.alert_service import get_stock_alerts, reevaluate_low_stock
+from app.utils.import_parser import ImportFormatError, detect_import_format, iter_import_rows
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
+from typing import Dict, List, Optional
+from datetime import datetime
 from app.database import get_db  # Import the database dependency
+import json
 
 router = APIRouter()
 
+MAX_IMPORT_BYTES = 50 * 1024 * 1024
+
 @router.get("", response_model=List[InventoryItemModel])
 async def read_inventory(
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await get_inventory_items(str(current_user.business_id), db)
@@ -25,7 +39,7 @@ async def read_inventory(
 @router.post("", response_model=InventoryItemModel, status_code=status.HTTP_201_CREATED)
 async def create_item(
     item: InventoryItemCreate,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     try:
@@ -39,11 +53,106 @@ async def create_item(
             detail=str(e)
         )
 
+@router.post("/import")
+async def import_items(
+    file: UploadFile = File(...),
+    upsert: bool = Query(False, description="Update items that already exist (matched by SKU, barcode, then name)"),
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """
+    Bulk-create or upsert inventory items from a CSV (with a header row) or NDJSON file.
+    Columns: name, category (name or id), price, quantity, description, sku, barcode.
+    Streams back one NDJSON result per row, then a summary line.
+    """
+    content = await file.read(MAX_IMPORT_BYTES + 1)
+    if len(content) > MAX_IMPORT_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Import file too large"
+        )
+    
+    try:
+        fmt = detect_import_format(file.filename, file.content_type)
+        rows = list(iter_import_rows(content, fmt))
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    async def report():
+        async for result in import_inventory_items(str(current_user.business_id), rows, upsert, db):
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
+@router.post("/stock/adjustments", response_model=StockAdjustmentModel, status_code=status.HTTP_201_CREATED)
+async def adjust_stock(
+    request: StockAdjustmentRequest,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """
+    Apply stock deltas (mode=delta) or stocktake counts (mode=count) in one batch.
+    All lines are applied or none are; the response is the variance report.
+    """
+    return await apply_stock_adjustments(
+        str(current_user.business_id), request, str(current_user.id), db
+    )
+
+@router.get("/stock/adjustments", response_model=StockAdjustmentPage)
+async def read_stock_adjustments(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """List past stock adjustments, newest first"""
+    return await get_stock_adjustments(str(current_user.business_id), limit, cursor, db)
+
+@router.get("/stock/adjustments/{adjustment_id}", response_model=StockAdjustmentModel)
+async def read_stock_adjustment(
+    adjustment_id: str,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    adjustment = await get_stock_adjustment(str(current_user.business_id), adjustment_id, db)
+    if not adjustment:
+        raise HTTPException(status_code=404, detail="Stock adjustment not found")
+    return adjustment
+
+@router.get("/stock/levels", response_model=Dict[str, int])
+async def read_stock_levels_at(
+    at: datetime,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Every product's stock level (by product id) at a point in time"""
+    return await get_stock_levels_at(str(current_user.business_id), at, db)
+
+@router.get("/alerts", response_model=StockAlertPage)
+async def read_stock_alerts(
+    active: bool = True,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Low-stock alerts, lowest quantity first (active=false lists resolved ones)"""
+    return await get_stock_alerts(str(current_user.business_id), active, limit, cursor, db)
+
+@router.post("/alerts/reevaluate")
+async def reevaluate_stock_alerts(
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """Re-check every product against the low-stock threshold"""
+    written = await reevaluate_low_stock(db, str(current_user.business_id))
+    return {"alerts_updated": written}
+
 # NOTE: barcode endpoint must come BEFORE the {item_id} endpoint to avoid routing conflicts
 @router.get("/barcode/{barcode}", response_model=Optional[InventoryItemModel])
 async def read_item_by_barcode(
     barcode: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Lookup an inventory item by its barcode"""
@@ -55,7 +164,7 @@ async def read_item_by_barcode(
 @router.get("/{item_id}", response_model=InventoryItemModel)
 async def read_item(
     item_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     item = await get_inventory_item(str(current_user.business_id), item_id, db)
@@ -63,11 +172,35 @@ async def read_item(
         raise HTTPException(status_code=404, detail="Item not found")
     return item
 
+@router.get("/{item_id}/movements", response_model=StockMovementPage)
+async def read_item_movements(
+    item_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Stock ledger for one product, newest first"""
+    return await get_stock_movements(str(current_user.business_id), item_id, limit, cursor, db)
+
+@router.get("/{item_id}/stock-at", response_model=StockLevel)
+async def read_item_stock_at(
+    item_id: str,
+    at: datetime,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Stock level of one product at a point in time"""
+    level = await get_stock_at(str(current_user.business_id), item_id, at, db)
+    if not level:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return level
+
 @router.put("/{item_id}", response_model=InventoryItemModel)
 async def update_item(
     item_id: str,
     item: InventoryItemUpdate,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     updated_item = await update_inventory_item(str(current_user.business_id), item_id, item, db)
@@ -78,7 +211,7 @@ async def update_item(
 @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item(
     item_id: str,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     if not await delete_inventory_item(str(current_user.business_id), item_id, db):
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.models.order import OrderCreate, OrderModel, OrderStatus
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from app.models.order import OrderCreate, OrderModel, OrderStatus, OrderSort, OrderPage
+from app.models.sale import PaymentMethod
 from app.services.order_service import (
-    create_order, get_order, get_orders,
-    update_order, complete_order, cancel_order
+    create_order, get_order, get_orders, get_orders_page, iter_orders_export,
+    update_order, complete_order, cancel_order, ORDER_EXPORT_COLUMNS
 )
-from app.auth import get_current_user, get_current_admin_user
-from app.models.user import UserInDB
+from app.utils.export_writer import EXPORT_MEDIA_TYPES, ExportFormatError, check_export_format, encode_rows
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
 from typing import List, Optional
+from datetime import datetime
 from app.database import get_db  # Import the database dependency
 
 router = APIRouter()
@@ -14,7 +18,7 @@ router = APIRouter()
 @router.post("", response_model=OrderModel, status_code=status.HTTP_201_CREATED)
 async def create_new_order(
     order: OrderCreate,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await create_order(str(current_user.business_id), order, db)
@@ -22,15 +26,67 @@ async def create_new_order(
 @router.get("", response_model=List[OrderModel])
 async def read_orders(
     status: Optional[OrderStatus] = None,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await get_orders(str(current_user.business_id), status, db)
 
+# Listing routes (must come before {order_id} routes)
+@router.get("/page", response_model=OrderPage)
+async def read_orders_page(
+    status: Optional[OrderStatus] = None,
+    customer_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    delivery_from: Optional[datetime] = None,
+    delivery_to: Optional[datetime] = None,
+    sort: OrderSort = OrderSort.CREATED_AT,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """List orders a page at a time with filters; pass next_cursor back to continue"""
+    return await get_orders_page(
+        str(current_user.business_id), status, customer_id,
+        created_from, created_to, delivery_from, delivery_to,
+        sort, limit, cursor, db
+    )
+
+@router.get("/export")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$"),
+    status: Optional[OrderStatus] = None,
+    customer_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    delivery_from: Optional[datetime] = None,
+    delivery_to: Optional[datetime] = None,
+    sort: OrderSort = OrderSort.CREATED_AT,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """Stream every matching order as CSV, NDJSON or Parquet (admin only)"""
+    try:
+        check_export_format(format)
+    except ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = iter_orders_export(
+        str(current_user.business_id), status, customer_id,
+        created_from, created_to, delivery_from, delivery_to,
+        sort, db
+    )
+    return StreamingResponse(
+        encode_rows(rows, format, ORDER_EXPORT_COLUMNS),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'}
+    )
+
 @router.get("/{order_id}", response_model=OrderModel)
 async def read_order(
     order_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     order = await get_order(str(current_user.business_id), order_id, db)
@@ -42,7 +98,7 @@ async def read_order(
 async def update_existing_order(
     order_id: str,
     order: OrderCreate,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     updated_order = await update_order(str(current_user.business_id), order_id, order, db)
@@ -53,15 +109,16 @@ async def update_existing_order(
 @router.post("/{order_id}/complete", response_model=OrderModel)
 async def complete_existing_order(
     order_id: str,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    payment_method: PaymentMethod = PaymentMethod.CASH,
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
-    return await complete_order(str(current_user.business_id), order_id, db)
+    return await complete_order(str(current_user.business_id), order_id, db, payment_method)
 
 @router.post("/{order_id}/cancel", response_model=OrderModel)
 async def cancel_existing_order(
     order_id: str,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await cancel_order(str(current_user.business_id), order_id, db)
\ No newline at end of file
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body, status
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-from app.auth import get_current_user, get_current_admin_user
-from app.models.user import UserInDB
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
 from app.database import get_db
 from app.services.prediction_service import (
     make_prediction,
@@ -12,6 +12,9 @@ from app.services.prediction_service import (
     prepare_features
 )
 from app.services.model_training_service import train_models_for_business
+from app.services.analytics_service import get_sales_history_summary
+from app.services.reorder_service import refresh_reorder_recommendations, get_reorder_recommendations
+from app.models.reorder import ReorderPage, ReorderUrgency
 from datetime import datetime, timedelta
 import os
 import json
@@ -62,7 +65,7 @@ class TrainModelResponse(BaseModel):
 @router.post("/train", response_model=TrainModelResponse)
 async def train_model(
     request: TrainModelRequest = Body(...),
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)
 ):
     """
@@ -80,7 +83,7 @@ async def train_model(
 @router.post("/predict", response_model=PredictionResponse)
 async def predict_product(
     request: PredictionRequest,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)
 ):
     """
@@ -103,7 +106,7 @@ async def predict_product(
 
 @router.get("/model-status")
 async def get_models_status(
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)
 ):
     """
@@ -115,7 +118,7 @@ async def get_models_status(
 @router.get("/feature-importance")
 async def get_features_importance(
     horizon: str = Query("daily", regex="^(daily|weekly|monthly)$"),
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)
 ):
     """
@@ -138,7 +141,7 @@ async def get_top_selling_products(
     limit: int = Query(10, ge=1, le=100),
     refresh: bool = Query(False),  # New parameter to force refresh
     category: Optional[str] = None,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)
 ):
     """
@@ -284,13 +287,45 @@ async def get_top_selling_products(
         print(traceback.format_exc())
         return {"success": False, "error": str(e)}
     
+@router.get("/reorder", response_model=ReorderPage)
+async def get_reorder_suggestions(
+    urgency: Optional[ReorderUrgency] = None,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """
+    Get reorder recommendations (days of cover and suggested quantities), most urgent first
+    
+    - urgency: optional filter (critical, reorder, ok)
+    - cursor: next_cursor from the previous page
+    """
+    return await get_reorder_recommendations(
+        str(current_user.business_id), urgency=urgency, limit=limit, cursor=cursor, db=db
+    )
+
+@router.post("/reorder/refresh")
+async def refresh_reorder_suggestions(
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """
+    Recompute reorder recommendations from the latest forecasts and stock levels
+    """
+    return await refresh_reorder_recommendations(str(current_user.business_id), db)
+    
 @router.get("/diagnostics")
 async def get_prediction_diagnostics(
-    current_user: UserInDB = Depends(get_current_user),
+    refresh: bool = Query(False),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)
 ):
     """
     Get diagnostics information about the prediction system
+    
+    Sales statistics come from one aggregation and are cached per business
+    for a few minutes; pass refresh=true to recompute them.
     """
     business_id = str(current_user.business_id)
     
@@ -298,42 +333,12 @@ async def get_prediction_diagnostics(
         # Get model status
         model_status = await get_model_status(business_id, db)
         
-        # Get feature importance for the daily model
-        feature_importance = await get_feature_importance(business_id, "daily", db)
+        # Sales history statistics
+        history = await get_sales_history_summary(business_id, db, refresh)
+        days_of_history = history["days_of_history"]
         
-        # Get sales data to determine history length
-        from app.services.sale_service import get_sales
-        all_sales = await get_sales(business_id, db)
-        
-        # Calculate statistics from sales data
-        sales_count = len(all_sales)
-        
-        # Extract unique products and categories
-        unique_products = set()
-        unique_categories = set()
-        total_items = 0
-        dates = []
-        
-        for sale in all_sales:
-            sale_dict = sale.model_dump()
-            dates.append(sale_dict.get("timestamp", ""))
-            
-            for item in sale_dict.get("items", []):
-                unique_products.add(str(item.get("product_id", "")))
-                unique_categories.add(item.get("category_name", "Uncategorized"))
-                total_items += item.get("quantity", 0)
-        
-        # Calculate date range
-        date_objects = [datetime.fromisoformat(d.replace('Z', '+00:00')) if isinstance(d, str) else d for d in dates if d]
-        
-        earliest_date = min(date_objects).isoformat() if date_objects else datetime.now().isoformat()
-        latest_date = max(date_objects).isoformat() if date_objects else datetime.now().isoformat()
-        
-        # Calculate days of history
-        if date_objects:
-            days_of_history = (max(date_objects) - min(date_objects)).days + 1
-        else:
-            days_of_history = 0
+        earliest_date = history["earliest"].isoformat() if history["earliest"] else datetime.now().isoformat()
+        latest_date = history["latest"].isoformat() if history["latest"] else datetime.now().isoformat()
         
         # Determine prediction tier based on data quantity
         if days_of_history < 7:
@@ -346,13 +351,13 @@ async def get_prediction_diagnostics(
         return {
             "status": "success" if model_status.get("all_models_available", False) else "warning",
             "business_id": business_id,
-            "sales_records": sales_count,
+            "sales_records": history["sales_records"],
             "days_of_history": days_of_history,
             "earliest_date": earliest_date,
             "latest_date": latest_date,
-            "unique_products": len(unique_products),
-            "unique_categories": len(unique_categories),
-            "total_items_sold": total_items,
+            "unique_products": history["unique_products"],
+            "unique_categories": history["unique_categories"],
+            "total_items_sold": history["total_items_sold"],
             "model_directory": "models",
             "prediction_tier": prediction_tier,
             "message": "Models are ready" if model_status.get("all_models_available", False) else "Models need training"
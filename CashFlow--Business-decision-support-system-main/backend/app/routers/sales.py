@@ -4,8 +4,8 @@ from app.services.sale_service import (
     create_sale, get_sale, get_sales,
     create_refund, get_refunds
 )
-from app.auth import get_current_user, get_current_admin_user
-from app.models.user import UserInDB
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
 from typing import List
 from app.database import get_db  # Import the database dependency
 
@@ -13,7 +13,7 @@ router = APIRouter()
 
 @router.get("", response_model=List[SaleModel])
 async def read_sales(
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await get_sales(str(current_user.business_id), db)
@@ -21,7 +21,7 @@ async def read_sales(
 @router.post("", response_model=SaleModel, status_code=status.HTTP_201_CREATED)
 async def create_new_sale(
     sale: SaleCreate,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await create_sale(str(current_user.business_id), sale, db)
@@ -29,7 +29,7 @@ async def create_new_sale(
 @router.get("/{sale_id}", response_model=SaleModel)
 async def read_sale(
     sale_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     sale = await get_sale(str(current_user.business_id), sale_id, db)
@@ -41,7 +41,7 @@ async def read_sale(
 async def refund_sale(
     sale_id: str,
     refund: RefundCreate,
-    current_user: UserInDB = Depends(get_current_admin_user),
+    current_user: Principal = Depends(get_current_admin_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await create_refund(
@@ -55,7 +55,7 @@ async def refund_sale(
 @router.get("/{sale_id}/refunds", response_model=List[RefundModel])
 async def get_sale_refunds(
     sale_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     return await get_refunds(
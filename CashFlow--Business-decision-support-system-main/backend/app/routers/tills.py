@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, Query
+from app.auth import get_current_principal, get_current_admin_principal
+from app.models.user import Principal
+from app.models.till import TillReport, ZReportModel, TillCloseRequest, TillRecomputeResult
+from app.services.till_service import (
+    get_till_day, get_till_period, close_till, get_z_reports, recompute_till_totals
+)
+from app.database import get_db
+from typing import List, Optional
+
+router = APIRouter()
+
+# Dates are business days (YYYY-MM-DD in the configured till timezone).
+
+@router.get("/day", response_model=TillReport)
+async def read_till_day(
+    date: Optional[str] = Query(None, description="Business day, defaults to today"),
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Takings for one day by payment method (gross, tax, discount, refunds, net)"""
+    return await get_till_day(str(current_user.business_id), date, db)
+
+@router.get("/period", response_model=TillReport)
+async def read_till_period(
+    start_date: str,
+    end_date: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Takings by payment method over a range of days (inclusive)"""
+    return await get_till_period(str(current_user.business_id), start_date, end_date, db)
+
+@router.post("/close", response_model=ZReportModel)
+async def close_till_day(
+    request: Optional[TillCloseRequest] = None,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """Close the till for a day (today by default) and store its Z-report"""
+    request = request or TillCloseRequest()
+    return await close_till(str(current_user.business_id), str(current_user.id), request.date, request.notes, db)
+
+@router.get("/z-reports", response_model=List[ZReportModel])
+async def read_z_reports(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db = Depends(get_db)
+):
+    """Stored Z-reports, most recent first"""
+    return await get_z_reports(str(current_user.business_id), start_date, end_date, db)
+
+@router.post("/recompute", response_model=TillRecomputeResult)
+async def recompute_till(
+    start_date: str,
+    end_date: Optional[str] = None,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db = Depends(get_db)
+):
+    """Rebuild the day totals from sales and refunds and report any discrepancies"""
+    return await recompute_till_totals(str(current_user.business_id), start_date, end_date, db)
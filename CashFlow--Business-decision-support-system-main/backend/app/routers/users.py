@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.models.user import PasswordChange, PasswordReset, UserCreate, UserModel, UserRole, UserUpdate, UserInDB
+from app.models.user import PasswordChange, PasswordReset, UserCreate, UserModel, UserRole, UserUpdate, UserInDB, Principal
 from app.services.user_service import change_user_password, get_users, get_user, create_user, reset_user_password, update_user, delete_user
-from app.auth import get_current_user, get_current_admin_user
+from app.services.password_service import get_password_hash_metrics
+from app.auth import get_current_user, get_current_admin_user, get_current_principal
 from typing import List
 from app.database import get_db  # Import the database dependency
 
@@ -62,18 +63,21 @@ async def update_current_user(
 async def change_password(
     password_data: PasswordChange,
     current_user: UserInDB = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """
     Change the current user's password.
     Requires current password for verification.
+    Signs out every other session of the user.
     """
     success = await change_user_password(
         str(current_user.business_id),
         str(current_user.id),
         password_data.current_password,
         password_data.new_password,
-        db
+        db,
+        current_session_id=principal.session_id
     )
     
     if not success:
@@ -84,10 +88,17 @@ async def change_password(
     
     return {"message": "Password changed successfully"}
 
+@router.get("/password-hashing/metrics")
+async def read_password_hashing_metrics(
+    current_user: UserInDB = Depends(get_current_admin_user)
+):
+    """Counters and timings of the password hashing pool (admin only)"""
+    return get_password_hash_metrics()
+
 # Collection routes (no path parameters)
 @router.get("", response_model=List[UserInDB])
 async def read_users(
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Get all users for the current business"""
@@ -174,7 +185,7 @@ async def reset_password(
 @router.get("/{user_id}", response_model=UserInDB)
 async def read_user(
     user_id: str,
-    current_user: UserInDB = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db = Depends(get_db)  # Add db dependency
 ):
     """Get a specific user by ID"""
@@ -0,0 +1,190 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from app.models.alert import StockAlertModel, StockAlertPage
+from app.models.base import PyObjectId
+from app.services.reservation_service import AVAILABLE_EXPR
+from config import settings
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# business_id -> (alerts enabled, threshold, expires_at)
+ALERT_SETTINGS_CACHE: Dict[str, Tuple[bool, int, float]] = {}
+ALERT_SETTINGS_TTL_SECONDS = 60
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+# Keep references to scheduled checks so they aren't garbage collected mid-run
+_pending_checks: Set[asyncio.Task] = set()
+
+async def ensure_alert_indexes(db) -> None:
+    await db.stock_alerts.create_index([("business_id", 1), ("product_id", 1)], unique=True)
+    await db.stock_alerts.create_index([("business_id", 1), ("active", 1), ("quantity", 1), ("_id", 1)])
+
+def invalidate_alert_settings(business_id: str) -> None:
+    ALERT_SETTINGS_CACHE.pop(str(business_id), None)
+
+async def _alert_settings(db, business_id: PyObjectId) -> Tuple[bool, int]:
+    cached = ALERT_SETTINGS_CACHE.get(str(business_id))
+    if cached and cached[2] > time.time():
+        return cached[0], cached[1]
+    
+    doc = await db.settings.find_one(
+        {"business_id": business_id},
+        {"low_stock_alerts": 1, "low_stock_threshold": 1}
+    ) or {}
+    enabled = doc.get("low_stock_alerts", True)
+    threshold = doc.get("low_stock_threshold", DEFAULT_LOW_STOCK_THRESHOLD)
+    ALERT_SETTINGS_CACHE[str(business_id)] = (enabled, threshold, time.time() + ALERT_SETTINGS_TTL_SECONDS)
+    return enabled, threshold
+
+async def check_low_stock(db, business_id, product_ids: Iterable[Any]) -> int:
+    """
+    Re-evaluate low-stock alerts for just the given products.
+    An alert's quantity is the stock still sellable: on hand less what
+    pending orders have reserved.
+    
+    Reads the products and their alert state with two $in queries and writes
+    only threshold crossings (and quantity changes of active alerts) in one
+    bulk_write. Returns the number of alerts written.
+    """
+    business_oid = PyObjectId(str(business_id))
+    ids = list({PyObjectId(str(product_id)) for product_id in product_ids})
+    if not ids:
+        return 0
+    
+    enabled, threshold = await _alert_settings(db, business_oid)
+    
+    products = {
+        doc["_id"]: doc
+        async for doc in db.inventory.find(
+            {"_id": {"$in": ids}, "business_id": business_oid},
+            {"name": 1, "sku": 1, "quantity": 1, "reserved": 1}
+        )
+    }
+    alerts = {
+        doc["product_id"]: doc
+        async for doc in db.stock_alerts.find(
+            {"business_id": business_oid, "product_id": {"$in": ids}},
+            {"product_id": 1, "active": 1, "quantity": 1, "threshold": 1}
+        )
+    }
+    
+    now = datetime.utcnow()
+    operations = []
+    for product_id in ids:
+        product = products.get(product_id)
+        alert = alerts.get(product_id)
+        is_active = bool(alert and alert.get("active"))
+        key = {"business_id": business_oid, "product_id": product_id}
+        
+        quantity = product.get("quantity", 0) - product.get("reserved", 0) if product else 0
+        if product and enabled and quantity <= threshold:
+            if is_active and alert.get("quantity") == quantity and alert.get("threshold") == threshold:
+                continue
+            update = {
+                "product_name": product["name"].title(),
+                "sku": product.get("sku"),
+                "quantity": quantity,
+                "threshold": threshold,
+                "active": True,
+                "updated_at": now
+            }
+            if not is_active:
+                # Crossed below the threshold
+                update.update({"triggered_at": now, "resolved_at": None})
+            operations.append(UpdateOne(key, {"$set": update}, upsert=True))
+        elif is_active:
+            # Back above the threshold, alerts turned off, or product deleted
+            operations.append(UpdateOne(key, {"$set": {
+                "active": False,
+                "quantity": quantity,
+                "resolved_at": now,
+                "updated_at": now
+            }}))
+    
+    if operations:
+        await db.stock_alerts.bulk_write(operations, ordered=False)
+    return len(operations)
+
+def schedule_low_stock_check(db, business_id, product_ids: Iterable[Any]) -> None:
+    """Run check_low_stock in the background so stock writes don't wait on it"""
+    ids = list(product_ids)
+    if not ids or business_id is None:
+        return
+    
+    async def run():
+        try:
+            await check_low_stock(db, business_id, ids)
+        except Exception as e:
+            logger.error(f"Low-stock check failed for business {business_id}: {str(e)}")
+    
+    task = asyncio.create_task(run())
+    _pending_checks.add(task)
+    task.add_done_callback(_pending_checks.discard)
+
+async def reevaluate_low_stock(db, business_id: str) -> int:
+    """
+    Re-check every product of a business, e.g. after the threshold changes.
+    Only products at or below the threshold or with an active alert are read.
+    """
+    invalidate_alert_settings(business_id)
+    business_oid = PyObjectId(business_id)
+    _, threshold = await _alert_settings(db, business_oid)
+    
+    candidates = set(await db.inventory.distinct(
+        "_id", {"business_id": business_oid, "$expr": {"$lte": [AVAILABLE_EXPR, threshold]}}
+    ))
+    candidates.update(await db.stock_alerts.distinct(
+        "product_id", {"business_id": business_oid, "active": True}
+    ))
+    
+    written = 0
+    candidates = list(candidates)
+    for i in range(0, len(candidates), 1000):
+        written += await check_low_stock(db, business_oid, candidates[i:i + 1000])
+    return written
+
+async def get_stock_alerts(
+    business_id: str,
+    active: bool = True,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db=None
+) -> StockAlertPage:
+    """
+    Low-stock alerts, lowest quantity first.
+    The cursor is '<quantity>:<alert id>' of the last alert on the previous page.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query: Dict[str, Any] = {"business_id": PyObjectId(business_id), "active": active}
+    if cursor:
+        quantity, _, alert_id = cursor.partition(":")
+        try:
+            quantity = int(quantity)
+            alert_oid = PyObjectId(alert_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query["$or"] = [
+            {"quantity": {"$gt": quantity}},
+            {"quantity": quantity, "_id": {"$gt": alert_oid}}
+        ]
+    
+    docs = await db.stock_alerts.find(query).sort([("quantity", 1), ("_id", 1)]).limit(limit + 1).to_list(None)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return StockAlertPage(
+        items=[StockAlertModel.model_validate(doc) for doc in docs],
+        next_cursor=f"{docs[-1]['quantity']}:{docs[-1]['_id']}" if has_more else None
+    )
@@ -0,0 +1,374 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.models.analytics import AnalyticsInterval, AnalyticsReport, AnalyticsRow
+from app.models.base import PyObjectId
+from config import settings
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sales that count as revenue (refunds are reported separately)
+REVENUE_STATUSES = ["completed", "partial_refunded", "refunded"]
+DEFAULT_RANGE_DAYS = 30
+INTERVAL_FORMATS = {
+    AnalyticsInterval.DAY: "%Y-%m-%d",
+    AnalyticsInterval.WEEK: "%G-W%V",
+    AnalyticsInterval.MONTH: "%Y-%m"
+}
+
+# Sale-level sums shared by every report
+SALE_TOTALS = {
+    "sales_count": {"$sum": 1},
+    "revenue": {"$sum": "$total_amount"},
+    "net_sales": {"$sum": {"$subtract": ["$subtotal", {"$ifNull": ["$discount", 0]}]}},
+    "tax": {"$sum": {"$ifNull": ["$tax", 0]}},
+    "discount": {"$sum": {"$ifNull": ["$discount", 0]}},
+    "quantity": {"$sum": {"$sum": "$items.quantity"}}
+}
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; convert aware query bounds to match"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)
+
+def _date_range(start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    end = _naive_utc(end) or datetime.utcnow()
+    start = _naive_utc(start) or end - timedelta(days=DEFAULT_RANGE_DAYS)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    return start, end
+
+def _check_timezone(timezone: str) -> str:
+    """Reject unknown timezone names before they reach the pipeline"""
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown timezone: {timezone}"
+        )
+    return timezone
+
+def _line_share(line_subtotal: str, subtotal: str) -> Dict[str, Any]:
+    """A line's fraction of its document's subtotal"""
+    return {"$cond": [{"$gt": [subtotal, 0]}, {"$divide": [line_subtotal, subtotal]}, 0]}
+
+def _sales_match(business_id: str, start: datetime, end: datetime) -> Dict[str, Any]:
+    # Served by the (business_id, timestamp) index
+    return {"$match": {
+        "business_id": PyObjectId(business_id),
+        "timestamp": {"$gte": start, "$lt": end},
+        "status": {"$in": REVENUE_STATUSES}
+    }}
+
+def _refunds_match(business_id: str, start: datetime, end: datetime) -> Dict[str, Any]:
+    return {"$match": {
+        "business_id": PyObjectId(business_id),
+        "timestamp": {"$gte": start, "$lt": end}
+    }}
+
+async def _aggregate(db, collection: str, pipeline: List[Dict[str, Any]], name: str) -> Tuple[List[Dict], float]:
+    """Run a pipeline and time it"""
+    started = time.perf_counter()
+    try:
+        docs = await db[collection].aggregate(pipeline).to_list(None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error computing {name} analytics: {str(e)}"
+        )
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Analytics {name} on {collection}: {len(docs)} rows in {elapsed_ms:.1f}ms")
+    return docs, elapsed_ms
+
+def _row(doc: Dict[str, Any], key: Any = None, label: Optional[str] = None) -> AnalyticsRow:
+    return AnalyticsRow(
+        key=None if key is None else str(key),
+        label=label,
+        sales_count=doc.get("sales_count", 0),
+        quantity=int(doc.get("quantity", 0)),
+        revenue=round(doc.get("revenue", 0), 2),
+        net_sales=round(doc.get("net_sales", 0), 2),
+        tax=round(doc.get("tax", 0), 2),
+        discount=round(doc.get("discount", 0), 2),
+        refunds=round(doc.get("refunds", 0), 2)
+    )
+
+def _totals(rows: List[AnalyticsRow]) -> AnalyticsRow:
+    total = AnalyticsRow(key="total")
+    for row in rows:
+        total.sales_count += row.sales_count
+        total.quantity += row.quantity
+        total.revenue += row.revenue
+        total.net_sales += row.net_sales
+        total.tax += row.tax
+        total.discount += row.discount
+        total.refunds += row.refunds
+    for field in ("revenue", "net_sales", "tax", "discount", "refunds"):
+        setattr(total, field, round(getattr(total, field), 2))
+    return total
+
+async def get_revenue_by_period(
+    business_id: str,
+    interval: AnalyticsInterval = AnalyticsInterval.DAY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    timezone: str = "UTC",
+    db=None
+) -> AnalyticsReport:
+    """Revenue per day, ISO week or month, with refunds issued in the same period"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    start, end = _date_range(start, end)
+    timezone = _check_timezone(timezone)
+    period = {"$dateToString": {"format": INTERVAL_FORMATS[interval], "date": "$timestamp", "timezone": timezone}}
+    
+    sales, sales_ms = await _aggregate(db, "sales", [
+        _sales_match(business_id, start, end),
+        {"$group": {"_id": period, **SALE_TOTALS}}
+    ], "revenue")
+    refunds, refunds_ms = await _aggregate(db, "refunds", [
+        _refunds_match(business_id, start, end),
+        {"$group": {"_id": period, "refunds": {"$sum": "$total_refund"}}}
+    ], "refunds")
+    
+    by_period: Dict[str, Dict[str, Any]] = {doc["_id"]: doc for doc in sales}
+    for doc in refunds:
+        by_period.setdefault(doc["_id"], {})["refunds"] = doc["refunds"]
+    
+    rows = [_row(by_period[key], key) for key in sorted(by_period)]
+    return AnalyticsReport(
+        dimension=interval.value, start=start, end=end,
+        rows=rows, totals=_totals(rows), elapsed_ms=round(sales_ms + refunds_ms, 1)
+    )
+
+async def get_revenue_by_category(
+    business_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=None
+) -> AnalyticsReport:
+    """
+    Revenue and quantity per category, highest revenue first. Each sale's
+    discount and tax (and each refund's tax) are spread over its lines in
+    proportion to the line subtotals, so category rows add up to the same
+    totals as the other reports.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    start, end = _date_range(start, end)
+    
+    docs, sales_ms = await _aggregate(db, "sales", [
+        _sales_match(business_id, start, end),
+        {"$project": {
+            "subtotal": 1, "discount": 1, "tax": 1, "total_amount": 1,
+            "items.category_id": 1, "items.category_name": 1, "items.quantity": 1, "items.subtotal": 1
+        }},
+        {"$unwind": "$items"},
+        # Per sale and category first, so sales_count counts sales rather than lines
+        {"$group": {
+            "_id": {"category_id": "$items.category_id", "sale_id": "$_id"},
+            "label": {"$last": "$items.category_name"},
+            "quantity": {"$sum": "$items.quantity"},
+            "share": {"$sum": _line_share("$items.subtotal", "$subtotal")},
+            "subtotal": {"$first": "$subtotal"},
+            "discount": {"$first": {"$ifNull": ["$discount", 0]}},
+            "tax": {"$first": {"$ifNull": ["$tax", 0]}},
+            "total_amount": {"$first": "$total_amount"}
+        }},
+        {"$group": {
+            "_id": "$_id.category_id",
+            "label": {"$last": "$label"},
+            "sales_count": {"$sum": 1},
+            "quantity": {"$sum": "$quantity"},
+            "revenue": {"$sum": {"$multiply": ["$share", "$total_amount"]}},
+            "net_sales": {"$sum": {"$multiply": ["$share", {"$subtract": ["$subtotal", "$discount"]}]}},
+            "tax": {"$sum": {"$multiply": ["$share", "$tax"]}},
+            "discount": {"$sum": {"$multiply": ["$share", "$discount"]}}
+        }},
+        {"$sort": {"revenue": -1}}
+    ], "category")
+    refunds, refunds_ms = await _aggregate(db, "refunds", [
+        _refunds_match(business_id, start, end),
+        {"$project": {"subtotal": 1, "total_refund": 1, "items.category_id": 1, "items.subtotal": 1}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.category_id",
+            "refunds": {"$sum": {"$multiply": [_line_share("$items.subtotal", "$subtotal"), "$total_refund"]}}
+        }}
+    ], "category refunds")
+    
+    refunded = {doc["_id"]: doc["refunds"] for doc in refunds}
+    rows = [
+        _row({**doc, "refunds": refunded.get(doc["_id"], 0)}, doc["_id"], doc.get("label"))
+        for doc in docs
+    ]
+    return AnalyticsReport(
+        dimension="category", start=start, end=end,
+        rows=rows, totals=_totals(rows), elapsed_ms=round(sales_ms + refunds_ms, 1)
+    )
+
+async def get_revenue_by_payment_method(
+    business_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=None
+) -> AnalyticsReport:
+    """Revenue per payment method, with refunds paid out per method"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    start, end = _date_range(start, end)
+    
+    sales, sales_ms = await _aggregate(db, "sales", [
+        _sales_match(business_id, start, end),
+        {"$group": {"_id": "$payment_method", **SALE_TOTALS}},
+        {"$sort": {"revenue": -1}}
+    ], "payment method")
+    refunds, refunds_ms = await _aggregate(db, "refunds", [
+        _refunds_match(business_id, start, end),
+        {"$group": {"_id": "$payment_method", "refunds": {"$sum": "$total_refund"}}}
+    ], "payment method refunds")
+    
+    refunded = {doc["_id"]: doc["refunds"] for doc in refunds}
+    rows = [_row({**doc, "refunds": refunded.pop(doc["_id"], 0)}, doc["_id"]) for doc in sales]
+    # Refunds through a method with no sales in the range
+    rows.extend(_row({"refunds": amount}, method) for method, amount in refunded.items())
+    return AnalyticsReport(
+        dimension="payment_method", start=start, end=end,
+        rows=rows, totals=_totals(rows), elapsed_ms=round(sales_ms + refunds_ms, 1)
+    )
+
+async def get_revenue_by_hour(
+    business_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    timezone: str = "UTC",
+    db=None
+) -> AnalyticsReport:
+    """Revenue per hour of day (0-23) across the range"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    start, end = _date_range(start, end)
+    timezone = _check_timezone(timezone)
+    
+    docs, elapsed_ms = await _aggregate(db, "sales", [
+        _sales_match(business_id, start, end),
+        {"$group": {"_id": {"$hour": {"date": "$timestamp", "timezone": timezone}}, **SALE_TOTALS}},
+        {"$sort": {"_id": 1}}
+    ], "hour")
+    
+    rows = [_row(doc, doc["_id"]) for doc in docs]
+    return AnalyticsReport(
+        dimension="hour", start=start, end=end,
+        rows=rows, totals=_totals(rows), elapsed_ms=round(elapsed_ms, 1)
+    )
+
+async def get_revenue_by_customer(
+    business_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 20,
+    db=None
+) -> AnalyticsReport:
+    """Top customers by revenue in the range (walk-in sales without a customer excluded)"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    start, end = _date_range(start, end)
+    match = _sales_match(business_id, start, end)
+    match["$match"]["customer_id"] = {"$ne": None}
+    
+    docs, elapsed_ms = await _aggregate(db, "sales", [
+        match,
+        {"$group": {"_id": "$customer_id", **SALE_TOTALS}},
+        {"$sort": {"revenue": -1}},
+        {"$limit": limit}
+    ], "customer")
+    
+    names = {
+        doc["_id"]: doc.get("name")
+        async for doc in db.customers.find({"_id": {"$in": [doc["_id"] for doc in docs]}}, {"name": 1})
+    }
+    rows = [_row(doc, doc["_id"], names.get(doc["_id"])) for doc in docs]
+    return AnalyticsReport(
+        dimension="customer", start=start, end=end,
+        rows=rows, totals=_totals(rows), elapsed_ms=round(elapsed_ms, 1)
+    )
+
+# Sales history summaries for prediction diagnostics: business_id -> (computed_at, summary)
+HISTORY_SUMMARY_CACHE: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+HISTORY_SUMMARY_TTL = 300  # seconds
+
+async def get_sales_history_summary(business_id: str, db=None, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Sales count, date range, distinct products/categories and items sold, from
+    one aggregation over the business's sales, cached per business. Lines are
+    unwound with their index so each sale is counted once, on its first line.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    key = str(business_id)
+    cached = HISTORY_SUMMARY_CACHE.get(key)
+    if cached and not refresh and time.monotonic() - cached[0] < HISTORY_SUMMARY_TTL:
+        return cached[1]
+    
+    docs, elapsed_ms = await _aggregate(db, "sales", [
+        {"$match": {"business_id": PyObjectId(business_id)}},
+        {"$project": {"timestamp": 1, "items.product_id": 1, "items.category_name": 1, "items.quantity": 1}},
+        {"$unwind": {"path": "$items", "includeArrayIndex": "line", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": None,
+            "sales_records": {"$sum": {"$cond": [{"$in": ["$line", [0, None]]}, 1, 0]}},
+            "earliest": {"$min": "$timestamp"},
+            "latest": {"$max": "$timestamp"},
+            "products": {"$addToSet": "$items.product_id"},
+            "categories": {"$addToSet": {"$ifNull": ["$items.category_name", "Uncategorized"]}},
+            "total_items_sold": {"$sum": {"$ifNull": ["$items.quantity", 0]}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "sales_records": 1,
+            "earliest": 1,
+            "latest": 1,
+            "total_items_sold": 1,
+            "unique_products": {"$size": "$products"},
+            "unique_categories": {"$size": "$categories"}
+        }}
+    ], "history summary")
+    
+    summary = docs[0] if docs else {
+        "sales_records": 0, "earliest": None, "latest": None,
+        "total_items_sold": 0, "unique_products": 0, "unique_categories": 0
+    }
+    summary["days_of_history"] = (
+        (summary["latest"] - summary["earliest"]).days + 1
+        if summary["earliest"] and summary["latest"] else 0
+    )
+    summary["elapsed_ms"] = round(elapsed_ms, 1)
+    HISTORY_SUMMARY_CACHE[key] = (time.monotonic(), summary)
+    return summary
@@ -4,7 +4,8 @@ import base64
 import logging
 import re
 import time
-from typing import Dict, List, Optional, Union, Any
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 from pyzbar.pyzbar import decode
 
 logger = logging.getLogger(__name__)
@@ -12,6 +13,37 @@ logger = logging.getLogger(__name__)
 class BarcodeService:
     """Enhanced service for barcode and QR code scanning using PyZbar and OpenCV"""
     
+    # Longest side (px) of the preview image used to localize barcode regions
+    LOCALIZATION_MAX_DIM = 640
+    # Longest side (px) used for the full-frame fallback when no region decodes
+    FALLBACK_MAX_DIM = 1280
+    # Maximum number of candidate regions decoded per frame
+    MAX_REGIONS = 4
+    # Fraction of the region size added on every side before cropping
+    REGION_PADDING = 0.15
+    # Names of the _get_processed_images outputs, in order
+    PREPROCESSING_VARIANTS = [
+        'grayscale', 'color', 'threshold', 'adaptive_threshold',
+        'blur_adaptive_threshold', 'edges', 'morphology', 'clahe', 'inverted'
+    ]
+    # Worker threads used to decode frames concurrently
+    MULTI_FRAME_WORKERS = 4
+    # Number of frames that must agree on a value before scanning stops
+    CONSENSUS_MIN_FRAMES = 2
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        self._max_workers = max_workers or self.MULTI_FRAME_WORKERS
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily create the shared frame-decoding worker pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers,
+                thread_name_prefix="barcode-frame"
+            )
+        return self._executor
+    
     def decode_image(self, image_data: str) -> List[Dict[str, Any]]:
         """
         Decode a single base64 image to find barcodes with OpenCV preprocessing
@@ -22,7 +54,6 @@ class BarcodeService:
         Returns:
             List of detected barcodes with type, data, and positions
         """
-        start_time = time.time()
         logger.info("Starting barcode detection on image")
         
         try:
@@ -33,62 +64,51 @@ class BarcodeService:
                 logger.error("Failed to decode base64 image")
                 return []
             
-            logger.info(f"Image decoded successfully, shape: {img.shape}")
+            return self.decode_frame(img)
+            
+        except Exception as e:
+            logger.error(f"Barcode detection error: {str(e)}")
+            return []
+    
+    def decode_frame(self, img: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Decode barcodes from an already decoded OpenCV image
+        
+        Candidate regions are located on a downscaled copy of the frame and
+        only those crops are decoded at native resolution. If none of the
+        regions yields a barcode, the whole frame is decoded at a bounded
+        resolution as a fallback.
+        
+        Args:
+            img: Input image in OpenCV (BGR) format
             
-            # Get multiple processed versions of the image for scanning
-            # This improves detection across various barcode types and lighting conditions
-            processed_images = self._get_processed_images(img)
+        Returns:
+            List of detected barcodes with type, data, and positions
+        """
+        start_time = time.time()
+        
+        try:
+            logger.info(f"Image decoded successfully, shape: {img.shape}")
             
-            # Track all found barcodes
             all_barcodes = []
             barcode_values = set()  # To track unique barcodes
             
-            # Try all processed images until we find barcodes
-            for i, proc_img in enumerate(processed_images):
-                try:
-                    # Detect barcodes in the processed image
-                    barcodes = decode(proc_img)
-                    
-                    # If we found barcodes, process them
-                    if barcodes:
-                        logger.info(f"Found {len(barcodes)} barcodes in processed image {i+1}")
-                        for barcode in barcodes:
-                            try:
-                                # Decode barcode data
-                                barcode_data = barcode.data.decode('utf-8')
-                                
-                                # Skip if we've already found this barcode
-                                if barcode_data in barcode_values:
-                                    continue
-                                
-                                barcode_values.add(barcode_data)
-                                
-                                # Extract points
-                                points = []
-                                for point in barcode.polygon:
-                                    points.append([point.x, point.y])
-                                    
-                                # Extract rectangle
-                                rect = {
-                                    'x': barcode.rect.left,
-                                    'y': barcode.rect.top,
-                                    'width': barcode.rect.width,
-                                    'height': barcode.rect.height
-                                }
-                                
-                                # Add to results
-                                all_barcodes.append({
-                                    'type': barcode.type,
-                                    'data': barcode_data,
-                                    'points': points,
-                                    'rect': rect
-                                })
-                                
-                                logger.info(f"Decoded barcode: {barcode_data} ({barcode.type})")
-                            except Exception as e:
-                                logger.error(f"Error processing barcode: {str(e)}")
-                except Exception as e:
-                    logger.error(f"Error decoding processed image {i+1}: {str(e)}")
+            # Decode each candidate region at native resolution
+            regions = self._locate_barcode_regions(img)
+            logger.info(f"Located {len(regions)} candidate barcode region(s)")
+            
+            for (x, y, w, h) in regions:
+                roi = img[y:y + h, x:x + w]
+                all_barcodes.extend(
+                    self._decode_region(roi, barcode_values, offset=(x, y))
+                )
+            
+            # Fall back to a bounded-resolution full-frame pass
+            if not all_barcodes:
+                frame, scale = self._downscale(img, self.FALLBACK_MAX_DIM)
+                all_barcodes.extend(
+                    self._decode_region(frame, barcode_values, scale=scale)
+                )
             
             # Log performance metrics
             elapsed = time.time() - start_time
@@ -100,67 +120,476 @@ class BarcodeService:
             logger.error(f"Barcode detection error: {str(e)}")
             return []
     
-    def _get_processed_images(self, img: np.ndarray) -> List[np.ndarray]:
+    def process_multi_frame_detection(
+        self,
+        frames: List[Union[str, bytes, np.ndarray]],
+        min_agreement: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
-        Generate multiple processed versions of the image to improve barcode detection
+        Decode several frames concurrently and return the consensus barcode
+        
+        Frames are decoded in the shared worker pool with at most
+        MULTI_FRAME_WORKERS in flight. As soon as min_agreement frames report
+        the same value the remaining frames are cancelled (k-of-n consensus).
+        
+        Args:
+            frames: Base64 encoded images, encoded image bytes or decoded OpenCV images
+            min_agreement: Frames that must agree (defaults to CONSENSUS_MIN_FRAMES,
+                capped at the number of frames)
+            
+        Returns:
+            Dictionary with success flag, message, barcode value, best detection,
+            confidence (agreeing frames / frames submitted), agreement (agreeing
+            frames / frames decoded) and per-frame timing
+        """
+        start_time = time.time()
+        total = len(frames)
+        
+        if total == 0:
+            return {
+                'success': False,
+                'message': 'No frames provided',
+                'barcode': None,
+                'detection': None,
+                'confidence': 0,
+                'agreement': 0,
+                'frames': []
+            }
+        
+        required = min(min_agreement or self.CONSENSUS_MIN_FRAMES, total)
+        executor = self._get_executor()
+        
+        votes: Dict[str, int] = {}
+        detections: Dict[str, Dict[str, Any]] = {}
+        frame_stats: List[Dict[str, Any]] = [
+            {'frame': i, 'status': 'skipped', 'elapsed_ms': None, 'barcodes': []}
+            for i in range(total)
+        ]
+        
+        pending = {}
+        next_frame = 0
+        processed = 0
+        winner = None
+        
+        def submit_next():
+            nonlocal next_frame
+            index = next_frame
+            next_frame += 1
+            pending[executor.submit(self._timed_decode, frames[index])] = index
+        
+        while next_frame < total and len(pending) < self._max_workers:
+            submit_next()
+        
+        while pending and winner is None:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                processed += 1
+                try:
+                    results, elapsed = future.result()
+                except Exception as e:
+                    logger.error(f"Error decoding frame {index + 1}: {str(e)}")
+                    frame_stats[index]['status'] = 'error'
+                    continue
+                
+                frame_stats[index].update({
+                    'status': 'decoded' if results else 'empty',
+                    'elapsed_ms': round(elapsed * 1000, 2),
+                    'barcodes': [r['data'] for r in results]
+                })
+                
+                for result in results:
+                    value = result['data']
+                    votes[value] = votes.get(value, 0) + 1
+                    detections.setdefault(value, result)
+                    if winner is None and votes[value] >= required:
+                        winner = value
+            
+            if winner is None:
+                while next_frame < total and len(pending) < self._max_workers:
+                    submit_next()
+        
+        # Consensus reached early: drop frames that are still queued and
+        # stop waiting for the ones already running
+        for future, index in pending.items():
+            frame_stats[index]['status'] = 'cancelled' if future.cancel() else 'abandoned'
+        
+        elapsed = time.time() - start_time
+        
+        if winner is None and votes:
+            # No value reached the threshold, report the most frequent one
+            winner = max(votes.items(), key=lambda x: x[1])[0]
+        
+        if winner is None:
+            logger.info(f"Multi-frame detection found no barcodes in {processed} frame(s) ({elapsed:.2f}s)")
+            return {
+                'success': False,
+                'message': 'No barcodes detected in any frames',
+                'barcode': None,
+                'detection': None,
+                'confidence': 0,
+                'agreement': 0,
+                'consensus': False,
+                'frames_processed': processed,
+                'frames_total': total,
+                'elapsed_ms': round(elapsed * 1000, 2),
+                'frames': frame_stats
+            }
+        
+        count = votes[winner]
+        logger.info(f"Multi-frame detection: {winner} in {count}/{processed} frame(s) ({elapsed:.2f}s)")
+        
+        return {
+            'success': True,
+            'message': f"Detected barcode in {count} frame(s)",
+            'barcode': winner,
+            'detection': detections[winner],
+            # Agreement over every submitted frame, as before early stopping;
+            # frames skipped once consensus was reached count as misses
+            'confidence': count / total,
+            'agreement': count / processed if processed else 0,
+            'consensus': count >= required,
+            'votes': count,
+            'frames_processed': processed,
+            'frames_total': total,
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'frames': frame_stats
+        }
+    
+    def _timed_decode(self, frame: Union[str, bytes, np.ndarray]) -> Tuple[List[Dict[str, Any]], float]:
+        """Decode one frame and return its barcodes with the elapsed time in seconds"""
+        start_time = time.time()
+        if isinstance(frame, np.ndarray):
+            results = self.decode_frame(frame)
+        elif isinstance(frame, (bytes, bytearray, memoryview)):
+            results = self.decode_bytes(frame)
+        else:
+            results = self.decode_image(frame)
+        return results, time.time() - start_time
+    
+    def _decode_region(
+        self,
+        img: np.ndarray,
+        barcode_values: set,
+        offset: Tuple[int, int] = (0, 0),
+        scale: float = 1.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the preprocessing variants and pyzbar over a single image region
+        
+        Args:
+            img: Region to decode
+            barcode_values: Barcode values already found in this frame (updated in place)
+            offset: Position of the region's top-left corner in the original frame
+            scale: Factor the region was resized by relative to the original frame
+            
+        Returns:
+            List of newly detected barcodes, in original frame coordinates
+        """
+        found = []
+        ox, oy = offset
+        
+        # Processed versions of the image are generated one at a time, so the
+        # variants after the first one that decodes are never computed
+        processed_images = self._get_processed_images(img)
+        
+        # Try the processed images until we find barcodes
+        for i, proc_img in enumerate(processed_images):
+            try:
+                # Detect barcodes in the processed image
+                barcodes = decode(proc_img)
+                
+                if not barcodes:
+                    continue
+                
+                logger.info(f"Found {len(barcodes)} barcodes in processed image {i+1}")
+                for barcode in barcodes:
+                    try:
+                        # Decode barcode data
+                        barcode_data = barcode.data.decode('utf-8')
+                        
+                        # Skip if we've already found this barcode
+                        if barcode_data in barcode_values:
+                            continue
+                        
+                        barcode_values.add(barcode_data)
+                        
+                        # Extract points, mapped back to the original frame
+                        points = []
+                        for point in barcode.polygon:
+                            points.append([
+                                int(point.x / scale) + ox,
+                                int(point.y / scale) + oy
+                            ])
+                            
+                        # Extract rectangle
+                        rect = {
+                            'x': int(barcode.rect.left / scale) + ox,
+                            'y': int(barcode.rect.top / scale) + oy,
+                            'width': int(barcode.rect.width / scale),
+                            'height': int(barcode.rect.height / scale)
+                        }
+                        
+                        # Add to results
+                        found.append({
+                            'type': barcode.type,
+                            'data': barcode_data,
+                            'points': points,
+                            'rect': rect,
+                            'variant': self._variant_name(i)
+                        })
+                        
+                        logger.info(f"Decoded barcode: {barcode_data} ({barcode.type})")
+                    except Exception as e:
+                        logger.error(f"Error processing barcode: {str(e)}")
+                
+                # The remaining variants only cost time once this region decoded
+                if found:
+                    break
+            except Exception as e:
+                logger.error(f"Error decoding processed image {i+1}: {str(e)}")
+        
+        return found
+    
+    def _locate_barcode_regions(self, img: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """
+        Find candidate barcode regions on a downscaled copy of the image
+        
+        Uses the OpenCV QR/barcode detectors when available and a
+        gradient + morphology pass for 1D barcodes.
         
         Args:
             img: Input image in OpenCV format
             
         Returns:
-            List of processed images ready for barcode detection
+            List of (x, y, width, height) boxes in original image coordinates
+        """
+        small, scale = self._downscale(img, self.LOCALIZATION_MAX_DIM)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        boxes = []
+        
+        # 1. Dedicated detectors (QR always, 1D barcodes on OpenCV >= 4.8)
+        detectors = [cv2.QRCodeDetector()]
+        if hasattr(cv2, 'barcode'):
+            try:
+                detectors.append(cv2.barcode.BarcodeDetector())
+            except Exception as e:
+                logger.debug(f"Barcode detector unavailable: {str(e)}")
+        
+        for detector in detectors:
+            try:
+                result = detector.detect(gray)
+                ok, points = result[0], result[1]
+                if ok and points is not None:
+                    for quad in np.asarray(points).reshape(-1, 4, 2):
+                        boxes.append(cv2.boundingRect(quad.astype(np.float32)))
+            except Exception as e:
+                logger.debug(f"Detector localization failed: {str(e)}")
+        
+        # 2. Gradient-based localization: barcodes have strong horizontal
+        #    (or vertical) gradients and low gradients along the bars
+        grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=-1)
+        grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=-1)
+        gradient = cv2.convertScaleAbs(np.abs(cv2.subtract(np.abs(grad_x), np.abs(grad_y))))
+        
+        blurred = cv2.blur(gradient, (9, 9))
+        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7))
+        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        closed = cv2.erode(closed, None, iterations=4)
+        closed = cv2.dilate(closed, None, iterations=4)
+        
+        contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = 0.002 * gray.shape[0] * gray.shape[1]
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:self.MAX_REGIONS]:
+            if cv2.contourArea(contour) < min_area:
+                break
+            boxes.append(cv2.boundingRect(contour))
+        
+        # Map boxes back to native resolution with padding and drop duplicates
+        height, width = img.shape[:2]
+        regions = []
+        for (x, y, w, h) in boxes:
+            pad_x = int(w * self.REGION_PADDING)
+            pad_y = int(h * self.REGION_PADDING)
+            x0 = max(int((x - pad_x) / scale), 0)
+            y0 = max(int((y - pad_y) / scale), 0)
+            x1 = min(int((x + w + pad_x) / scale), width)
+            y1 = min(int((y + h + pad_y) / scale), height)
+            region = (x0, y0, x1 - x0, y1 - y0)
+            
+            if region[2] <= 0 or region[3] <= 0:
+                continue
+            if any(self._overlap(region, other) > 0.5 for other in regions):
+                continue
+            regions.append(region)
+        
+        return regions[:self.MAX_REGIONS]
+    
+    @classmethod
+    def _variant_name(cls, index: int) -> str:
+        """Name of the preprocessing variant at the given index"""
+        if index < len(cls.PREPROCESSING_VARIANTS):
+            return cls.PREPROCESSING_VARIANTS[index]
+        return f"variant_{index + 1}"
+    
+    @staticmethod
+    def _downscale(img: np.ndarray, max_dim: int) -> Tuple[np.ndarray, float]:
+        """
+        Shrink an image so its longest side is at most max_dim
+        
+        Args:
+            img: Input image
+            max_dim: Maximum size of the longest side in pixels
+            
+        Returns:
+            Tuple of (resized image, scale factor applied)
         """
-        processed_images = []
+        height, width = img.shape[:2]
+        longest = max(height, width)
+        if longest <= max_dim:
+            return img, 1.0
         
+        scale = max_dim / float(longest)
+        resized = cv2.resize(
+            img, (int(width * scale), int(height * scale)),
+            interpolation=cv2.INTER_AREA
+        )
+        return resized, scale
+    
+    @staticmethod
+    def _overlap(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+        """Intersection over the smaller box area for two (x, y, w, h) boxes"""
+        ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+        iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+        smaller = min(a[2] * a[3], b[2] * b[3])
+        return (ix * iy) / smaller if smaller else 0.0
+    
+    def _get_processed_images(self, img: np.ndarray) -> Iterator[np.ndarray]:
+        """
+        Lazily generate processed versions of the image to improve barcode detection
+        
+        Each variant is only computed when the caller asks for it, so a region
+        that decodes on the first variant costs one conversion instead of nine.
+        
+        Args:
+            img: Input image in OpenCV format
+            
+        Yields:
+            Processed images ready for barcode detection, in PREPROCESSING_VARIANTS order
+        """
         # First convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
         
         # 1. Original grayscale image
-        processed_images.append(gray)
+        yield gray
         
         # 2. Original color image (sometimes color helps with certain barcodes)
-        processed_images.append(img)
+        yield img
         
         # 3. Basic threshold
         _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-        processed_images.append(thresh)
+        yield thresh
+        del thresh
         
         # 4. Adaptive threshold - works better in varying lighting
         adaptive_thresh = cv2.adaptiveThreshold(
             gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
             cv2.THRESH_BINARY, 11, 2
         )
-        processed_images.append(adaptive_thresh)
+        yield adaptive_thresh
         
         # 5. Blur + adaptive threshold - reduces noise
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        adaptive_thresh2 = cv2.adaptiveThreshold(
+        yield cv2.adaptiveThreshold(
             blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
             cv2.THRESH_BINARY, 11, 2
         )
-        processed_images.append(adaptive_thresh2)
+        del blurred
         
         # 6. Edge detection based image
-        edges = cv2.Canny(gray, 50, 200, apertureSize=3)
-        processed_images.append(edges)
+        yield cv2.Canny(gray, 50, 200, apertureSize=3)
         
         # 7. Morphological operations for clearer barcode patterns
         kernel = np.ones((3, 3), np.uint8)
         dilated = cv2.dilate(adaptive_thresh, kernel, iterations=1)
-        eroded = cv2.erode(dilated, kernel, iterations=1)
-        processed_images.append(eroded)
+        del adaptive_thresh
+        yield cv2.erode(dilated, kernel, iterations=1)
+        del dilated
         
         # 8. Contrast enhancement
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        processed_images.append(enhanced)
+        yield clahe.apply(gray)
         
         # 9. Inverted image (helps with some barcodes)
-        inverted = cv2.bitwise_not(gray)
-        processed_images.append(inverted)
+        yield cv2.bitwise_not(gray)
+    
+    def decode_bytes(self, image_bytes: Union[bytes, bytearray, memoryview]) -> List[Dict[str, Any]]:
+        """
+        Decode barcodes from raw encoded image bytes (JPEG, PNG, ...)
         
-        # Return all processed versions
-        return processed_images
+        Args:
+            image_bytes: Encoded image, e.g. the body of a binary upload
+            
+        Returns:
+            List of detected barcodes with type, data, and positions
+        """
+        logger.info("Starting barcode detection on binary image")
+        
+        try:
+            img = self._decode_image_bytes(image_bytes)
+            
+            if img is None:
+                logger.error("Failed to decode binary image")
+                return []
+            
+            return self.decode_frame(img)
+            
+        except Exception as e:
+            logger.error(f"Barcode detection error: {str(e)}")
+            return []
+    
+    def load_image_bytes(self, image_bytes: Union[bytes, bytearray, memoryview]) -> Optional[np.ndarray]:
+        """
+        Decode encoded image bytes (JPEG, PNG, ...) to an OpenCV image without
+        scanning it, e.g. to feed a BarcodeScanSession
+        
+        Args:
+            image_bytes: Encoded image bytes or a memoryview over them
+        
+        Returns:
+            OpenCV image array or None if the bytes are not a valid image
+        """
+        return self._decode_image_bytes(image_bytes)
+    
+    @staticmethod
+    def _decode_image_bytes(image_bytes: Union[bytes, bytearray, memoryview]) -> Optional[np.ndarray]:
+        """
+        Decode encoded image bytes to OpenCV format without copying the buffer
+        
+        Args:
+            image_bytes: Encoded image bytes or a memoryview over them
+        
+        Returns:
+            OpenCV image array or None
+        """
+        try:
+            # frombuffer wraps the existing buffer; imdecode reads it in place
+            nparr = np.frombuffer(memoryview(image_bytes), np.uint8)
+            if nparr.size == 0:
+                return None
+            
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            
+            if img is None:
+                logger.error("Failed to decode image bytes")
+                return None
+                
+            return img
+        except Exception as e:
+            logger.error(f"Image decoding error: {str(e)}")
+            return None
     
     @staticmethod
     def _decode_base64_image(image_data: str) -> Optional[np.ndarray]:
@@ -186,8 +615,7 @@ class BarcodeService:
             
             # Decode base64
             image_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            img = BarcodeService._decode_image_bytes(image_bytes)
             
             if img is None:
                 logger.error("Failed to decode image after base64 decoding")
@@ -266,4 +694,137 @@ class BarcodeService:
         return False
 
 # Create a singleton instance
-barcode_service = BarcodeService()
\ No newline at end of file
+barcode_service = BarcodeService()
+
+class BarcodeScanSession:
+    """
+    Stateful continuous-scan session for a stream of frames from one camera
+    
+    The first frame is decoded with the full BarcodeService pipeline. Once a
+    barcode is found its bounding box is tracked: following frames only
+    decode a padded crop around the last known position, falling back to a
+    full-frame decode after TRACKING_MAX_MISSES consecutive misses. A result
+    is reported once a value has been seen in min_agreement frames.
+    """
+    
+    # Extra margin (fraction of the box size) searched around the tracked box
+    TRACKING_PADDING = 0.5
+    # Consecutive tracked-region misses before tracking is dropped
+    TRACKING_MAX_MISSES = 3
+    # Frames without the last reported value before it can be reported again
+    REPORT_RESET_FRAMES = 15
+    
+    def __init__(self, service: Optional[BarcodeService] = None, min_agreement: Optional[int] = None):
+        self.service = service or barcode_service
+        self.min_agreement = min_agreement or self.service.CONSENSUS_MIN_FRAMES
+        self.reset()
+    
+    def reset(self):
+        """Forget tracking state, votes and the last reported value"""
+        self.tracked_region: Optional[Tuple[int, int, int, int]] = None
+        self.misses = 0
+        self.votes: Dict[str, int] = {}
+        self.detections: Dict[str, Dict[str, Any]] = {}
+        self.vote_frames = 0
+        self.frames_seen = 0
+        self.last_reported: Optional[str] = None
+        self.frames_since_report = 0
+    
+    def process_frame(self, img: np.ndarray) -> Dict[str, Any]:
+        """
+        Decode one frame and update the session state
+        
+        Args:
+            img: Decoded OpenCV (BGR) frame
+            
+        Returns:
+            Dictionary with the frame's barcodes, whether the tracked region was
+            used, and - once consensus is reached - the agreed barcode
+        """
+        start_time = time.time()
+        self.frames_seen += 1
+        tracked = self.tracked_region is not None
+        
+        if tracked:
+            results = self._decode_tracked(img)
+            if results:
+                self.misses = 0
+            else:
+                self.misses += 1
+                if self.misses >= self.TRACKING_MAX_MISSES:
+                    # Lost the barcode: search the whole frame again
+                    self.tracked_region = None
+                    self.misses = 0
+                    results = self.service.decode_frame(img)
+                    tracked = False
+        else:
+            results = self.service.decode_frame(img)
+        
+        if results:
+            rect = results[0]['rect']
+            self.tracked_region = (rect['x'], rect['y'], rect['width'], rect['height'])
+        
+        consensus = self._update_votes(results)
+        
+        return {
+            'frame': self.frames_seen - 1,
+            'tracked': tracked,
+            'barcodes': results,
+            'consensus': consensus,
+            'elapsed_ms': round((time.time() - start_time) * 1000, 2)
+        }
+    
+    def _decode_tracked(self, img: np.ndarray) -> List[Dict[str, Any]]:
+        """Decode only a padded crop around the tracked box"""
+        x, y, w, h = self.tracked_region
+        pad_x = int(w * self.TRACKING_PADDING)
+        pad_y = int(h * self.TRACKING_PADDING)
+        height, width = img.shape[:2]
+        x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+        x1, y1 = min(x + w + pad_x, width), min(y + h + pad_y, height)
+        
+        if x1 <= x0 or y1 <= y0:
+            return []
+        
+        return self.service._decode_region(img[y0:y1, x0:x1], set(), offset=(x0, y0))
+    
+    def _update_votes(self, results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Count votes for this frame's values and return a newly agreed barcode, if any"""
+        values = {r['data'] for r in results}
+        self.vote_frames += 1
+        
+        if self.last_reported is not None:
+            if self.last_reported in values:
+                self.frames_since_report = 0
+            else:
+                self.frames_since_report += 1
+                if self.frames_since_report >= self.REPORT_RESET_FRAMES:
+                    self.last_reported = None
+        
+        for result in results:
+            value = result['data']
+            if value == self.last_reported:
+                continue
+            self.votes[value] = self.votes.get(value, 0) + 1
+            self.detections.setdefault(value, result)
+            
+            if self.votes[value] >= self.min_agreement:
+                count = self.votes[value]
+                frames = self.vote_frames
+                detection = self.detections[value]
+                
+                # Start collecting votes for the next barcode
+                self.votes = {}
+                self.detections = {}
+                self.vote_frames = 0
+                self.last_reported = value
+                self.frames_since_report = 0
+                
+                return {
+                    'barcode': value,
+                    'detection': detection,
+                    'votes': count,
+                    'frames': frames
+                }
+        
+        return None
\ No newline at end of file
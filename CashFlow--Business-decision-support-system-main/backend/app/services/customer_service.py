@@ -1,10 +1,40 @@
 from fastapi import HTTPException, status
-from app.models.customer import CustomerCreate, CustomerUpdate, CustomerModel
+from app.models.customer import (
+    CustomerCreate, CustomerUpdate, CustomerModel, CustomerSummary, CustomerPage,
+    CustomerStats, CustomerTopCategory
+)
+from app.models.imports import ImportResult, ImportRowError
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import settings
 from app.models.base import PyObjectId
-from typing import List, Optional
+from app.database import run_migration_once
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from collections import defaultdict
 import re
+import unicodedata
+
+# Search tokens are word prefixes, capped so long values don't bloat the index
+SEARCH_TOKEN_MAX_LENGTH = 16
+# Candidates fetched per search tier, in name order, before ranking in Python
+SEARCH_CANDIDATE_LIMIT = 50
+SEARCH_TOKEN_BACKFILL_BATCH = 1000
+# Projection leaving out the search fields when reading customers
+SEARCH_FIELDS_EXCLUDED = {"search_tokens": 0, "name_tokens": 0, "name_key": 0}
+
+# Fields returned by paginated listing
+CUSTOMER_LIST_PROJECTION = {
+    "name": 1, "email": 1, "phone": 1, "address": 1, "discount_eligibility": 1,
+    "purchase_count": 1, "lifetime_value": 1, "last_purchase_at": 1
+}
+# Sale ids kept in purchase_history
+CUSTOMER_RECENT_PURCHASES = 20
+CUSTOMER_TOP_CATEGORIES = 5
+CUSTOMER_IMPORT_MAX_ROWS = 20000
+# Values per $in query / documents per insert_many during import
+CUSTOMER_IMPORT_BATCH = 1000
 
 async def check_email_exists(db, business_id: str, email: str, exclude_id: Optional[str] = None) -> bool:
     query = {
@@ -51,6 +81,123 @@ def normalize_phone(phone: str) -> str:
     # Format as XXX-XXX-XXXX
     return f"{digits_only[:3]}-{digits_only[3:6]}-{digits_only[6:]}"
 
+def _normalize_text(value: str) -> str:
+    """Lowercase and strip accents so 'José' and 'jose' index the same"""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def _words(value: str) -> List[str]:
+    return [w for w in re.split(r"[^0-9a-z]+", _normalize_text(value)) if w]
+
+def _prefixes(word: str) -> List[str]:
+    word = word[:SEARCH_TOKEN_MAX_LENGTH]
+    return [word[:i] for i in range(1, len(word) + 1)]
+
+def build_search_tokens(name: str, email: Optional[str], phone: Optional[str]) -> List[str]:
+    """
+    Build the prefix tokens stored on a customer for indexed search.
+    Covers every word of the name and email, the full phone number and its
+    last 7 and last 4 digits (how staff usually read a number out).
+    """
+    tokens: Set[str] = set()
+    for word in _words(name) + _words(email or ""):
+        tokens.update(_prefixes(word))
+    
+    digits = re.sub(r"\D", "", phone or "")
+    if digits:
+        for tail in {digits, digits[-7:], digits[-4:]}:
+            tokens.update(_prefixes(tail))
+    
+    return sorted(tokens)
+
+def _name_key(name: str) -> str:
+    """Normalized name used to sort candidates and to find name-prefix matches"""
+    return " ".join(_words(name))
+
+def build_search_fields(name: str, email: Optional[str], phone: Optional[str]) -> Dict[str, Any]:
+    """
+    All search fields stored on a customer: search_tokens (name, email and
+    phone prefixes), name_tokens (name word prefixes only) and name_key
+    """
+    name_tokens: Set[str] = set()
+    for word in _words(name):
+        name_tokens.update(_prefixes(word))
+    return {
+        "search_tokens": build_search_tokens(name, email, phone),
+        "name_tokens": sorted(name_tokens),
+        "name_key": _name_key(name)
+    }
+
+def _search_terms(query: str) -> List[str]:
+    """Split a query into search terms; phone-like input becomes one digit string"""
+    query = (query or "").strip()
+    if re.fullmatch(r"[\d\s()+.-]+", query):
+        digits = re.sub(r"\D", "", query)
+        return [digits[:SEARCH_TOKEN_MAX_LENGTH]] if digits else []
+    return [w[:SEARCH_TOKEN_MAX_LENGTH] for w in _words(query)]
+
+def _search_rank(customer: dict, terms: List[str]) -> tuple:
+    """Lower sorts first: exact name, name starts with query, name word match, then the rest"""
+    name = _name_key(customer.get("name", ""))
+    joined = " ".join(terms)
+    name_words = _words(name)
+    
+    if name == joined:
+        score = 0
+    elif name.startswith(joined):
+        score = 1
+    elif all(any(w.startswith(t) for w in name_words) for t in terms):
+        score = 2
+    elif _normalize_text(customer.get("email", "")).startswith(joined):
+        score = 3
+    else:
+        score = 4
+    return (score, len(name), name)
+
+async def ensure_customer_indexes(db) -> None:
+    # Search tiers: name prefix, name words, then any field; each sorted by name_key
+    await db.customers.create_index([("business_id", 1), ("name_key", 1)])
+    await db.customers.create_index([("business_id", 1), ("name_tokens", 1), ("name_key", 1)])
+    await db.customers.create_index([("business_id", 1), ("search_tokens", 1), ("name_key", 1)])
+    await db.customers.create_index([("business_id", 1), ("email", 1)])
+    await db.customers.create_index([("business_id", 1), ("phone", 1)])
+    # Segmentation by value and recency
+    await db.customers.create_index([("business_id", 1), ("lifetime_value", -1)])
+    await db.customers.create_index([("business_id", 1), ("last_purchase_at", -1)])
+    await run_migration_once(db, "customer_search_fields", backfill_customer_search_tokens)
+
+async def backfill_customer_search_tokens(db, business_id: Optional[str] = None, rebuild: bool = False) -> int:
+    """
+    Compute search fields for customers missing them (or all, with rebuild=True).
+    Runs once as a startup migration; call with rebuild=True to repair drift.
+    """
+    query = {} if rebuild else {"name_key": {"$exists": False}}
+    if business_id:
+        query["business_id"] = PyObjectId(business_id)
+    
+    updated = 0
+    batch = []
+    cursor = db.customers.find(query, {"name": 1, "email": 1, "phone": 1})
+    async for customer in cursor:
+        batch.append(UpdateOne(
+            {"_id": customer["_id"]},
+            {"$set": build_search_fields(
+                customer.get("name", ""), customer.get("email"), customer.get("phone")
+            )}
+        ))
+        if len(batch) >= SEARCH_TOKEN_BACKFILL_BATCH:
+            result = await db.customers.bulk_write(batch, ordered=False)
+            updated += result.modified_count
+            batch = []
+    
+    if batch:
+        result = await db.customers.bulk_write(batch, ordered=False)
+        updated += result.modified_count
+    
+    if updated:
+        print(f"Backfilled search tokens for {updated} customers")
+    return updated
+
 async def get_customers(business_id: str, db=None) -> List[CustomerModel]:
     # Use provided db or create a new connection
     if db is None:
@@ -58,7 +205,10 @@ async def get_customers(business_id: str, db=None) -> List[CustomerModel]:
         db = client[settings.MONGODB_NAME]
     
     try:
-        customers = await db.customers.find({"business_id": PyObjectId(business_id)}).to_list(None)
+        customers = await db.customers.find(
+            {"business_id": PyObjectId(business_id)},
+            SEARCH_FIELDS_EXCLUDED
+        ).to_list(None)
         return [CustomerModel.model_validate(customer) for customer in customers]
     except Exception as e:
         raise HTTPException(
@@ -66,6 +216,45 @@ async def get_customers(business_id: str, db=None) -> List[CustomerModel]:
             detail=f"Error retrieving customers: {str(e)}"
         )
 
+async def get_customers_page(
+    business_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db=None
+) -> CustomerPage:
+    """
+    List customers a page at a time, in _id order.
+    Pass the returned next_cursor to get the following page.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = {"business_id": PyObjectId(business_id)}
+    if cursor:
+        if not PyObjectId.is_valid(cursor):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query["_id"] = {"$gt": PyObjectId(cursor)}
+    
+    try:
+        docs = await db.customers.find(query, CUSTOMER_LIST_PROJECTION).sort("_id", 1).limit(limit + 1).to_list(None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving customers: {str(e)}"
+        )
+    
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return CustomerPage(
+        items=[CustomerSummary.model_validate(doc) for doc in docs],
+        next_cursor=str(docs[-1]["_id"]) if has_more else None
+    )
+
 async def get_customer(business_id: str, customer_id: str, db=None) -> Optional[CustomerModel]:
     # Use provided db or create a new connection
     if db is None:
@@ -135,6 +324,9 @@ async def create_customer(business_id: str, customer: CustomerCreate, db=None) -
             "discount_eligibility": customer.discount_eligibility,
             "purchase_history": []
         }
+        customer_doc.update(build_search_fields(
+            customer_doc["name"], customer_doc["email"], customer_doc["phone"]
+        ))
         
         result = await db.customers.insert_one(customer_doc)
         created_customer = await get_customer(business_id, str(result.inserted_id), db)
@@ -155,6 +347,369 @@ async def create_customer(business_id: str, customer: CustomerCreate, db=None) -
             detail=f"Error creating customer: {str(e)}"
         )
 
+def _prepare_import_row(business_id: PyObjectId, fields: Dict) -> Dict:
+    """Validate one import row and build its customer document (raises ValueError)"""
+    try:
+        customer = CustomerCreate(**{
+            key: fields.get(key)
+            for key in ("name", "email", "phone", "address")
+        }, discount_eligibility=fields.get("discount_eligibility") or False)
+    except ValidationError as e:
+        first = e.errors()[0]
+        field = ".".join(str(part) for part in first.get("loc", ())) or "row"
+        raise ValueError(f"{field}: {first.get('msg')}")
+    
+    if not customer.name or not customer.name.strip():
+        raise ValueError("name: Field required")
+    if not validate_email(customer.email):
+        raise ValueError("Invalid email format")
+    
+    phone = None
+    if customer.phone:
+        phone = normalize_phone(customer.phone)
+        if not validate_phone(phone):
+            raise ValueError("Invalid phone number format")
+    
+    doc = {
+        "_id": PyObjectId(),
+        "business_id": business_id,
+        "name": customer.name.strip(),
+        "email": customer.email.lower().strip(),
+        "phone": phone,
+        "address": customer.address.strip() if customer.address else None,
+        "discount_eligibility": customer.discount_eligibility,
+        "purchase_history": []
+    }
+    doc.update(build_search_fields(doc["name"], doc["email"], doc["phone"]))
+    return doc
+
+async def _existing_values(db, business_id: PyObjectId, field: str, values: List[str]) -> Set[str]:
+    """Which of the given emails/phones are already taken, in batched $in queries"""
+    found: Set[str] = set()
+    for i in range(0, len(values), CUSTOMER_IMPORT_BATCH):
+        chunk = values[i:i + CUSTOMER_IMPORT_BATCH]
+        cursor = db.customers.find(
+            {"business_id": business_id, field: {"$in": chunk}},
+            {field: 1, "_id": 0}
+        )
+        async for doc in cursor:
+            found.add(doc[field])
+    return found
+
+async def import_customers(
+    business_id: str,
+    rows: Iterable[Tuple[int, Dict, Optional[str]]],
+    db=None
+) -> ImportResult:
+    """
+    Bulk-create customers from parsed import rows.
+    
+    Rows are validated and de-duplicated in memory, checked for existing
+    emails and phones with batched $in queries, then inserted with unordered
+    insert_many. Bad rows are reported individually and do not stop the rest.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    result = ImportResult()
+    pending: List[Tuple[int, Dict]] = []
+    seen_emails: Dict[str, int] = {}
+    seen_phones: Dict[str, int] = {}
+    
+    for row_number, fields, parse_error in rows:
+        result.total_rows += 1
+        if result.total_rows > CUSTOMER_IMPORT_MAX_ROWS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Import is limited to {CUSTOMER_IMPORT_MAX_ROWS} rows"
+            )
+        if parse_error:
+            result.errors.append(ImportRowError(row=row_number, error=parse_error))
+            continue
+        
+        try:
+            doc = _prepare_import_row(business_oid, fields)
+        except ValueError as e:
+            result.errors.append(ImportRowError(row=row_number, error=str(e)))
+            continue
+        
+        if doc["email"] in seen_emails:
+            result.errors.append(ImportRowError(
+                row=row_number,
+                error=f"Duplicate email in file (first seen on row {seen_emails[doc['email']]})",
+                value=doc["email"]
+            ))
+            continue
+        if doc["phone"] and doc["phone"] in seen_phones:
+            result.errors.append(ImportRowError(
+                row=row_number,
+                error=f"Duplicate phone number in file (first seen on row {seen_phones[doc['phone']]})",
+                value=doc["phone"]
+            ))
+            continue
+        
+        seen_emails[doc["email"]] = row_number
+        if doc["phone"]:
+            seen_phones[doc["phone"]] = row_number
+        pending.append((row_number, doc))
+    
+    try:
+        taken_emails = await _existing_values(db, business_oid, "email", list(seen_emails))
+        taken_phones = await _existing_values(db, business_oid, "phone", list(seen_phones))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error checking existing customers: {str(e)}"
+        )
+    
+    to_insert: List[Tuple[int, Dict]] = []
+    for row_number, doc in pending:
+        if doc["email"] in taken_emails:
+            result.errors.append(ImportRowError(row=row_number, error="Email already registered", value=doc["email"]))
+        elif doc["phone"] and doc["phone"] in taken_phones:
+            result.errors.append(ImportRowError(row=row_number, error="Phone number already registered", value=doc["phone"]))
+        else:
+            to_insert.append((row_number, doc))
+    
+    for i in range(0, len(to_insert), CUSTOMER_IMPORT_BATCH):
+        batch = to_insert[i:i + CUSTOMER_IMPORT_BATCH]
+        try:
+            inserted = await db.customers.insert_many([doc for _, doc in batch], ordered=False)
+            result.inserted += len(inserted.inserted_ids)
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get("writeErrors", [])
+            result.inserted += details.get("nInserted", len(batch) - len(write_errors))
+            for write_error in write_errors:
+                row_number = batch[write_error["index"]][0]
+                result.errors.append(ImportRowError(row=row_number, error=write_error.get("errmsg", "Insert failed")))
+        except Exception as e:
+            for row_number, _ in batch:
+                result.errors.append(ImportRowError(row=row_number, error=f"Insert failed: {str(e)}"))
+    
+    result.errors.sort(key=lambda err: err.row)
+    result.failed = len(result.errors)
+    print(f"Customer import for business {business_id}: {result.inserted} inserted, {result.failed} failed")
+    return result
+
+def _item_value(item: Any, key: str):
+    return item[key] if isinstance(item, dict) else getattr(item, key)
+
+def _category_increments(items: Iterable[Any], sign: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """$inc and $set fragments adding (or with sign=-1, removing) item totals per category"""
+    inc: Dict[str, Any] = defaultdict(float)
+    names: Dict[str, Any] = {}
+    for item in items:
+        key = f"category_totals.{_item_value(item, 'category_id')}"
+        inc[f"{key}.amount"] += sign * float(_item_value(item, "subtotal"))
+        inc[f"{key}.quantity"] += sign * int(_item_value(item, "quantity"))
+        names[f"{key}.name"] = _item_value(item, "category_name")
+    return {k: (int(v) if k.endswith(".quantity") else round(v, 2)) for k, v in inc.items()}, names
+
+async def record_customer_purchase(db, business_id: str, customer_id: str, sale_doc: Dict) -> None:
+    """Fold a completed sale into the customer's aggregates in one update"""
+    inc, names = _category_increments(sale_doc.get("items", []), 1)
+    inc.update({"purchase_count": 1, "lifetime_value": sale_doc.get("total_amount", 0)})
+    timestamp = sale_doc.get("timestamp")
+    
+    try:
+        await db.customers.update_one(
+            {"_id": PyObjectId(customer_id), "business_id": PyObjectId(business_id)},
+            {
+                "$inc": inc,
+                "$set": names,
+                "$max": {"last_purchase_at": timestamp},
+                "$min": {"first_purchase_at": timestamp},
+                "$push": {"purchase_history": {
+                    "$each": [sale_doc["_id"]],
+                    "$slice": -CUSTOMER_RECENT_PURCHASES
+                }}
+            }
+        )
+    except Exception as e:
+        # The sale itself succeeded; stats can be rebuilt later
+        print(f"Failed to update customer stats for {customer_id}: {str(e)}")
+
+async def record_customer_refund(db, business_id: str, customer_id: str, refund_doc: Dict) -> None:
+    """Take a refund off the customer's lifetime value and category totals"""
+    inc, _ = _category_increments(refund_doc.get("items", []), -1)
+    total_refund = refund_doc.get("total_refund", 0)
+    inc.update({"lifetime_value": -total_refund, "refund_total": total_refund})
+    
+    try:
+        await db.customers.update_one(
+            {"_id": PyObjectId(customer_id), "business_id": PyObjectId(business_id)},
+            {"$inc": inc}
+        )
+    except Exception as e:
+        print(f"Failed to update customer stats for {customer_id}: {str(e)}")
+
+async def record_customer_order_completed(db, business_id: str, customer_id: str) -> None:
+    try:
+        await db.customers.update_one(
+            {"_id": PyObjectId(customer_id), "business_id": PyObjectId(business_id)},
+            {"$inc": {"order_count": 1}}
+        )
+    except Exception as e:
+        print(f"Failed to update customer stats for {customer_id}: {str(e)}")
+
+async def get_customer_stats(business_id: str, customer_id: str, db=None) -> Optional[CustomerStats]:
+    """Read a customer's materialized purchase aggregates"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    customer = await get_customer(business_id, customer_id, db)
+    if not customer:
+        return None
+    
+    top = sorted(
+        customer.category_totals.items(),
+        key=lambda entry: entry[1].amount,
+        reverse=True
+    )[:CUSTOMER_TOP_CATEGORIES]
+    
+    return CustomerStats(
+        customer_id=str(customer.id),
+        purchase_count=customer.purchase_count,
+        order_count=customer.order_count,
+        lifetime_value=round(customer.lifetime_value, 2),
+        refund_total=round(customer.refund_total, 2),
+        average_purchase=round(customer.lifetime_value / customer.purchase_count, 2) if customer.purchase_count else 0,
+        first_purchase_at=customer.first_purchase_at,
+        last_purchase_at=customer.last_purchase_at,
+        top_categories=[
+            CustomerTopCategory(
+                category_id=category_id,
+                name=total.name,
+                amount=round(total.amount, 2),
+                quantity=total.quantity
+            )
+            for category_id, total in top if total.quantity > 0 or total.amount > 0
+        ],
+        recent_purchases=[str(sale_id) for sale_id in reversed(customer.purchase_history)]
+    )
+
+async def rebuild_customer_stats(business_id: str, db=None) -> int:
+    """
+    Recompute every customer's aggregates from sales, refunds and orders.
+    Used to backfill existing data or repair drift; normal updates are incremental.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    stats: Dict[Any, Dict[str, Any]] = defaultdict(lambda: {
+        "purchase_count": 0, "order_count": 0, "lifetime_value": 0.0, "refund_total": 0.0,
+        "first_purchase_at": None, "last_purchase_at": None,
+        "category_totals": {}, "purchase_history": []
+    })
+    
+    sales = db.sales.aggregate([
+        {"$match": {"business_id": business_oid, "customer_id": {"$ne": None}}},
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": "$customer_id",
+            "purchase_count": {"$sum": 1},
+            "lifetime_value": {"$sum": "$total_amount"},
+            "first_purchase_at": {"$min": "$timestamp"},
+            "last_purchase_at": {"$max": "$timestamp"},
+            "sale_ids": {"$push": "$_id"}
+        }},
+        {"$project": {
+            "purchase_count": 1, "lifetime_value": 1, "first_purchase_at": 1, "last_purchase_at": 1,
+            "purchase_history": {"$slice": ["$sale_ids", -CUSTOMER_RECENT_PURCHASES]}
+        }}
+    ])
+    async for row in sales:
+        entry = stats[row.pop("_id")]
+        entry.update(row)
+    
+    categories = db.sales.aggregate([
+        {"$match": {"business_id": business_oid, "customer_id": {"$ne": None}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"customer": "$customer_id", "category": "$items.category_id"},
+            "name": {"$last": "$items.category_name"},
+            "amount": {"$sum": "$items.subtotal"},
+            "quantity": {"$sum": "$items.quantity"}
+        }}
+    ])
+    async for row in categories:
+        stats[row["_id"]["customer"]]["category_totals"][str(row["_id"]["category"])] = {
+            "name": row["name"], "amount": row["amount"], "quantity": row["quantity"]
+        }
+    
+    refunds = db.refunds.aggregate([
+        {"$match": {"business_id": business_oid}},
+        {"$lookup": {
+            "from": "sales", "localField": "sale_id", "foreignField": "_id",
+            "pipeline": [{"$project": {"customer_id": 1}}], "as": "sale"
+        }},
+        {"$unwind": "$sale"},
+        {"$match": {"sale.customer_id": {"$ne": None}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"customer": "$sale.customer_id", "category": "$items.category_id", "refund": "$_id"},
+            "total_refund": {"$first": "$total_refund"},
+            "amount": {"$sum": "$items.subtotal"},
+            "quantity": {"$sum": "$items.quantity"}
+        }}
+    ])
+    counted_refunds: Set[Any] = set()
+    async for row in refunds:
+        entry = stats[row["_id"]["customer"]]
+        if row["_id"]["refund"] not in counted_refunds:
+            counted_refunds.add(row["_id"]["refund"])
+            entry["lifetime_value"] -= row["total_refund"]
+            entry["refund_total"] += row["total_refund"]
+        category = entry["category_totals"].setdefault(
+            str(row["_id"]["category"]), {"name": None, "amount": 0.0, "quantity": 0}
+        )
+        category["amount"] -= row["amount"]
+        category["quantity"] -= row["quantity"]
+    
+    orders = db.orders.aggregate([
+        {"$match": {"business_id": business_oid, "status": "completed"}},
+        {"$group": {"_id": "$customer_id", "order_count": {"$sum": 1}}}
+    ])
+    async for row in orders:
+        stats[row["_id"]]["order_count"] = row["order_count"]
+    
+    # Reset everyone, then write the recomputed figures
+    await db.customers.update_many(
+        {"business_id": business_oid},
+        {
+            "$set": {
+                "purchase_count": 0, "order_count": 0, "lifetime_value": 0, "refund_total": 0,
+                "category_totals": {}, "purchase_history": []
+            },
+            # Left unset rather than null so incremental $min/$max work
+            "$unset": {"first_purchase_at": "", "last_purchase_at": ""}
+        }
+    )
+    
+    operations = []
+    for customer_id, entry in stats.items():
+        entry["lifetime_value"] = round(entry["lifetime_value"], 2)
+        entry["refund_total"] = round(entry["refund_total"], 2)
+        operations.append(UpdateOne(
+            {"_id": customer_id, "business_id": business_oid},
+            {"$set": {key: value for key, value in entry.items() if value is not None}}
+        ))
+    
+    for i in range(0, len(operations), CUSTOMER_IMPORT_BATCH):
+        await db.customers.bulk_write(operations[i:i + CUSTOMER_IMPORT_BATCH], ordered=False)
+    
+    print(f"Rebuilt purchase stats for {len(operations)} customers in business {business_id}")
+    return len(operations)
+
 async def update_customer(
     business_id: str,
     customer_id: str,
@@ -220,6 +775,13 @@ async def update_customer(
         if customer.discount_eligibility is not None:
             update_data["discount_eligibility"] = customer.discount_eligibility
         
+        if {"name", "email", "phone"} & update_data.keys():
+            update_data.update(build_search_fields(
+                update_data.get("name", existing.name),
+                update_data.get("email", existing.email),
+                update_data["phone"] if "phone" in update_data else existing.phone
+            ))
+        
         if update_data:
             result = await db.customers.update_one(
                 {"_id": PyObjectId(customer_id), "business_id": PyObjectId(business_id)},
@@ -278,34 +840,54 @@ async def delete_customer(business_id: str, customer_id: str, db=None) -> bool:
             detail=f"Error deleting customer: {str(e)}"
         )
     
-async def search_customers(business_id: str, query: str, db=None) -> List[CustomerModel]:
+async def search_customers(business_id: str, query: str, db=None, limit: int = 10) -> List[CustomerModel]:
     """
     Search customers by name, email, or phone
-    Returns list of matching customers
+    
+    Every query term must be a prefix of some word of the customer's name,
+    email or phone. Candidates are read in rank order from three indexed
+    tiers, each sorted by name_key: names starting with the query, names
+    whose words match every term, then matches on any field. A tier is
+    only queried while fewer than `limit` better-ranked matches were found.
     """
     # Use provided db or create a new connection
     if db is None:
         client = AsyncIOMotorClient(settings.MONGODB_URL)
         db = client[settings.MONGODB_NAME]
     
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    
     try:
-        # Create case-insensitive search pattern
-        search_pattern = re.compile(f".*{query}.*", re.IGNORECASE)
+        business_oid = PyObjectId(business_id)
+        joined = " ".join(terms)
+        # Longest term first: it is the most selective one for the index scan
+        ordered_terms = sorted(set(terms), key=len, reverse=True)
+        tiers = [
+            {"name_key": {"$gte": joined, "$lt": joined + "\uffff"}},
+            {"name_tokens": {"$all": ordered_terms}},
+            {"search_tokens": {"$all": ordered_terms}}
+        ]
         
-        # Search across multiple fields
-        customers = await db.customers.find({
-            "business_id": PyObjectId(business_id),
-            "$or": [
-                {"name": {"$regex": search_pattern}},
-                {"email": {"$regex": search_pattern}},
-                {"phone": {"$regex": search_pattern}}
-            ]
-        }).limit(10).to_list(None)
+        customers = []
+        seen = set()
+        for tier in tiers:
+            async for customer in db.customers.find(
+                {"business_id": business_oid, **tier},
+                SEARCH_FIELDS_EXCLUDED
+            ).sort("name_key", 1).limit(max(SEARCH_CANDIDATE_LIMIT, limit)):
+                if customer["_id"] not in seen:
+                    seen.add(customer["_id"])
+                    customers.append(customer)
+            if len(customers) >= limit:
+                break
         
-        return [CustomerModel.model_validate(customer) for customer in customers]
+        customers.sort(key=lambda c: _search_rank(c, terms))
+        return [CustomerModel.model_validate(customer) for customer in customers[:limit]]
         
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error searching customers: {str(e)}"
-        )
\ No newline at end of file
+        )
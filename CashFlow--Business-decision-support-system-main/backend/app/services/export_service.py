@@ -0,0 +1,139 @@
+"""
+Streaming exports of sales and refunds
+
+Rows are produced straight from a Motor cursor (batch_size from
+EXPORT_BATCH_SIZE) and encoded incrementally, so memory stays bounded no
+matter how large the date range is. Used by the /api/exports routes, and
+from the command line to write a local file (orders are exported by
+order_service.iter_orders_export through /api/orders/export):
+
+    python -m app.services.export_service <business_id> sale_items parquet sales.parquet --start 2024-01-01
+"""
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.models.base import PyObjectId
+from app.utils.export_writer import ExportColumns, write_export_file
+from config import settings
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+import argparse
+import asyncio
+import sys
+
+_LINE_COLUMNS: ExportColumns = [
+    ("product_id", "string"), ("product_name", "string"),
+    ("category_id", "string"), ("category_name", "string"),
+    ("quantity", "int"), ("unit_price", "float"), ("subtotal", "float")
+]
+
+EXPORT_COLUMNS: Dict[str, ExportColumns] = {
+    "sales": [
+        ("sale_id", "string"), ("timestamp", "datetime"), ("customer_id", "string"),
+        ("order_id", "string"), ("status", "string"), ("payment_method", "string"),
+        ("item_count", "int"), ("subtotal", "float"), ("discount", "float"),
+        ("tax", "float"), ("total_amount", "float"), ("is_refunded", "bool"), ("notes", "string")
+    ],
+    "sale_items": [
+        ("sale_id", "string"), ("timestamp", "datetime"), ("customer_id", "string"),
+        ("status", "string"), ("payment_method", "string")
+    ] + _LINE_COLUMNS,
+    "refunds": [
+        ("refund_id", "string"), ("sale_id", "string"), ("timestamp", "datetime"),
+        ("reason", "string"), ("payment_method", "string"), ("subtotal", "float"),
+        ("tax_refund", "float"), ("total_refund", "float"), ("processed_by", "string"), ("notes", "string")
+    ],
+    "refund_items": [
+        ("refund_id", "string"), ("sale_id", "string"), ("timestamp", "datetime"),
+        ("reason", "string"), ("payment_method", "string")
+    ] + _LINE_COLUMNS
+}
+
+# dataset -> (collection, date field, id column, projection, one row per line item)
+_DATASETS = {
+    "sales": ("sales", "timestamp", "sale_id", {
+        "timestamp": 1, "customer_id": 1, "order_id": 1, "status": 1, "payment_method": 1,
+        "subtotal": 1, "discount": 1, "tax": 1, "total_amount": 1, "is_refunded": 1, "notes": 1,
+        "item_count": {"$size": {"$ifNull": ["$items", []]}}
+    }, False),
+    "sale_items": ("sales", "timestamp", "sale_id", {
+        "timestamp": 1, "customer_id": 1, "status": 1, "payment_method": 1, "items": 1
+    }, True),
+    "refunds": ("refunds", "timestamp", "refund_id", {
+        "sale_id": 1, "timestamp": 1, "reason": 1, "payment_method": 1, "subtotal": 1,
+        "tax_refund": 1, "total_refund": 1, "processed_by": 1, "notes": 1
+    }, False),
+    "refund_items": ("refunds", "timestamp", "refund_id", {
+        "sale_id": 1, "timestamp": 1, "reason": 1, "payment_method": 1, "items": 1
+    }, True)
+}
+
+async def iter_export_rows(
+    business_id: str,
+    dataset: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield flat export rows for `dataset`, oldest first, one document batch at a time"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    if dataset not in _DATASETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown export dataset: {dataset}"
+        )
+    collection, date_field, id_column, projection, per_line = _DATASETS[dataset]
+    
+    query: Dict[str, Any] = {"business_id": PyObjectId(business_id)}
+    if start or end:
+        query[date_field] = {}
+        if start:
+            query[date_field]["$gte"] = start
+        if end:
+            query[date_field]["$lt"] = end
+    
+    cursor = db[collection].find(query, projection).sort(
+        [(date_field, 1), ("_id", 1)]
+    ).batch_size(settings.EXPORT_BATCH_SIZE)
+    
+    async for doc in cursor:
+        items = doc.pop("items", None) or []
+        doc[id_column] = doc.pop("_id")
+        if not per_line:
+            yield doc
+            continue
+        for item in items:
+            yield {**doc, **item}
+
+async def export_to_file(
+    business_id: str,
+    dataset: str,
+    fmt: str,
+    path: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=None
+) -> int:
+    """Write an export to a local file; returns the number of bytes written"""
+    rows = iter_export_rows(business_id, dataset, start, end, db)
+    return await write_export_file(rows, fmt, EXPORT_COLUMNS[dataset], path)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export sales or refunds to a file")
+    parser.add_argument("business_id")
+    parser.add_argument("dataset", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("format", choices=["csv", "ndjson", "parquet"])
+    parser.add_argument("path")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Inclusive start (ISO date/time)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Exclusive end (ISO date/time)")
+    args = parser.parse_args(argv)
+    
+    written = asyncio.run(export_to_file(args.business_id, args.dataset, args.format, args.path, args.start, args.end))
+    print(f"Wrote {written} bytes to {args.path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
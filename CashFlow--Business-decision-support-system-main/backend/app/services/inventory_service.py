@@ -3,7 +3,22 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from app.models.inventory import InventoryItemCreate, InventoryItemUpdate, InventoryItemModel
 from app.models.base import PyObjectId
 from config import settings
-from typing import Optional, List
+from app.models.stock import StockMovementType
+from app.services.stock_service import stock_movement, record_stock_movements
+from app.services.alert_service import schedule_low_stock_check
+from app.services.reservation_service import reserved_guard
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterable, Tuple
+
+# Rows written per bulk_write during import
+INVENTORY_IMPORT_BATCH = 1000
+INVENTORY_IMPORT_MAX_ROWS = 50000
+
+async def ensure_inventory_indexes(db) -> None:
+    await db.inventory.create_index([("business_id", 1), ("name", 1)])
+    await db.inventory.create_index([("business_id", 1), ("sku", 1)])
+    await db.inventory.create_index([("business_id", 1), ("barcode", 1)])
 
 async def check_category_exists(db, business_id: str, category_id: str) -> bool:
     try:
@@ -81,6 +96,13 @@ async def create_inventory_item(business_id: str, item: InventoryItemCreate, db=
         # Insert into database
         result = await db.inventory.insert_one(new_item)
         
+        if new_item["quantity"]:
+            await record_stock_movements(db, [stock_movement(
+                new_item["business_id"], new_item["_id"], StockMovementType.INITIAL,
+                new_item["quantity"], new_item["quantity"]
+            )])
+        schedule_low_stock_check(db, business_id, [new_item["_id"]])
+        
         # Get category name for response
         category = await db.categories.find_one({"_id": PyObjectId(str(item.category_id))})
         category_name = category["name"] if category else None
@@ -127,6 +149,7 @@ async def get_inventory_items(business_id: str, db=None) -> List[InventoryItemMo
                 description=item.get("description"),
                 price=item["price"],
                 quantity=item["quantity"],
+                reserved=item.get("reserved", 0),
                 sku=item.get("sku"),
                 barcode=item.get("barcode"),  # Include barcode in result
                 category_name=category_name
@@ -167,6 +190,7 @@ async def get_inventory_item(business_id: str, item_id: str, db=None) -> Optiona
             description=item.get("description"),
             price=item["price"],
             quantity=item["quantity"],
+            reserved=item.get("reserved", 0),
             sku=item.get("sku"),
             barcode=item.get("barcode"),  # Include barcode in result
             category_name=category_name
@@ -222,6 +246,11 @@ async def update_inventory_item(business_id: str, item_id: str, item: InventoryI
         if item.price is not None:
             update_data["price"] = float(item.price)
         if item.quantity is not None:
+            if int(item.quantity) < existing_item.reserved:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Quantity can't be below the {existing_item.reserved} units reserved by pending orders"
+                )
             update_data["quantity"] = int(item.quantity)
         if item.sku is not None:
             sku_exists = await db.inventory.find_one({
@@ -255,21 +284,39 @@ async def update_inventory_item(business_id: str, item_id: str, item: InventoryI
             update_data["category_id"] = PyObjectId(str(item.category_id))
             
         if update_data:
-            result = await db.inventory.update_one(
-                {
-                    "_id": PyObjectId(item_id),
-                    "business_id": PyObjectId(business_id)
-                },
-                {"$set": update_data}
+            query = {
+                "_id": PyObjectId(item_id),
+                "business_id": PyObjectId(business_id)
+            }
+            if "quantity" in update_data:
+                # Reservations taken since the check above must still fit
+                query.update(reserved_guard(update_data["quantity"]))
+            
+            # Returns the document as it was, so a quantity change is recorded exactly
+            previous = await db.inventory.find_one_and_update(
+                query,
+                {"$set": update_data},
+                projection={"quantity": 1},
+                return_document=ReturnDocument.BEFORE
             )
             
-            # Don't check modified_count, as it might be 0 if values are the same
-            # Instead, check if the update was acknowledged
-            if not result.acknowledged:
+            if previous is None:
+                if "quantity" in update_data:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="Reservations changed while the item was being updated, please retry"
+                    )
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Failed to update item"
                 )
+            
+            if "quantity" in update_data and update_data["quantity"] != previous.get("quantity", 0):
+                await record_stock_movements(db, [stock_movement(
+                    business_id, item_id, StockMovementType.MANUAL,
+                    update_data["quantity"] - previous.get("quantity", 0), update_data["quantity"]
+                )])
+                schedule_low_stock_check(db, business_id, [item_id])
                 
         return await get_inventory_item(business_id, item_id, db)
         
@@ -313,6 +360,10 @@ async def delete_inventory_item(business_id: str, item_id: str, db=None) -> bool
             "_id": PyObjectId(item_id),
             "business_id": PyObjectId(business_id)
         })
+        await db.stock_alerts.delete_one({
+            "business_id": PyObjectId(business_id),
+            "product_id": PyObjectId(item_id)
+        })
         
         return result.deleted_count > 0
         
@@ -355,6 +406,7 @@ async def get_inventory_item_by_barcode(business_id: str, barcode: str, db=None)
             description=item.get("description"),
             price=item["price"],
             quantity=item["quantity"],
+            reserved=item.get("reserved", 0),
             sku=item.get("sku"),
             barcode=item.get("barcode"),
             category_name=category_name
@@ -365,4 +417,262 @@ async def get_inventory_item_by_barcode(business_id: str, barcode: str, db=None)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )
\ No newline at end of file
+        )
+
+
+def _parse_import_item(fields: Dict[str, Any], categories: Dict[str, Dict], creating: bool) -> Dict[str, Any]:
+    """
+    Normalize one import row into inventory fields (raises ValueError).
+    Only fields present in the row are returned, so upserts leave the rest alone.
+    """
+    data: Dict[str, Any] = {}
+    
+    name = fields.get("name")
+    if not name or not str(name).strip():
+        raise ValueError("name: Field required")
+    data["name"] = str(name).strip().lower()
+    
+    category_ref = fields.get("category_id") or fields.get("category")
+    if category_ref:
+        category_ref = str(category_ref).strip()
+        category = categories.get(category_ref) or categories.get(category_ref.lower())
+        if not category:
+            raise ValueError(f"Category '{category_ref}' not found")
+        data["category_id"] = category["_id"]
+    elif creating:
+        raise ValueError("category: Field required")
+    
+    if fields.get("price") is not None:
+        try:
+            data["price"] = float(fields["price"])
+        except (TypeError, ValueError):
+            raise ValueError("price: must be a number")
+        if data["price"] < 0:
+            raise ValueError("price: must not be negative")
+    elif creating:
+        raise ValueError("price: Field required")
+    
+    if fields.get("quantity") is not None:
+        try:
+            quantity = float(fields["quantity"])
+        except (TypeError, ValueError):
+            raise ValueError("quantity: must be a whole number")
+        if quantity != int(quantity) or quantity < 0:
+            raise ValueError("quantity: must be a whole number")
+        data["quantity"] = int(quantity)
+    elif creating:
+        data["quantity"] = 0
+    
+    if "description" in fields:
+        description = fields.get("description")
+        data["description"] = str(description).strip() if description else None
+    if fields.get("sku"):
+        data["sku"] = str(fields["sku"]).strip().upper()
+    if fields.get("barcode"):
+        data["barcode"] = str(fields["barcode"]).strip()
+    
+    return data
+
+async def _load_category_lookup(db, business_id: PyObjectId) -> Dict[str, Dict]:
+    """All of a business's categories keyed by id and by lower-cased name"""
+    lookup: Dict[str, Dict] = {}
+    async for category in db.categories.find({"business_id": business_id}, {"name": 1}):
+        lookup[str(category["_id"])] = category
+        lookup[category["name"].strip().lower()] = category
+    return lookup
+
+async def _find_import_conflicts(db, business_id: PyObjectId, batch: List[Dict]) -> Dict[str, Dict[str, Any]]:
+    """Existing owners of the batch's names, SKUs and barcodes (and their quantities and reservations), in one query"""
+    owners: Dict[str, Dict[str, Any]] = {"name": {}, "sku": {}, "barcode": {}, "quantity": {}, "reserved": {}}
+    clauses = []
+    for field in ("name", "sku", "barcode"):
+        values = list({data[field] for data in batch if data.get(field)})
+        if values:
+            clauses.append({field: {"$in": values}})
+    if not clauses:
+        return owners
+    
+    cursor = db.inventory.find(
+        {"business_id": business_id, "$or": clauses},
+        {"name": 1, "sku": 1, "barcode": 1, "quantity": 1, "reserved": 1}
+    )
+    async for doc in cursor:
+        for field in ("name", "sku", "barcode"):
+            if doc.get(field):
+                owners[field][doc[field]] = doc["_id"]
+        owners["quantity"][doc["_id"]] = doc.get("quantity", 0)
+        owners["reserved"][doc["_id"]] = doc.get("reserved", 0)
+    return owners
+
+async def import_inventory_items(
+    business_id: str,
+    rows: Iterable[Tuple[int, Dict, Optional[str]]],
+    upsert: bool = False,
+    db=None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Bulk-create (or with upsert=True, create-or-update) inventory items.
+    
+    The whole file is validated first. Categories come from one query, and
+    name/SKU/barcode conflicts are checked per batch with a single $in query,
+    then each batch is written with an unordered bulk_write. Yields one result
+    per row as batches complete, followed by a summary.
+    
+    When upserting, rows match existing items by SKU, then barcode, then name.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    categories = await _load_category_lookup(db, business_oid)
+    summary = {"total_rows": 0, "created": 0, "updated": 0, "failed": 0}
+    
+    # Validate everything up front; in-file duplicates are rejected here
+    valid: List[Tuple[int, Dict]] = []
+    failures: List[Dict[str, Any]] = []
+    seen: Dict[str, Dict[str, int]] = {"name": {}, "sku": {}, "barcode": {}}
+    
+    for row_number, fields, parse_error in rows:
+        summary["total_rows"] += 1
+        if summary["total_rows"] > INVENTORY_IMPORT_MAX_ROWS:
+            failures.append({"row": row_number, "status": "error", "error": f"Import is limited to {INVENTORY_IMPORT_MAX_ROWS} rows"})
+            continue
+        if parse_error:
+            failures.append({"row": row_number, "status": "error", "error": parse_error})
+            continue
+        try:
+            # Category/price are only mandatory for new items, checked again below for upserts
+            data = _parse_import_item(fields, categories, creating=not upsert)
+        except ValueError as e:
+            failures.append({"row": row_number, "status": "error", "error": str(e)})
+            continue
+        
+        duplicate = next(
+            (f"Duplicate {field} in file (first seen on row {seen[field][data[field]]})"
+             for field in seen if data.get(field) and data[field] in seen[field]),
+            None
+        )
+        if duplicate:
+            failures.append({"row": row_number, "status": "error", "error": duplicate})
+            continue
+        for field in seen:
+            if data.get(field):
+                seen[field][data[field]] = row_number
+        valid.append((row_number, data))
+    
+    for failure in failures:
+        summary["failed"] += 1
+        yield failure
+    
+    for start in range(0, len(valid), INVENTORY_IMPORT_BATCH):
+        batch = valid[start:start + INVENTORY_IMPORT_BATCH]
+        owners = await _find_import_conflicts(db, business_oid, [data for _, data in batch])
+        
+        operations = []
+        pending: List[Dict[str, Any]] = []
+        # Stock ledger entry per operation (None when quantity is unchanged)
+        movements: List[Optional[Dict[str, Any]]] = []
+        for row_number, data in batch:
+            target = None
+            if upsert:
+                target = next(
+                    (owners[field][data[field]] for field in ("sku", "barcode", "name")
+                     if data.get(field) and data[field] in owners[field]),
+                    None
+                )
+            
+            conflict = next(
+                (field for field in ("name", "sku", "barcode")
+                 if data.get(field) and owners[field].get(data[field]) not in (None, target)),
+                None
+            )
+            if conflict:
+                summary["failed"] += 1
+                yield {"row": row_number, "status": "error", "error": f"Item with {conflict} '{data[conflict]}' already exists"}
+                continue
+            
+            if target is None:
+                missing = [field for field in ("category_id", "price") if field not in data]
+                if missing:
+                    summary["failed"] += 1
+                    yield {"row": row_number, "status": "error", "error": f"{missing[0].replace('_id', '')}: Field required for new items"}
+                    continue
+                doc = {
+                    "_id": PyObjectId(),
+                    "business_id": business_oid,
+                    "description": None,
+                    "sku": None,
+                    "barcode": None,
+                    "quantity": 0,
+                    **data
+                }
+                operations.append(InsertOne(doc))
+                pending.append({"row": row_number, "status": "created", "id": str(doc["_id"])})
+                movements.append(stock_movement(
+                    business_oid, doc["_id"], StockMovementType.IMPORT, doc["quantity"], doc["quantity"]
+                ) if doc["quantity"] else None)
+            else:
+                reserved = owners["reserved"].get(target, 0)
+                if "quantity" in data and data["quantity"] < reserved:
+                    summary["failed"] += 1
+                    yield {"row": row_number, "status": "error", "error": f"quantity: can't be below the {reserved} units reserved by pending orders"}
+                    continue
+                query = {"_id": target, "business_id": business_oid}
+                if "quantity" in data and data["quantity"] != owners["quantity"].get(target, 0):
+                    # Reservations taken since they were read must still fit
+                    query.update(reserved_guard(data["quantity"]))
+                operations.append(UpdateOne(query, {"$set": data}))
+                pending.append({"row": row_number, "status": "updated", "id": str(target)})
+                before = owners["quantity"].get(target, 0)
+                movements.append(stock_movement(
+                    business_oid, target, StockMovementType.IMPORT, data["quantity"] - before, data["quantity"]
+                ) if "quantity" in data and data["quantity"] != before else None)
+        
+        if not operations:
+            continue
+        
+        failed_indexes: Dict[int, str] = {}
+        matched = None
+        try:
+            matched = (await db.inventory.bulk_write(operations, ordered=False)).matched_count
+        except BulkWriteError as e:
+            for write_error in (e.details or {}).get("writeErrors", []):
+                failed_indexes[write_error["index"]] = write_error.get("errmsg", "Write failed")
+            matched = (e.details or {}).get("nMatched")
+        except Exception as e:
+            failed_indexes = {index: f"Write failed: {str(e)}" for index in range(len(operations))}
+        
+        updates = [index for index, result in enumerate(pending) if result["status"] == "updated" and index not in failed_indexes]
+        if matched is not None and matched < len(updates):
+            # A reservation guard didn't match: find which quantities weren't written
+            written = {
+                doc["_id"]: doc.get("quantity")
+                async for doc in db.inventory.find(
+                    {"_id": {"$in": [PyObjectId(pending[index]["id"]) for index in updates]}},
+                    {"quantity": 1}
+                )
+            }
+            for index in updates:
+                expected = movements[index]["quantity_after"] if movements[index] else None
+                if expected is not None and written.get(PyObjectId(pending[index]["id"])) != expected:
+                    failed_indexes[index] = "Reservations changed during import, quantity not updated"
+        
+        applied = [
+            movement for index, movement in enumerate(movements)
+            if movement and index not in failed_indexes
+        ]
+        await record_stock_movements(db, applied)
+        schedule_low_stock_check(db, business_oid, [movement["product_id"] for movement in applied])
+        
+        for index, result in enumerate(pending):
+            if index in failed_indexes:
+                summary["failed"] += 1
+                yield {"row": result["row"], "status": "error", "error": failed_indexes[index]}
+            else:
+                summary[result["status"]] += 1
+                yield result
+    
+    print(f"Inventory import for business {business_id}: {summary}")
+    yield {"summary": summary}
@@ -11,7 +11,8 @@ from sklearn.ensemble import GradientBoostingRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from typing import Dict, List, Any, Optional
 from app.services.sale_service import get_sales
-from app.services.prediction_service import get_model_status, get_feature_importance
+from app.services.prediction_service import get_model_status, get_feature_importance, MODEL_CACHE
+from app.services.reorder_service import schedule_reorder_refresh
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -74,6 +75,10 @@ async def train_models_for_business(business_id: str, force_retrain: bool = Fals
         # Get feature importance
         feature_importance_result = await get_feature_importance(business_id, 'daily', db)
         
+        # New models mean new forecasts: rebuild reorder recommendations
+        if db is not None:
+            schedule_reorder_refresh(db, business_id)
+        
         return {
             "success": True,
             "models": list(model_paths.keys()),
@@ -434,6 +439,7 @@ async def train_models(business_id: str, data: pd.DataFrame) -> Dict[str, str]:
         # Save model
         model_path = os.path.join(MODEL_DIR, f"{business_id}_{model_name}_model.pkl")
         joblib.dump(pipeline, model_path)
+        MODEL_CACHE.pop(f"{business_id}_{model_name}", None)
         logger.info(f"  Model saved to {model_path}")
         
         model_paths[model_name] = model_path
@@ -1,15 +1,58 @@
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.models.order import (
-    OrderCreate, OrderModel, OrderStatus,
-    OrderItemModel, OrderItemCreate
+    OrderCreate, OrderModel, OrderStatus, OrderSort,
+    OrderItemModel, OrderItemCreate,
+    OrderSummary, OrderPage
 )
-from app.models.sale import SaleCreate, SaleItemCreate, PaymentMethod
+from app.models.sale import PaymentMethod, SaleStatus
+from app.models.stock import StockMovementType
 from app.models.base import PyObjectId
-from app.services.sale_service import create_sale, validate_products_and_quantities
-from backend.config import settings
+from app.database import run_in_transaction
+from app.services.customer_service import record_customer_purchase, record_customer_order_completed
+from app.services.stock_service import stock_movement, record_stock_movements
+from app.services.alert_service import schedule_low_stock_check
+from app.services.till_service import record_till_sale, log_till_failure
+from app.services.reservation_service import (
+    required_quantities, reservation_expiry, reserve_stock, release_stock, available_guard
+)
+from pymongo import ReturnDocument, UpdateOne
+from config import settings
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Listing fields; the line items are reduced to a count
+ORDER_LIST_PROJECTION = {
+    "customer_id": 1, "subtotal": 1, "tax_amount": 1, "discount_amount": 1,
+    "total_amount": 1, "status": 1, "created_at": 1, "delivery_date": 1,
+    "completed_at": 1, "sale_id": 1,
+    "item_count": {"$size": {"$ifNull": ["$items", []]}}
+}
+ORDER_EXPORT_COLUMNS = [
+    ("order_id", "string"), ("customer_id", "string"), ("status", "string"),
+    ("created_at", "datetime"), ("delivery_date", "datetime"), ("completed_at", "datetime"),
+    ("item_count", "int"), ("subtotal", "float"), ("tax_amount", "float"),
+    ("discount_amount", "float"), ("total_amount", "float"), ("sale_id", "string")
+]
+# Sort field and direction per listing order (ties broken on _id)
+ORDER_SORTS = {
+    OrderSort.CREATED_AT: ("created_at", -1),
+    OrderSort.DELIVERY_DATE: ("delivery_date", 1)
+}
+
+async def ensure_order_indexes(db) -> None:
+    await db.orders.create_index([("business_id", 1), ("created_at", -1), ("_id", -1)])
+    await db.orders.create_index([("business_id", 1), ("status", 1), ("created_at", -1), ("_id", -1)])
+    await db.orders.create_index([("business_id", 1), ("customer_id", 1), ("created_at", -1), ("_id", -1)])
+    await db.orders.create_index([("business_id", 1), ("delivery_date", 1), ("_id", 1)])
+    await db.orders.create_index([("business_id", 1), ("status", 1), ("delivery_date", 1), ("_id", 1)])
+    await db.orders.create_index(
+        [("reservation_expires_at", 1)],
+        partialFilterExpression={"reserved": True}
+    )
 
 async def calculate_order_totals(
     db,
@@ -17,50 +60,65 @@ async def calculate_order_totals(
     items: List[OrderItemCreate],
     tax_percentage: float,
     discount_percentage: float,
+    held: Optional[Dict[Any, int]] = None,
 ) -> Tuple[List[OrderItemModel], float, float, float, float]:
+    """
+    Price order items and check available stock (quantity less reservations).
+    Products and categories are each read with one query. `held` is stock
+    this order already has reserved, which counts as available to it.
+    """
     try:
         business_id_obj = PyObjectId(business_id)
-        detailed_items = []
+        held = held or {}
+        required = required_quantities(items)
+        
+        products = {
+            doc["_id"]: doc
+            async for doc in db.inventory.find(
+                {"_id": {"$in": list(required)}, "business_id": business_id_obj},
+                {"name": 1, "price": 1, "quantity": 1, "reserved": 1, "category_id": 1}
+            )
+        }
+        categories = {
+            doc["_id"]: doc
+            async for doc in db.categories.find(
+                {"_id": {"$in": list({p["category_id"] for p in products.values()})}, "business_id": business_id_obj},
+                {"name": 1}
+            )
+        }
         
-        for item in items:
-            product_id = PyObjectId(item.product_id)
-            product = await db.inventory.find_one({
-                "_id": product_id,
-                "business_id": business_id_obj
-            })
-            
+        for product_id, quantity in required.items():
+            product = products.get(product_id)
             if not product:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Product with ID {item.product_id} not found"
+                    detail=f"Product with ID {product_id} not found"
                 )
-                
-            if product["quantity"] < item.quantity:
+            
+            available = product["quantity"] - product.get("reserved", 0) + held.get(product_id, 0)
+            if available < quantity:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Insufficient quantity for {product['name'].title()}. Available: {product['quantity']}, Requested: {item.quantity}"
+                    detail=f"Insufficient quantity for {product['name'].title()}. Available: {max(available, 0)}, Requested: {quantity}"
                 )
             
-            # Get category information
-            category = await db.categories.find_one({
-                "_id": product["category_id"],
-                "business_id": business_id_obj
-            })
-            
-            if not category:
+            if product["category_id"] not in categories:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"Category not found for product {product['name'].title()}"
                 )
-            
+        
+        detailed_items = []
+        for item in items:
+            product = products[PyObjectId(item.product_id)]
             detailed_items.append(OrderItemModel(
-                product_id=product_id,
+                product_id=product["_id"],
                 category_id=product["category_id"],
                 quantity=item.quantity,
                 unit_price=product["price"],
                 subtotal=product["price"] * item.quantity,
                 product_name=product["name"].title(),
-                category_name=category["name"].title()
+                category_name=categories[product["category_id"]]["name"].title()
             ))
         
         # Calculate totals
@@ -86,9 +144,12 @@ async def calculate_order_totals(
             detail=f"Error calculating order totals: {str(e)}"
         )
 
-async def create_order(business_id: str, order: OrderCreate) -> OrderModel:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_NAME]
+async def create_order(business_id: str, order: OrderCreate, db=None) -> OrderModel:
+    """Create a pending order and reserve its stock in the same transaction"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
     
     try:
         # Validate customer exists
@@ -126,20 +187,19 @@ async def create_order(business_id: str, order: OrderCreate) -> OrderModel:
             "status": OrderStatus.PENDING,
             "created_at": datetime.utcnow(),
             "delivery_date": order.delivery_date,
-            "completed_at": None
+            "completed_at": None,
+            "reserved": True,
+            "reservation_expires_at": reservation_expiry(order.delivery_date)
         }
         
-        # Insert order
-        result = await db.orders.insert_one(order_doc)
-        created_order = await get_order(business_id, str(result.inserted_id))
+        async def insert(session) -> None:
+            await reserve_stock(db, order_doc["business_id"], required_quantities(detailed_items), session)
+            await db.orders.insert_one(order_doc, session=session)
         
-        if not created_order:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create order"
-            )
-            
-        return created_order
+        await run_in_transaction(db, insert)
+        # Reserved units are no longer sellable
+        schedule_low_stock_check(db, order_doc["business_id"], [item.product_id for item in detailed_items])
+        return OrderModel.model_validate(order_doc)
         
     except HTTPException:
         raise
@@ -148,23 +208,83 @@ async def create_order(business_id: str, order: OrderCreate) -> OrderModel:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create order: {str(e)}"
         )
-    
-async def convert_order_to_sale_items(order_items: List[OrderItemModel]) -> List[SaleItemCreate]:
-    """Convert order items to sale items for sale creation"""
-    return [
-        SaleItemCreate(
-            product_id=str(item.product_id),
-            quantity=item.quantity
-        ) for item in order_items
-    ]
 
-async def complete_order(business_id: str, order_id: str) -> OrderModel:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_NAME]
+def build_order_sale(order: OrderModel, payment_method: PaymentMethod) -> Dict[str, Any]:
+    """Sale document for a completed order, reusing the prices and totals fixed on the order"""
+    return {
+        "_id": PyObjectId(),
+        "business_id": order.business_id,
+        "customer_id": order.customer_id,
+        "items": [item.model_dump() for item in order.items],
+        "subtotal": order.subtotal,
+        "total_amount": order.total_amount,
+        "tax": order.tax_amount,
+        "tax_percentage": round(order.tax_amount / (order.subtotal - order.discount_amount) * 100, 2)
+            if order.subtotal - order.discount_amount > 0 else 0,
+        "discount": order.discount_amount,
+        "discount_percentage": round(order.discount_amount / order.subtotal * 100, 2) if order.subtotal > 0 else 0,
+        "payment_method": payment_method,
+        "status": SaleStatus.COMPLETED,
+        "timestamp": datetime.utcnow(),
+        "is_refunded": False,
+        "order_id": order.id,
+        "notes": f"Order #{order.id} completion"
+    }
+
+def _stock_changed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Stock changed while the order was being completed, please retry"
+    )
+
+async def _undo_order_completion(db, order: OrderModel, sale_id, applied: List[Tuple[Any, Dict[str, int]]]) -> None:
+    """Give back stock taken and reopen the order after a failed completion without a transaction"""
+    for product_id, inc in applied:
+        try:
+            await db.inventory.update_one(
+                {"_id": product_id},
+                {"$inc": {field: -delta for field, delta in inc.items()}}
+            )
+        except Exception as e:
+            logger.error(f"Failed to restore stock for product {product_id}: {str(e)}")
+    try:
+        await db.orders.update_one(
+            {"_id": order.id, "status": OrderStatus.COMPLETED, "sale_id": sale_id},
+            {
+                "$set": {"status": OrderStatus.PENDING, "reserved": order.reserved},
+                "$unset": {"completed_at": "", "sale_id": ""}
+            }
+        )
+    except Exception as e:
+        logger.error(f"Failed to reopen order {order.id}: {str(e)}")
+
+async def complete_order(
+    business_id: str,
+    order_id: str,
+    db=None,
+    payment_method: PaymentMethod = PaymentMethod.CASH
+) -> OrderModel:
+    """
+    Turn a pending order into a sale.
+    
+    The order is read once and its priced items become the sale items as-is.
+    Inside one transaction the stock of every line is checked with a single
+    query, the order is claimed (pending -> completed), stock is decremented
+    together with the order's reservation by updates guarded on availability
+    and the sale is inserted, so either all of it happens or none does. Without transactions
+    the claim comes first so only one caller gets past it, and the steps
+    already applied are undone if a later one fails.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
     
     try:
+        business_oid = PyObjectId(business_id)
+        
         # Get the order
-        order = await get_order(business_id, order_id)
+        order = await get_order(business_id, order_id, db)
         if not order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -177,41 +297,134 @@ async def complete_order(business_id: str, order_id: str) -> OrderModel:
                 detail="Can only complete pending orders"
             )
         
-        # Convert order items to sale items
-        sale_items = await convert_order_to_sale_items(order.items)
-        
-        # Create the sale
-        sale_create = SaleCreate(
-            customer_id=order.customer_id,
-            items=sale_items,
-            tax_percentage=(order.tax_amount / order.subtotal * 100) if order.subtotal > 0 else 0,
-            discount_percentage=(order.discount_amount / order.subtotal * 100) if order.subtotal > 0 else 0,
-            payment_method=PaymentMethod.CASH,  # Default payment method
-            notes=f"Order #{order_id} completion"
-        )
-        
-        # Create the sale (this will handle inventory updates)
-        created_sale = await create_sale(business_id, sale_create)
-        
-        # Update order status and link to sale
-        result = await db.orders.update_one(
-            {"_id": order.id},
-            {
-                "$set": {
-                    "status": OrderStatus.COMPLETED,
-                    "completed_at": datetime.utcnow(),
-                    "sale_id": created_sale.id
-                }
+        required = required_quantities(order.items)
+        names = {item.product_id: item.product_name for item in order.items}
+        sale_doc = build_order_sale(order, payment_method)
+        
+        # Stock the order holds counts towards its own availability
+        held = required if order.reserved else {}
+        
+        async def apply(session) -> List[Dict[str, Any]]:
+            # Revalidate stock for every line in one query
+            stock = {
+                doc["_id"]: (doc.get("quantity", 0), doc.get("reserved", 0))
+                async for doc in db.inventory.find(
+                    {"_id": {"$in": list(required)}, "business_id": business_oid},
+                    {"quantity": 1, "reserved": 1},
+                    session=session
+                )
             }
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update order status"
+            
+            updates = []
+            for product_id, quantity in required.items():
+                if product_id not in stock:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Product {names[product_id]} no longer exists"
+                    )
+                on_hand, reserved = stock[product_id]
+                hold = held.get(product_id, 0)
+                available = on_hand - reserved + hold
+                if available < quantity:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Insufficient quantity for {names[product_id]}. Available: {max(available, 0)}, Requested: {quantity}"
+                    )
+                # Guarded on availability, not the values read above, so unrelated
+                # sales or adjustments of the product don't fail the completion
+                query = {"_id": product_id, "business_id": business_oid, **available_guard(quantity - hold)}
+                if hold:
+                    query["reserved"] = {"$gte": hold}
+                updates.append((query, {"quantity": -quantity, "reserved": -hold}))
+            
+            # Claim the order first: only one caller can move it out of pending.
+            # The reservation flag is part of the guard so a concurrent expiry sweep is detected
+            result = await db.orders.update_one(
+                {
+                    "_id": order.id,
+                    "business_id": business_oid,
+                    "status": OrderStatus.PENDING,
+                    "reserved": True if order.reserved else {"$ne": True}
+                },
+                {"$set": {
+                    "status": OrderStatus.COMPLETED,
+                    "completed_at": sale_doc["timestamp"],
+                    "sale_id": sale_doc["_id"],
+                    "reserved": False
+                }},
+                session=session
             )
-        
-        return await get_order(business_id, order_id)
+            if result.matched_count == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Order changed while it was being completed, please retry"
+                )
+            
+            applied = []
+            movements = []
+            try:
+                if session is not None:
+                    result = await db.inventory.bulk_write(
+                        [UpdateOne(query, {"$inc": inc}) for query, inc in updates],
+                        ordered=True,
+                        session=session
+                    )
+                    if result.matched_count != len(updates):
+                        raise _stock_changed()
+                    # The transaction's snapshot makes the balances read above exact
+                    balances = {query["_id"]: stock[query["_id"]][0] + inc["quantity"] for query, inc in updates}
+                else:
+                    # An unmatched op in a bulk_write doesn't stop the others,
+                    # so without a transaction each line is applied on its own
+                    balances = {}
+                    for query, inc in updates:
+                        updated = await db.inventory.find_one_and_update(
+                            query,
+                            {"$inc": inc},
+                            projection={"quantity": 1},
+                            return_document=ReturnDocument.AFTER
+                        )
+                        if updated is None:
+                            raise _stock_changed()
+                        applied.append((query["_id"], inc))
+                        balances[query["_id"]] = updated["quantity"]
+                
+                movements = [
+                    stock_movement(
+                        business_oid, product_id, StockMovementType.SALE,
+                        -quantity, balances[product_id],
+                        sale_doc["_id"], sale_doc["timestamp"]
+                    )
+                    for product_id, quantity in required.items()
+                ]
+                await db.sales.insert_one(sale_doc, session=session)
+            except Exception:
+                if session is None:
+                    await _undo_order_completion(db, order, sale_doc["_id"], applied)
+                raise
+            
+            await record_stock_movements(db, movements, session=session)
+            try:
+                await record_till_sale(db, sale_doc, session)
+            except Exception as e:
+                if session is not None:
+                    raise
+                # Without a transaction the sale stands; the day's totals need a recompute
+                log_till_failure("sale", sale_doc, e)
+            return movements
+        
+        movements = await run_in_transaction(db, apply)
+        
+        schedule_low_stock_check(db, business_oid, [m["product_id"] for m in movements])
+        await record_customer_purchase(db, business_id, str(order.customer_id), sale_doc)
+        await record_customer_order_completed(db, business_id, str(order.customer_id))
+        
+        return order.model_copy(update={
+            "status": OrderStatus.COMPLETED,
+            "completed_at": sale_doc["timestamp"],
+            "reserved": False,
+            "sale_id": sale_doc["_id"]
+        })
         
     except HTTPException:
         raise
@@ -222,9 +435,11 @@ async def complete_order(business_id: str, order_id: str) -> OrderModel:
         )
     
 
-async def get_order(business_id: str, order_id: str) -> Optional[OrderModel]:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_NAME]
+async def get_order(business_id: str, order_id: str, db=None) -> Optional[OrderModel]:
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
     
     try:
         order = await db.orders.find_one({
@@ -240,31 +455,154 @@ async def get_order(business_id: str, order_id: str) -> Optional[OrderModel]:
             detail=f"Error retrieving order: {str(e)}"
         )
 
-async def get_orders(business_id: str, status: Optional[OrderStatus] = None) -> List[OrderModel]:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_NAME]
+def _order_filter(
+    business_id: str,
+    status_filter: Optional[OrderStatus] = None,
+    customer_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    delivery_from: Optional[datetime] = None,
+    delivery_to: Optional[datetime] = None
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"business_id": PyObjectId(business_id)}
+    if status_filter:
+        query["status"] = status_filter
+    if customer_id:
+        if not PyObjectId.is_valid(customer_id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid customer ID"
+            )
+        query["customer_id"] = PyObjectId(customer_id)
     
+    for field, start, end in (("created_at", created_from, created_to), ("delivery_date", delivery_from, delivery_to)):
+        if start or end:
+            query[field] = {}
+            if start:
+                query[field]["$gte"] = start
+            if end:
+                query[field]["$lt"] = end
+    return query
+
+def _apply_order_cursor(query: Dict[str, Any], sort: OrderSort, cursor: str) -> None:
+    """Restrict the query to orders after the cursor ("<sort value>:<id>")"""
+    field, direction = ORDER_SORTS[sort]
+    value, _, last_id = cursor.rpartition(":")
     try:
-        query = {"business_id": PyObjectId(business_id)}
-        if status:
-            query["status"] = status
-        
+        value = datetime.fromisoformat(value)
+    except ValueError:
+        value = None
+    if value is None or not PyObjectId.is_valid(last_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    op = "$lt" if direction < 0 else "$gt"
+    query["$or"] = [
+        {field: {op: value}},
+        {field: value, "_id": {op: PyObjectId(last_id)}}
+    ]
+
+async def get_orders(business_id: str, status_filter: Optional[OrderStatus] = None, db=None) -> List[OrderModel]:
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    try:
+        query = _order_filter(business_id, status_filter)
         orders = await db.orders.find(query).sort("created_at", -1).to_list(None)
         return [OrderModel.model_validate(order) for order in orders]
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving orders: {str(e)}"
+        )
+
+async def get_orders_page(
+    business_id: str,
+    status_filter: Optional[OrderStatus] = None,
+    customer_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    delivery_from: Optional[datetime] = None,
+    delivery_to: Optional[datetime] = None,
+    sort: OrderSort = OrderSort.CREATED_AT,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db=None
+) -> OrderPage:
+    """
+    List orders a page at a time, newest first or by delivery date.
+    Pass the returned next_cursor to get the following page.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = _order_filter(business_id, status_filter, customer_id, created_from, created_to, delivery_from, delivery_to)
+    if cursor:
+        _apply_order_cursor(query, sort, cursor)
+    field, direction = ORDER_SORTS[sort]
+    
+    try:
+        docs = await db.orders.find(query, ORDER_LIST_PROJECTION).sort(
+            [(field, direction), ("_id", direction)]
+        ).limit(limit + 1).to_list(None)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving orders: {str(e)}"
         )
+    
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return OrderPage(
+        items=[OrderSummary.model_validate(doc) for doc in docs],
+        next_cursor=f"{docs[-1][field].isoformat()}:{docs[-1]['_id']}" if has_more else None
+    )
 
-async def update_order(business_id: str, order_id: str, order: OrderCreate) -> Optional[OrderModel]:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_NAME]
+async def iter_orders_export(
+    business_id: str,
+    status_filter: Optional[OrderStatus] = None,
+    customer_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    delivery_from: Optional[datetime] = None,
+    delivery_to: Optional[datetime] = None,
+    sort: OrderSort = OrderSort.CREATED_AT,
+    db=None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield every matching order as a flat export row, streaming from the cursor"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = _order_filter(business_id, status_filter, customer_id, created_from, created_to, delivery_from, delivery_to)
+    field, direction = ORDER_SORTS[sort]
+    cursor = db.orders.find(query, ORDER_LIST_PROJECTION).sort(
+        [(field, direction), ("_id", direction)]
+    ).batch_size(settings.EXPORT_BATCH_SIZE)
+    
+    async for doc in cursor:
+        doc["order_id"] = doc.pop("_id")
+        yield doc
+
+async def update_order(business_id: str, order_id: str, order: OrderCreate, db=None) -> Optional[OrderModel]:
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
     
     try:
         # Get existing order
-        existing_order = await get_order(business_id, order_id)
+        existing_order = await get_order(business_id, order_id, db)
         if not existing_order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -288,6 +626,9 @@ async def update_order(business_id: str, order_id: str, order: OrderCreate) -> O
                 detail="Customer not found"
             )
         
+        # Stock this order already holds is available to it
+        held = required_quantities(existing_order.items) if existing_order.reserved else {}
+        
         # Calculate new totals
         detailed_items, subtotal, tax_amount, discount_amount, total_amount = (
             await calculate_order_totals(
@@ -295,10 +636,16 @@ async def update_order(business_id: str, order_id: str, order: OrderCreate) -> O
                 business_id,
                 order.items,
                 order.tax_percentage,
-                order.discount_percentage
+                order.discount_percentage,
+                held
             )
         )
         
+        # Only the difference between the old and new holds touches inventory
+        required = required_quantities(detailed_items)
+        to_reserve = {pid: qty - held.get(pid, 0) for pid, qty in required.items() if qty > held.get(pid, 0)}
+        to_release = {pid: qty - required.get(pid, 0) for pid, qty in held.items() if qty > required.get(pid, 0)}
+        
         # Update order
         update_data = {
             "items": [item.model_dump() for item in detailed_items],
@@ -306,21 +653,42 @@ async def update_order(business_id: str, order_id: str, order: OrderCreate) -> O
             "tax_amount": tax_amount,
             "discount_amount": discount_amount,
             "total_amount": total_amount,
-            "delivery_date": order.delivery_date
+            "delivery_date": order.delivery_date,
+            "reserved": True,
+            "reservation_expires_at": reservation_expiry(order.delivery_date)
         }
         
-        result = await db.orders.update_one(
-            {"_id": PyObjectId(order_id), "business_id": PyObjectId(business_id)},
-            {"$set": update_data}
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update order"
-            )
-            
-        return await get_order(business_id, order_id)
+        business_oid = PyObjectId(business_id)
+        
+        async def apply(session) -> None:
+            # reserve_stock gives back its own partial holds if it fails
+            await reserve_stock(db, business_oid, to_reserve, session)
+            try:
+                result = await db.orders.update_one(
+                    {
+                        "_id": existing_order.id,
+                        "business_id": business_oid,
+                        "status": OrderStatus.PENDING,
+                        "reserved": True if existing_order.reserved else {"$ne": True}
+                    },
+                    {"$set": update_data},
+                    session=session
+                )
+                if result.matched_count == 0:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="Order changed while it was being updated, please retry"
+                    )
+            except Exception:
+                if session is None:
+                    await release_stock(db, business_oid, to_reserve)
+                raise
+            # Only given back once the order no longer claims them, so there is nothing to re-take
+            await release_stock(db, business_oid, to_release, session)
+        
+        await run_in_transaction(db, apply)
+        schedule_low_stock_check(db, business_oid, [*to_reserve, *to_release])
+        return existing_order.model_copy(update={**update_data, "items": detailed_items})
         
     except HTTPException:
         raise
@@ -330,13 +698,15 @@ async def update_order(business_id: str, order_id: str, order: OrderCreate) -> O
             detail=f"Failed to update order: {str(e)}"
         )
 
-async def cancel_order(business_id: str, order_id: str) -> OrderModel:
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_NAME]
+async def cancel_order(business_id: str, order_id: str, db=None) -> OrderModel:
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
     
     try:
         # Get the order
-        order = await get_order(business_id, order_id)
+        order = await get_order(business_id, order_id, db)
         if not order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -349,24 +719,36 @@ async def cancel_order(business_id: str, order_id: str) -> OrderModel:
                 detail="Can only cancel pending orders"
             )
         
-        # Update order status
-        result = await db.orders.update_one(
-            {"_id": PyObjectId(order_id), "business_id": PyObjectId(business_id)},
-            {
-                "$set": {
-                    "status": OrderStatus.CANCELLED,
-                    "completed_at": datetime.utcnow()
-                }
-            }
-        )
+        business_oid = PyObjectId(business_id)
+        cancelled_at = datetime.utcnow()
         
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to cancel order"
+        async def apply(session) -> None:
+            # Update order status; the document as it was says whether stock is still held
+            previous = await db.orders.find_one_and_update(
+                {"_id": order.id, "business_id": business_oid, "status": OrderStatus.PENDING},
+                {"$set": {
+                    "status": OrderStatus.CANCELLED,
+                    "completed_at": cancelled_at,
+                    "reserved": False
+                }},
+                projection={"reserved": 1},
+                session=session
             )
-        
-        return await get_order(business_id, order_id)
+            if previous is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Order is no longer pending"
+                )
+            if previous.get("reserved"):
+                await release_stock(db, business_oid, required_quantities(order.items), session)
+        
+        await run_in_transaction(db, apply)
+        schedule_low_stock_check(db, business_oid, [item.product_id for item in order.items])
+        return order.model_copy(update={
+            "status": OrderStatus.CANCELLED,
+            "completed_at": cancelled_at,
+            "reserved": False
+        })
         
     except HTTPException:
         raise
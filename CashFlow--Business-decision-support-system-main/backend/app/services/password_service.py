@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+from passlib.context import CryptContext
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Hashes created with a different bcrypt cost are flagged for rehash on the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt takes ~100-300 ms of CPU per call, so it runs on a dedicated pool
+# instead of the event loop. The semaphore bounds how many calls are queued
+# or running at once; callers above the cap wait here without blocking the loop.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+_semaphore: Optional[asyncio.Semaphore] = None
+
+PASSWORD_HASH_METRICS: Dict[str, Any] = {
+    "hash_calls": 0,
+    "verify_calls": 0,
+    "rehashes": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+    "waiting": 0,
+    "max_waiting": 0,
+    "total_wait_ms": 0.0,
+    "total_run_ms": 0.0,
+    "max_run_ms": 0.0,
+}
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+    return _semaphore
+
+async def _run_limited(func, *args):
+    """Run a blocking hash function on the pool, respecting the concurrency cap"""
+    metrics = PASSWORD_HASH_METRICS
+    queued_at = time.perf_counter()
+    
+    metrics["waiting"] += 1
+    metrics["max_waiting"] = max(metrics["max_waiting"], metrics["waiting"])
+    async with _get_semaphore():
+        metrics["waiting"] -= 1
+        started_at = time.perf_counter()
+        metrics["total_wait_ms"] += (started_at - queued_at) * 1000
+        metrics["in_flight"] += 1
+        metrics["max_in_flight"] = max(metrics["max_in_flight"], metrics["in_flight"])
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_executor, func, *args)
+        finally:
+            metrics["in_flight"] -= 1
+            run_ms = (time.perf_counter() - started_at) * 1000
+            metrics["total_run_ms"] += run_ms
+            metrics["max_run_ms"] = max(metrics["max_run_ms"], run_ms)
+
+async def hash_password(password: str) -> str:
+    """Hash a password with the current bcrypt cost, off the event loop"""
+    PASSWORD_HASH_METRICS["hash_calls"] += 1
+    return await _run_limited(pwd_context.hash, password)
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password, off the event loop.
+    
+    Returns:
+        (valid, new_hash) - new_hash is set when the stored hash uses outdated
+        cost parameters and should be replaced
+    """
+    PASSWORD_HASH_METRICS["verify_calls"] += 1
+    try:
+        valid, new_hash = await _run_limited(pwd_context.verify_and_update, password, hashed_password)
+    except (ValueError, TypeError) as e:
+        # Malformed or unknown hash format
+        logger.warning(f"Password hash could not be verified: {str(e)}")
+        return False, None
+    
+    if valid and new_hash:
+        PASSWORD_HASH_METRICS["rehashes"] += 1
+    return valid, new_hash
+
+def get_password_hash_metrics() -> Dict[str, Any]:
+    """Snapshot of password hashing counters and timings"""
+    metrics = dict(PASSWORD_HASH_METRICS)
+    calls = metrics["hash_calls"] + metrics["verify_calls"]
+    metrics["avg_wait_ms"] = round(metrics["total_wait_ms"] / calls, 2) if calls else 0.0
+    metrics["avg_run_ms"] = round(metrics["total_run_ms"] / calls, 2) if calls else 0.0
+    metrics["workers"] = settings.PASSWORD_HASH_WORKERS
+    metrics["concurrency_limit"] = settings.PASSWORD_HASH_CONCURRENCY
+    metrics["bcrypt_rounds"] = settings.BCRYPT_ROUNDS
+    return metrics
@@ -0,0 +1,358 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.concurrency import run_in_threadpool
+from app.models.reorder import ReorderRecommendation, ReorderPage, ReorderUrgency
+from app.models.base import PyObjectId
+from app.services.prediction_service import load_model
+from config import settings
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import pandas as pd
+import numpy as np
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+HORIZON_DAYS = {"daily": 1, "weekly": 7, "monthly": 30}
+HISTORY_DAYS = 365
+COUNTED_SALE_STATUSES = ["completed", "partial_refunded"]
+URGENCY_ORDER = {ReorderUrgency.CRITICAL: 0, ReorderUrgency.REORDER: 1, ReorderUrgency.OK: 2}
+
+# Model feature columns, as produced by prediction_service.prepare_features
+NUMERIC_FEATURES = [
+    "year", "month", "day", "dayofweek", "quarter",
+    "is_month_start", "is_month_end", "is_weekend",
+    "sales_last_7_days", "sales_last_30_days",
+    "quantity_last_7_days", "quantity_last_30_days",
+    "days_since_last_sale", "sales_trend",
+    "prev_day_quantity", "prev_week_quantity"
+]
+
+# Background refreshes in flight, one per business
+_refreshing: Dict[str, asyncio.Task] = {}
+
+async def ensure_reorder_indexes(db) -> None:
+    await db.reorder_recommendations.create_index([("business_id", 1), ("run_id", 1), ("rank", 1)])
+
+async def _load_products(db, business_oid: PyObjectId) -> pd.DataFrame:
+    categories = {
+        doc["_id"]: doc["name"].title()
+        async for doc in db.categories.find({"business_id": business_oid}, {"name": 1})
+    }
+    rows = [
+        {
+            "product_id": str(doc["_id"]),
+            "product_name": doc["name"].title(),
+            "sku": doc.get("sku"),
+            "category": categories.get(doc.get("category_id"), "Uncategorized"),
+            # Stock held by pending orders is already spoken for
+            "current_stock": int(doc.get("quantity", 0)) - int(doc.get("reserved", 0)),
+            "price": float(doc.get("price", 0))
+        }
+        async for doc in db.inventory.find(
+            {"business_id": business_oid},
+            {"name": 1, "sku": 1, "category_id": 1, "quantity": 1, "reserved": 1, "price": 1}
+        )
+    ]
+    return pd.DataFrame(rows, columns=["product_id", "product_name", "sku", "category", "current_stock", "price"])
+
+async def _load_sales_history(db, business_oid: PyObjectId, today: datetime) -> pd.DataFrame:
+    """Per-product quantity/sales windows in one aggregation over the last year"""
+    day = timedelta(days=1)
+    since = {name: today - timedelta(days=days) for name, days in (("d7", 7), ("d30", 30))}
+    prev_day = (today - day, today)
+    prev_week = (today - timedelta(days=7), today - timedelta(days=6))
+    
+    def window_sum(field: str, start: datetime, end: Optional[datetime] = None) -> Dict:
+        conditions = [{"$gte": ["$timestamp", start]}]
+        if end is not None:
+            conditions.append({"$lt": ["$timestamp", end]})
+        return {"$sum": {"$cond": [{"$and": conditions}, f"$items.{field}", 0]}}
+    
+    pipeline = [
+        {"$match": {
+            "business_id": business_oid,
+            "status": {"$in": COUNTED_SALE_STATUSES},
+            "timestamp": {"$gte": today - timedelta(days=HISTORY_DAYS)}
+        }},
+        {"$project": {"timestamp": 1, "items.product_id": 1, "items.quantity": 1, "items.subtotal": 1}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.product_id",
+            "quantity_last_7_days": window_sum("quantity", since["d7"]),
+            "quantity_last_30_days": window_sum("quantity", since["d30"]),
+            "sales_last_7_days": window_sum("subtotal", since["d7"]),
+            "sales_last_30_days": window_sum("subtotal", since["d30"]),
+            "prev_day_quantity": window_sum("quantity", *prev_day),
+            "prev_week_quantity": window_sum("quantity", *prev_week),
+            "last_sale": {"$max": "$timestamp"}
+        }}
+    ]
+    rows = []
+    async for row in db.sales.aggregate(pipeline):
+        row["product_id"] = str(row.pop("_id"))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def _build_features(products: pd.DataFrame, history: pd.DataFrame, today: datetime) -> pd.DataFrame:
+    """Feature frame for every product at once (same columns as prepare_features)"""
+    df = products[["product_id", "category"]].copy()
+    if not history.empty:
+        df = df.merge(history, on="product_id", how="left")
+    
+    for column in ("sales_last_7_days", "sales_last_30_days", "quantity_last_7_days",
+                   "quantity_last_30_days", "prev_day_quantity", "prev_week_quantity"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0) if column in df else 0.0
+    
+    last_sale = pd.to_datetime(df["last_sale"]) if "last_sale" in df else pd.Series(pd.NaT, index=df.index)
+    df["days_since_last_sale"] = (
+        (pd.Timestamp(today) - last_sale).dt.days.clip(upper=365).fillna(999)
+    )
+    df["sales_trend"] = np.where(
+        df["sales_last_30_days"] > 0,
+        (df["sales_last_7_days"] * (30 / 7) - df["sales_last_30_days"]) / df["sales_last_30_days"].where(df["sales_last_30_days"] > 0, 1),
+        0
+    )
+    
+    stamp = pd.Timestamp(today)
+    df["year"] = stamp.year
+    df["month"] = stamp.month
+    df["day"] = stamp.day
+    df["dayofweek"] = stamp.weekday()
+    df["quarter"] = (stamp.month - 1) // 3 + 1
+    df["is_month_start"] = int(stamp.day == 1)
+    df["is_month_end"] = int(stamp.day == stamp.days_in_month)
+    df["is_weekend"] = int(stamp.weekday() >= 5)
+    return df[["product_id", "category"] + NUMERIC_FEATURES]
+
+def _compute_recommendations(
+    products: pd.DataFrame,
+    features: pd.DataFrame,
+    models: Dict[str, Any],
+    threshold: int,
+    lead_time_days: int,
+    target_cover_days: int
+) -> pd.DataFrame:
+    """One vectorized pass: forecasts for every horizon, demand, cover and reorder quantities"""
+    df = products.reset_index(drop=True).copy()
+    
+    rates = []
+    for horizon, model in models.items():
+        try:
+            predicted = np.clip(np.asarray(model.predict(features), dtype=float), 0, None)
+        except Exception as e:
+            logger.error(f"Batch prediction failed for {horizon} model: {e}")
+            continue
+        df[f"forecast_{horizon}"] = predicted
+        rates.append(predicted / HORIZON_DAYS[horizon])
+    
+    history_rate = features["quantity_last_30_days"].to_numpy(dtype=float) / 30
+    if rates:
+        df["daily_demand"] = np.mean(np.vstack(rates), axis=0)
+        df["demand_source"] = "model"
+    else:
+        df["daily_demand"] = history_rate
+        df["demand_source"] = "history"
+    
+    demand = df["daily_demand"].to_numpy()
+    stock = df["current_stock"].to_numpy(dtype=float)
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(demand > 0, stock / demand, np.inf)
+    df["days_of_cover"] = cover
+    df["reorder_point"] = demand * lead_time_days + threshold
+    df["target_stock"] = demand * (lead_time_days + target_cover_days) + threshold
+    df["suggested_quantity"] = np.where(
+        stock <= df["reorder_point"].to_numpy(),
+        np.ceil(np.clip(df["target_stock"].to_numpy() - stock, 0, None)),
+        0
+    ).astype(int)
+    df["suggested_cost"] = (df["suggested_quantity"] * df["price"]).round(2)
+    df["urgency"] = np.select(
+        [(cover < lead_time_days) | (stock <= threshold), df["suggested_quantity"] > 0],
+        [ReorderUrgency.CRITICAL.value, ReorderUrgency.REORDER.value],
+        default=ReorderUrgency.OK.value
+    )
+    
+    df["urgency_rank"] = df["urgency"].map({u.value: rank for u, rank in URGENCY_ORDER.items()})
+    return df.sort_values(["urgency_rank", "days_of_cover", "product_name"]).reset_index(drop=True)
+
+async def refresh_reorder_recommendations(business_id: str, db=None) -> Dict[str, Any]:
+    """
+    Recompute and materialize reorder recommendations for every product.
+    
+    Products and a one-aggregation sales summary are loaded, each horizon's
+    model predicts for the whole catalog in one call, and the results are
+    written under a new run id before the business's pointer is switched, so
+    readers never see a half-written set.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    started = datetime.utcnow()
+    
+    settings_doc = await db.settings.find_one({"business_id": business_oid}, {"low_stock_threshold": 1}) or {}
+    threshold = int(settings_doc.get("low_stock_threshold", 10))
+    lead_time_days = settings.REORDER_LEAD_TIME_DAYS
+    target_cover_days = settings.REORDER_TARGET_COVER_DAYS
+    
+    products = await _load_products(db, business_oid)
+    run_id = PyObjectId()
+    
+    if not products.empty:
+        history = await _load_sales_history(db, business_oid, today)
+        models = {}
+        for horizon in HORIZON_DAYS:
+            model = await load_model(business_id, horizon)
+            if model is not None:
+                models[horizon] = model
+        
+        def compute() -> pd.DataFrame:
+            features = _build_features(products, history, today)
+            return _compute_recommendations(products, features, models, threshold, lead_time_days, target_cover_days)
+        
+        result = await run_in_threadpool(compute)
+        
+        docs = []
+        for rank, row in enumerate(result.itertuples(index=False)):
+            cover = float(row.days_of_cover)
+            docs.append({
+                "business_id": business_oid,
+                "run_id": run_id,
+                "rank": rank,
+                "product_id": row.product_id,
+                "product_name": row.product_name,
+                "sku": row.sku,
+                "category": row.category,
+                "current_stock": int(row.current_stock),
+                "daily_demand": round(float(row.daily_demand), 3),
+                "forecast": {
+                    horizon: round(float(getattr(row, f"forecast_{horizon}")), 2)
+                    for horizon in models if hasattr(row, f"forecast_{horizon}")
+                },
+                "days_of_cover": round(cover, 1) if np.isfinite(cover) else None,
+                "reorder_point": round(float(row.reorder_point), 2),
+                "target_stock": round(float(row.target_stock), 2),
+                "suggested_quantity": int(row.suggested_quantity),
+                "suggested_cost": float(row.suggested_cost),
+                "urgency": row.urgency,
+                "demand_source": row.demand_source
+            })
+        for i in range(0, len(docs), 1000):
+            await db.reorder_recommendations.insert_many(docs[i:i + 1000], ordered=False)
+        summary = result["urgency"].value_counts().to_dict()
+    else:
+        summary = {}
+    
+    previous = await db.reorder_runs.find_one_and_update(
+        {"business_id": business_oid},
+        {"$set": {
+            "run_id": run_id,
+            "generated_at": datetime.utcnow(),
+            "lead_time_days": lead_time_days,
+            "target_cover_days": target_cover_days,
+            "low_stock_threshold": threshold,
+            "products": len(products),
+            "summary": summary
+        }},
+        upsert=True
+    )
+    if previous and previous.get("run_id"):
+        await db.reorder_recommendations.delete_many({"business_id": business_oid, "run_id": previous["run_id"]})
+    
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    logger.info(f"Reorder recommendations for {business_id}: {len(products)} products in {elapsed:.2f}s")
+    return {"success": True, "products": len(products), "summary": summary, "elapsed_seconds": round(elapsed, 3)}
+
+def schedule_reorder_refresh(db, business_id: str) -> None:
+    """Refresh recommendations in the background (at most one run per business at a time)"""
+    key = str(business_id)
+    running = _refreshing.get(key)
+    if running and not running.done():
+        return
+    
+    async def run():
+        try:
+            await refresh_reorder_recommendations(key, db)
+        except Exception as e:
+            logger.error(f"Reorder refresh failed for business {key}: {e}")
+    
+    _refreshing[key] = asyncio.create_task(run())
+
+async def refresh_stale_reorder_recommendations(db) -> int:
+    """Refresh businesses with sales newer than their last run"""
+    refreshed = 0
+    async for business in db.businesses.find({}, {"_id": 1}):
+        run = await db.reorder_runs.find_one({"business_id": business["_id"]}, {"generated_at": 1})
+        query = {"business_id": business["_id"]}
+        if run:
+            query["timestamp"] = {"$gt": run["generated_at"]}
+        if await db.sales.find_one(query, {"_id": 1}):
+            await refresh_reorder_recommendations(str(business["_id"]), db)
+            refreshed += 1
+    return refreshed
+
+async def run_reorder_refresh_loop(db) -> None:
+    """Background task: keep recommendations current as sales come in"""
+    while True:
+        try:
+            count = await refresh_stale_reorder_recommendations(db)
+            if count:
+                logger.info(f"Refreshed reorder recommendations for {count} businesses")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Reorder refresh loop error: {e}")
+        await asyncio.sleep(settings.REORDER_REFRESH_INTERVAL_MINUTES * 60)
+
+async def get_reorder_recommendations(
+    business_id: str,
+    urgency: Optional[ReorderUrgency] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db=None
+) -> ReorderPage:
+    """Read the materialized recommendations, most urgent first"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    run = await db.reorder_runs.find_one({"business_id": business_oid})
+    if not run:
+        return ReorderPage(
+            lead_time_days=settings.REORDER_LEAD_TIME_DAYS,
+            target_cover_days=settings.REORDER_TARGET_COVER_DAYS,
+            low_stock_threshold=0,
+            items=[]
+        )
+    
+    query: Dict[str, Any] = {"business_id": business_oid, "run_id": run["run_id"]}
+    if urgency:
+        query["urgency"] = urgency.value
+    if cursor:
+        try:
+            query["rank"] = {"$gt": int(cursor)}
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    
+    docs = await db.reorder_recommendations.find(query, {"_id": 0}).sort("rank", 1).limit(limit + 1).to_list(None)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return ReorderPage(
+        generated_at=run.get("generated_at"),
+        lead_time_days=run.get("lead_time_days", settings.REORDER_LEAD_TIME_DAYS),
+        target_cover_days=run.get("target_cover_days", settings.REORDER_TARGET_COVER_DAYS),
+        low_stock_threshold=run.get("low_stock_threshold", 0),
+        items=[ReorderRecommendation.model_validate(doc) for doc in docs],
+        next_cursor=str(docs[-1]["rank"]) if has_more else None
+    )
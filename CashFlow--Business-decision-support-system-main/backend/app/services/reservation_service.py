@@ -0,0 +1,133 @@
+from fastapi import HTTPException, status
+from pymongo import UpdateOne
+from app.models.base import PyObjectId
+from app.database import run_in_transaction
+from config import settings
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stock not held by pending orders, for use in $expr
+AVAILABLE_EXPR = {"$subtract": ["$quantity", {"$ifNull": ["$reserved", 0]}]}
+
+def required_quantities(items: Iterable[Any]) -> Dict[Any, int]:
+    """Total quantity per product (an order may list a product more than once)"""
+    required: Dict[Any, int] = {}
+    for item in items:
+        product_id = PyObjectId(str(item.product_id))
+        required[product_id] = required.get(product_id, 0) + item.quantity
+    return required
+
+def available_guard(quantity: int) -> Dict[str, Any]:
+    """Filter clause matching products with at least `quantity` unreserved"""
+    return {"$expr": {"$gte": [AVAILABLE_EXPR, quantity]}}
+
+def reserved_guard(quantity: int) -> Dict[str, Any]:
+    """Filter clause matching products whose reservations fit within `quantity` on hand"""
+    return {"reserved": {"$not": {"$gt": quantity}}}
+
+def reservation_expiry(delivery_date: datetime) -> datetime:
+    """Reservations are held until the delivery date plus a grace period"""
+    if delivery_date.tzinfo is not None:
+        delivery_date = delivery_date.replace(tzinfo=None) - (delivery_date.utcoffset() or timedelta())
+    return max(delivery_date, datetime.utcnow()) + timedelta(hours=settings.ORDER_RESERVATION_GRACE_HOURS)
+
+async def reserve_stock(db, business_id: PyObjectId, required: Dict[Any, int], session=None) -> None:
+    """
+    Hold `required` units of each product for a pending order.
+    
+    Each product is reserved with one conditional $inc that only matches while
+    enough unreserved stock remains, so concurrent orders can't oversubscribe.
+    If any product falls short the holds already taken are given back.
+    """
+    reserved: Dict[Any, int] = {}
+    try:
+        for product_id, quantity in required.items():
+            result = await db.inventory.update_one(
+                {"_id": product_id, "business_id": business_id, **available_guard(quantity)},
+                {"$inc": {"reserved": quantity}},
+                session=session
+            )
+            if result.matched_count == 0:
+                product = await db.inventory.find_one(
+                    {"_id": product_id, "business_id": business_id},
+                    {"name": 1, "quantity": 1, "reserved": 1},
+                    session=session
+                )
+                if not product:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Product with ID {product_id} not found"
+                    )
+                available = product.get("quantity", 0) - product.get("reserved", 0)
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Insufficient quantity for {product['name'].title()}. Available: {max(available, 0)}, Requested: {quantity}"
+                )
+            reserved[product_id] = quantity
+    except Exception:
+        # Inside a transaction this is rolled back anyway; without one it undoes the partial hold
+        if reserved:
+            await release_stock(db, business_id, reserved, session)
+        raise
+
+async def release_stock(db, business_id: PyObjectId, held: Dict[Any, int], session=None) -> None:
+    """Give back units held for an order (never taking reserved below zero)"""
+    if not held:
+        return
+    operations = [
+        UpdateOne(
+            {"_id": product_id, "business_id": business_id},
+            [{"$set": {"reserved": {"$max": [0, {"$subtract": [{"$ifNull": ["$reserved", 0]}, quantity]}]}}}]
+        )
+        for product_id, quantity in held.items()
+    ]
+    await db.inventory.bulk_write(operations, ordered=False, session=session)
+
+async def release_expired_reservations(db, now: Optional[datetime] = None) -> int:
+    """Release the stock held by pending orders whose reservation has expired"""
+    now = now or datetime.utcnow()
+    released = 0
+    
+    async for order in db.orders.find(
+        {"status": "pending", "reserved": True, "reservation_expires_at": {"$lt": now}},
+        {"business_id": 1, "items.product_id": 1, "items.quantity": 1}
+    ):
+        async def release(session, order=order) -> bool:
+            # The flag flip is the guard: only one sweeper or cancel releases an order
+            result = await db.orders.update_one(
+                {"_id": order["_id"], "status": "pending", "reserved": True},
+                {"$set": {"reserved": False}},
+                session=session
+            )
+            if result.modified_count == 0:
+                return False
+            held: Dict[Any, int] = {}
+            for item in order.get("items", []):
+                held[item["product_id"]] = held.get(item["product_id"], 0) + item["quantity"]
+            await release_stock(db, order["business_id"], held, session)
+            return True
+        
+        try:
+            if await run_in_transaction(db, release):
+                released += 1
+        except Exception as e:
+            logger.error(f"Failed to release reservation for order {order['_id']}: {str(e)}")
+    
+    return released
+
+async def run_reservation_sweep_loop(db) -> None:
+    """Background task: release reservations of pending orders past their expiry"""
+    while True:
+        try:
+            count = await release_expired_reservations(db)
+            if count:
+                logger.info(f"Released stock reservations for {count} expired orders")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Reservation sweep error: {str(e)}")
+        await asyncio.sleep(settings.ORDER_RESERVATION_SWEEP_MINUTES * 60)
@@ -6,6 +6,14 @@ from app.models.sale import (
     PaymentMethod, SaleStatus
 )
 from app.models.base import PyObjectId
+from app.services.customer_service import record_customer_purchase, record_customer_refund
+from app.services.stock_service import stock_movement, record_stock_movements
+from app.services.alert_service import schedule_low_stock_check
+from app.services.reservation_service import required_quantities, available_guard
+from app.services.till_service import record_till_sale, record_till_refund, log_till_failure
+from app.database import run_in_transaction, run_migration_once
+from app.models.stock import StockMovementType
+from pymongo import ReturnDocument
 from config import settings
 from datetime import datetime
 from typing import List, Optional, Dict, Tuple
@@ -13,6 +21,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+async def ensure_sale_indexes(db) -> None:
+    await db.sales.create_index([("business_id", 1), ("timestamp", -1)])
+    await db.refunds.create_index([("business_id", 1), ("timestamp", -1)])
+    await db.refunds.create_index([("business_id", 1), ("sale_id", 1)])
+    await run_migration_once(db, "sale_refunded_quantities", backfill_refunded_quantities)
+
 async def get_default_tax_rate(db, business_id: str) -> float:
     """Get default tax rate from business settings"""
     try:
@@ -29,62 +43,70 @@ async def get_default_tax_rate(db, business_id: str) -> float:
         return 0
 
 async def validate_products_and_quantities(db, business_id: str, items: List[SaleItemCreate]) -> List[SaleItemModel]:
-    """Validate products exist and have sufficient quantity"""
-    detailed_items = []
+    """
+    Validate products exist and have sufficient available quantity (stock
+    not reserved by pending orders). Products and categories are each read
+    with one query.
+    """
     business_id_obj = PyObjectId(business_id)
     
-    for item in items:
-        try:
-            # Convert string ID to PyObjectId
-            product_id = PyObjectId(item.product_id)
-            
-            product = await db.inventory.find_one({
-                "_id": product_id,
-                "business_id": business_id_obj
-            })
-            
-            if not product:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Product with ID {item.product_id} not found in your inventory"
-                )
-                
-            if product["quantity"] < item.quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Insufficient quantity for {product['name'].title()}. Available: {product['quantity']}, Requested: {item.quantity}"
-                )
-            
-            # Get category information
-            category = await db.categories.find_one({
-                "_id": product["category_id"],
-                "business_id": business_id_obj
-            })
-            
-            if not category:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Category not found for product {product['name'].title()}"
-                )
-                
-            detailed_items.append(SaleItemModel(
-                product_id=product_id,
-                category_id=product["category_id"],
-                quantity=item.quantity,
-                unit_price=product["price"],
-                subtotal=product["price"] * item.quantity,
-                product_name=product["name"].title(),
-                category_name=category["name"].title()
-            ))
-            
-        except HTTPException:
-            raise
-        except Exception as e:
+    try:
+        required = required_quantities(items)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid product ID format: {str(e)}"
+        )
+    
+    products = {
+        doc["_id"]: doc
+        async for doc in db.inventory.find(
+            {"_id": {"$in": list(required)}, "business_id": business_id_obj},
+            {"name": 1, "price": 1, "quantity": 1, "reserved": 1, "category_id": 1}
+        )
+    }
+    categories = {
+        doc["_id"]: doc
+        async for doc in db.categories.find(
+            {"_id": {"$in": list({p["category_id"] for p in products.values()})}, "business_id": business_id_obj},
+            {"name": 1}
+        )
+    }
+    
+    for product_id, quantity in required.items():
+        product = products.get(product_id)
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product with ID {product_id} not found in your inventory"
+            )
+        
+        available = product["quantity"] - product.get("reserved", 0)
+        if available < quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient quantity for {product['name'].title()}. Available: {max(available, 0)}, Requested: {quantity}"
+            )
+        
+        if product["category_id"] not in categories:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid product ID format: {str(e)}"
+                detail=f"Category not found for product {product['name'].title()}"
             )
     
+    detailed_items = []
+    for item in items:
+        product = products[PyObjectId(item.product_id)]
+        detailed_items.append(SaleItemModel(
+            product_id=product["_id"],
+            category_id=product["category_id"],
+            quantity=item.quantity,
+            unit_price=product["price"],
+            subtotal=product["price"] * item.quantity,
+            product_name=product["name"].title(),
+            category_name=categories[product["category_id"]]["name"].title()
+        ))
+    
     return detailed_items
 
 async def calculate_sale_totals(
@@ -107,31 +129,74 @@ async def calculate_sale_totals(
     
     return subtotal, tax, discount, total_amount
 
-async def update_inventory_quantities(db, items: List[SaleItemModel], is_refund: bool = False):
-    """Update inventory quantities for sale or refund"""
-    for item in items:
-        quantity_change = item.quantity if is_refund else -item.quantity
-        result = await db.inventory.update_one(
-            {
-                "_id": item.product_id,
-                "quantity": {"$gte": -quantity_change if quantity_change < 0 else 0}
-            },
-            {"$inc": {"quantity": quantity_change}}
-        )
-        
-        if result.modified_count == 0:
-            # Check if product still exists
-            product = await db.inventory.find_one({"_id": item.product_id})
-            if not product:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Product {item.product_name} no longer exists"
-                )
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Insufficient quantity for {item.product_name}"
-                )
+async def revert_inventory_changes(db, movements: List[Dict]) -> None:
+    """Undo stock changes applied outside a transaction (one $inc per movement)"""
+    for movement in movements:
+        try:
+            await db.inventory.update_one(
+                {"_id": movement["product_id"]},
+                {"$inc": {"quantity": -movement["delta"]}}
+            )
+        except Exception as e:
+            logger.error(f"Failed to restore stock for product {movement['product_id']}: {str(e)}")
+
+async def update_inventory_quantities(
+    db,
+    items: List[SaleItemModel],
+    is_refund: bool = False,
+    reference_id=None,
+    session=None
+) -> List[Dict]:
+    """
+    Update inventory quantities for sale or refund and return the stock
+    ledger movements describing the changes, for the caller to record with
+    the document they reference.
+    
+    If an item fails, changes already applied are undone before the error
+    is raised when there's no transaction to roll them back.
+    """
+    movement_type = StockMovementType.REFUND if is_refund else StockMovementType.SALE
+    movements = []
+    
+    try:
+        for item in items:
+            quantity_change = item.quantity if is_refund else -item.quantity
+            query = {"_id": item.product_id}
+            if not is_refund:
+                # Sales may only take stock that pending orders haven't reserved
+                query.update(available_guard(item.quantity))
+            updated = await db.inventory.find_one_and_update(
+                query,
+                {"$inc": {"quantity": quantity_change}},
+                projection={"business_id": 1, "quantity": 1},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            
+            if updated is None:
+                # Check if product still exists
+                product = await db.inventory.find_one({"_id": item.product_id}, session=session)
+                if not product:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Product {item.product_name} no longer exists"
+                    )
+                else:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Insufficient quantity for {item.product_name}"
+                    )
+            
+            movements.append(stock_movement(
+                updated["business_id"], item.product_id, movement_type,
+                quantity_change, updated["quantity"], reference_id
+            ))
+    except Exception:
+        if session is None:
+            await revert_inventory_changes(db, movements)
+        raise
+    
+    return movements
 
 async def create_sale(business_id: str, sale: SaleCreate, db=None) -> SaleModel:
     # Use provided db or create a new connection
@@ -192,12 +257,34 @@ async def create_sale(business_id: str, sale: SaleCreate, db=None) -> SaleModel:
             "notes": sale.notes.strip() if sale.notes else None
         }
         
-        # Update inventory
-        await update_inventory_quantities(db, detailed_items)
+        async def apply(session) -> List[Dict]:
+            # Update inventory, insert the sale and its ledger movements together
+            movements = await update_inventory_quantities(
+                db, detailed_items, reference_id=sale_doc["_id"], session=session
+            )
+            try:
+                await db.sales.insert_one(sale_doc, session=session)
+            except Exception:
+                if session is None:
+                    await revert_inventory_changes(db, movements)
+                raise
+            await record_stock_movements(db, movements, session=session)
+            try:
+                await record_till_sale(db, sale_doc, session)
+            except Exception as e:
+                if session is not None:
+                    raise
+                # Without a transaction the sale stands; the day's totals need a recompute
+                log_till_failure("sale", sale_doc, e)
+            return movements
         
-        # Insert sale
-        result = await db.sales.insert_one(sale_doc)
-        return await get_sale(business_id, str(result.inserted_id), db)
+        movements = await run_in_transaction(db, apply)
+        schedule_low_stock_check(db, sale_doc["business_id"], [m["product_id"] for m in movements])
+        
+        if sale_doc["customer_id"]:
+            await record_customer_purchase(db, business_id, str(sale_doc["customer_id"]), sale_doc)
+        
+        return await get_sale(business_id, str(sale_doc["_id"]), db)
         
     except HTTPException:
         raise
@@ -308,50 +395,77 @@ async def get_sales(business_id: str, db=None) -> List[SaleModel]:
             detail=f"Error retrieving sales: {str(e)}"
         )
 
-async def validate_refund_items(
-    sale: SaleModel,
+async def revert_refund_counters(db, sale_doc: Dict, inc: Dict) -> None:
+    """Take back a refund's counter increments applied outside a transaction"""
+    try:
+        await db.sales.update_one(
+            {"_id": sale_doc["_id"]},
+            {
+                "$inc": {field: -value for field, value in inc.items()},
+                "$set": {"is_refunded": sale_doc.get("is_refunded", False), "status": sale_doc.get("status")}
+            }
+        )
+    except Exception as e:
+        logger.error(f"Failed to restore refund counters for sale {sale_doc['_id']}: {str(e)}")
+
+def allocate_refund_items(
+    sale_doc: Dict,
     refund_items: List[RefundItemCreate]
-) -> List[SaleItemModel]:
-    """Validate refund items against original sale"""
-    sale_items_map = {str(item.product_id): item for item in sale.items}
-    refund_items_list = []
-    
+) -> Tuple[Dict[int, int], List[SaleItemModel]]:
+    """
+    Validate refund items against what is still refundable on each sale line
+    (quantity - refunded_quantity). A product sold on several lines is
+    refunded from the first line with units left. Returns the units to add
+    to each line's refunded_quantity and the refunded items.
+    """
+    requested: Dict[str, int] = {}
     for item in refund_items:
-        try:
-            product_id = PyObjectId(item.product_id)
-            original_item = sale_items_map.get(str(product_id))
-            
-            if not original_item:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Product {item.product_id} not found in original sale"
-                )
-                
-            if item.quantity > original_item.quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Refund quantity exceeds purchased quantity for {original_item.product_name}"
-                )
-                
-            refund_items_list.append(SaleItemModel(
-                product_id=original_item.product_id,
-                category_id=original_item.category_id,
-                quantity=item.quantity,
-                unit_price=original_item.unit_price,
-                subtotal=original_item.unit_price * item.quantity,
-                product_name=original_item.product_name,
-                category_name=original_item.category_name
-            ))
-            
-        except HTTPException:
-            raise
-        except Exception as e:
+        if item.quantity <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid product ID format: {str(e)}"
+                detail="Refund quantities must be positive"
             )
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+    
+    lines = sale_doc.get("items", [])
+    allocations: Dict[int, int] = {}
+    refunded_items: List[SaleItemModel] = []
     
-    return refund_items_list
+    for product_id, quantity in requested.items():
+        matching = [(i, line) for i, line in enumerate(lines) if str(line["product_id"]) == product_id]
+        if not matching:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Product {product_id} not found in original sale"
+            )
+        
+        refundable = sum(line["quantity"] - line.get("refunded_quantity", 0) for _, line in matching)
+        if quantity > refundable:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Refund quantity exceeds refundable quantity for {matching[0][1]['product_name']}. Refundable: {refundable}, Requested: {quantity}"
+            )
+        
+        remaining = quantity
+        for index, line in matching:
+            take = min(remaining, line["quantity"] - line.get("refunded_quantity", 0))
+            if take <= 0:
+                continue
+            allocations[index] = take
+            refunded_items.append(SaleItemModel(
+                product_id=line["product_id"],
+                category_id=line["category_id"],
+                quantity=take,
+                unit_price=line["unit_price"],
+                subtotal=line["unit_price"] * take,
+                product_name=line["product_name"],
+                category_name=line["category_name"]
+            ))
+            remaining -= take
+            if not remaining:
+                break
+    
+    return allocations, refunded_items
 
 async def create_refund(
     business_id: str,
@@ -360,77 +474,157 @@ async def create_refund(
     processed_by: str,
     db=None
 ) -> RefundModel:
+    """
+    Refund part or all of a sale.
+    
+    In one transaction the sale is read once, the request is checked against
+    each line's refunded_quantity, the counters, refund_total and status are
+    updated with a guard on the counters that were read, stock is returned
+    and the refund is inserted. Concurrent refunds of the same line can't
+    both succeed. Without a transaction, the counters and stock already
+    changed are put back if a later step fails.
+    """
     # Use provided db or create a new connection
     if db is None:
         client = AsyncIOMotorClient(settings.MONGODB_URL)
         db = client[settings.MONGODB_NAME]
     
     try:
-        # Get and validate sale
-        sale = await get_sale(business_id, sale_id, db)
-        if not sale:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Sale not found"
-            )
+        business_oid = PyObjectId(business_id)
+        sale_oid = PyObjectId(sale_id)
         
-        if sale.is_refunded:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Sale already fully refunded"
+        async def apply(session) -> Tuple[Dict, Dict, List[Dict]]:
+            # Get and validate sale
+            sale_doc = await db.sales.find_one({"_id": sale_oid, "business_id": business_oid}, session=session)
+            if not sale_doc:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Sale not found"
+                )
+            
+            if sale_doc.get("is_refunded"):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Sale already fully refunded"
+                )
+            
+            # Validate refund items
+            allocations, refund_items = allocate_refund_items(sale_doc, refund.items)
+            
+            # Calculate refund amounts
+            refund_subtotal = sum(item.subtotal for item in refund_items)
+            
+            # Use the tax percentage from the original sale
+            tax_percentage = sale_doc.get("tax_percentage")
+            if tax_percentage is None:
+                taxable = sale_doc.get("subtotal", 0) - sale_doc.get("discount", 0)
+                tax_percentage = sale_doc.get("tax", 0) / taxable * 100 if taxable > 0 else 0
+            tax_refund = round(refund_subtotal * (tax_percentage / 100), 2)
+            
+            total_refund = round(refund_subtotal + tax_refund, 2)
+            
+            # Create refund document
+            refund_doc = {
+                "_id": PyObjectId(),
+                "business_id": business_oid,
+                "sale_id": sale_oid,
+                "items": [item.model_dump(exclude={"refunded_quantity"}) for item in refund_items],
+                "reason": refund.reason,
+                "subtotal": refund_subtotal,
+                "tax_refund": tax_refund,
+                "total_refund": total_refund,
+                "payment_method": refund.payment_method,
+                "notes": refund.notes.strip() if refund.notes else None,
+                "timestamp": datetime.utcnow(),
+                "processed_by": PyObjectId(processed_by)
+            }
+            
+            # Full refund once every line has been refunded completely
+            is_full_refund = all(
+                line.get("refunded_quantity", 0) + allocations.get(i, 0) >= line["quantity"]
+                for i, line in enumerate(sale_doc.get("items", []))
             )
-        
-        # Validate refund items
-        refund_items = await validate_refund_items(sale, refund.items)
-        
-        # Calculate refund amounts
-        refund_subtotal = sum(item.subtotal for item in refund_items)
-        
-        # Use the tax percentage from the original sale
-        tax_percentage = sale.tax_percentage if hasattr(sale, 'tax_percentage') else (sale.tax / sale.subtotal * 100)
-        tax_refund = round(refund_subtotal * (tax_percentage / 100), 2)
-        
-        total_refund = round(refund_subtotal + tax_refund, 2)
-        
-        # Create refund document
-        refund_doc = {
-            "_id": PyObjectId(),
-            "business_id": PyObjectId(business_id),
-            "sale_id": PyObjectId(sale_id),
-            "items": [item.model_dump() for item in refund_items],
-            "reason": refund.reason,
-            "subtotal": refund_subtotal,
-            "tax_refund": tax_refund,
-            "total_refund": total_refund,
-            "payment_method": refund.payment_method,
-            "notes": refund.notes.strip() if refund.notes else None,
-            "timestamp": datetime.utcnow(),
-            "processed_by": PyObjectId(processed_by)
-        }
-        
-        # Update inventory
-        await update_inventory_quantities(db, refund_items, is_refund=True)
-        
-        # Update sale status
-        is_full_refund = refund_subtotal == sale.subtotal
-        new_status = SaleStatus.REFUNDED if is_full_refund else SaleStatus.PARTIAL_REFUNDED
-        
-        await db.sales.update_one(
-            {"_id": PyObjectId(sale_id)},
-            {
-                "$set": {
-                    "is_refunded": is_full_refund,
-                    "status": new_status
-                }
+            new_status = SaleStatus.REFUNDED if is_full_refund else SaleStatus.PARTIAL_REFUNDED
+            
+            # Stock goes back to every product, so they all have to exist before anything is written
+            products = {
+                doc["_id"]
+                async for doc in db.inventory.find(
+                    {"_id": {"$in": [item.product_id for item in refund_items]}, "business_id": business_oid},
+                    {"_id": 1},
+                    session=session
+                )
             }
-        )
+            for item in refund_items:
+                if item.product_id not in products:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Product {item.product_name} no longer exists"
+                    )
+            
+            # Guarded on the counters read above so a concurrent refund is detected
+            guard: Dict = {"_id": sale_oid, "business_id": business_oid}
+            inc: Dict = {"refund_total": total_refund}
+            for index, quantity in allocations.items():
+                current = sale_doc["items"][index].get("refunded_quantity", 0)
+                guard[f"items.{index}.refunded_quantity"] = current if current else {"$in": [0, None]}
+                inc[f"items.{index}.refunded_quantity"] = quantity
+            
+            result = await db.sales.update_one(
+                guard,
+                {"$inc": inc, "$set": {"is_refunded": is_full_refund, "status": new_status}},
+                session=session
+            )
+            if result.matched_count == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Sale changed while the refund was being processed, please retry"
+                )
+            
+            # Return stock
+            movements = []
+            try:
+                for item in refund_items:
+                    updated = await db.inventory.find_one_and_update(
+                        {"_id": item.product_id, "business_id": business_oid},
+                        {"$inc": {"quantity": item.quantity}},
+                        projection={"quantity": 1},
+                        return_document=ReturnDocument.AFTER,
+                        session=session
+                    )
+                    if updated is None:
+                        raise HTTPException(
+                            status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Product {item.product_name} no longer exists"
+                        )
+                    movements.append(stock_movement(
+                        business_oid, item.product_id, StockMovementType.REFUND,
+                        item.quantity, updated["quantity"], refund_doc["_id"], refund_doc["timestamp"]
+                    ))
+                
+                await db.refunds.insert_one(refund_doc, session=session)
+            except Exception:
+                if session is None:
+                    await revert_inventory_changes(db, movements)
+                    await revert_refund_counters(db, sale_doc, inc)
+                raise
+            
+            await record_stock_movements(db, movements, session=session)
+            try:
+                await record_till_refund(db, refund_doc, session)
+            except Exception as e:
+                if session is not None:
+                    raise
+                log_till_failure("refund", refund_doc, e)
+            return sale_doc, refund_doc, movements
         
-        # Insert refund
-        result = await db.refunds.insert_one(refund_doc)
+        sale_doc, refund_doc, movements = await run_in_transaction(db, apply)
         
-        # Return created refund
-        refund_record = await db.refunds.find_one({"_id": result.inserted_id})
-        return RefundModel.model_validate(refund_record)
+        schedule_low_stock_check(db, business_oid, [m["product_id"] for m in movements])
+        if sale_doc.get("customer_id"):
+            await record_customer_refund(db, business_id, str(sale_doc["customer_id"]), refund_doc)
+        
+        return RefundModel.model_validate(refund_doc)
         
     except HTTPException:
         raise
@@ -440,6 +634,42 @@ async def create_refund(
             detail=f"Failed to create refund: {str(e)}"
         )
 
+async def backfill_refunded_quantities(db) -> int:
+    """
+    Derive refunded_quantity counters and refund_total for refunded sales
+    recorded before they were tracked on the sale, from their refunds.
+    Runs once as a startup migration.
+    """
+    updated = 0
+    async for sale in db.sales.find(
+        {"status": {"$in": [SaleStatus.REFUNDED.value, SaleStatus.PARTIAL_REFUNDED.value]}, "refund_total": {"$exists": False}},
+        {"items": 1}
+    ):
+        refunded: Dict[str, int] = {}
+        refund_total = 0.0
+        async for refund in db.refunds.find({"sale_id": sale["_id"]}, {"items": 1, "total_refund": 1}):
+            refund_total += refund.get("total_refund", 0)
+            for item in refund.get("items", []):
+                key = str(item["product_id"])
+                refunded[key] = refunded.get(key, 0) + item["quantity"]
+        
+        lines = sale.get("items", [])
+        for line in lines:
+            key = str(line["product_id"])
+            take = min(refunded.get(key, 0), line["quantity"])
+            line["refunded_quantity"] = take
+            refunded[key] = refunded.get(key, 0) - take
+        
+        await db.sales.update_one(
+            {"_id": sale["_id"]},
+            {"$set": {"items": lines, "refund_total": round(refund_total, 2)}}
+        )
+        updated += 1
+    
+    if updated:
+        print(f"Backfilled refunded quantities for {updated} sales")
+    return updated
+
 async def get_refunds(business_id: str, sale_id: str, db=None) -> List[RefundModel]:
     """Get all refunds for a specific sale"""
     # Use provided db or create a new connection
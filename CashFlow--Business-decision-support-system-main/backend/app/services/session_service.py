@@ -0,0 +1,234 @@
+from app.models.session import SessionModel, SessionInfo
+from app.models.user import UserInDB
+from app.models.base import PyObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from config import settings
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Tuple
+import hashlib
+import secrets
+import time
+
+# Session ids revoked in this process -> expiry timestamp, so access tokens
+# minted for them can be rejected before they expire on their own
+REVOKED_SESSION_IDS: Dict[str, float] = {}
+
+def _hash_secret(secret: str) -> str:
+    # Refresh secrets are 256-bit random values, so a fast digest is enough
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+def _split_refresh_token(refresh_token: str) -> Optional[Tuple[str, str]]:
+    """Refresh tokens are '<session_id>.<secret>'"""
+    session_id, _, secret = (refresh_token or "").partition(".")
+    if not secret or not PyObjectId.is_valid(session_id):
+        return None
+    return session_id, secret
+
+def _mark_session_revoked(session_id: str) -> None:
+    now = time.time()
+    REVOKED_SESSION_IDS[str(session_id)] = now + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    for sid in [s for s, exp in REVOKED_SESSION_IDS.items() if exp <= now]:
+        REVOKED_SESSION_IDS.pop(sid, None)
+
+def is_session_revoked(session_id: Optional[str]) -> bool:
+    """True if access tokens bound to this session should be rejected"""
+    return session_id is not None and str(session_id) in REVOKED_SESSION_IDS
+
+async def ensure_session_indexes(db) -> None:
+    # Expired sessions are removed by MongoDB itself
+    await db.sessions.create_index("expires_at", expireAfterSeconds=0)
+    await db.sessions.create_index([("business_id", 1), ("user_id", 1), ("last_used_at", -1)])
+
+async def create_session(
+    user: UserInDB,
+    user_agent: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    db=None
+) -> Tuple[str, SessionModel]:
+    """Start a session for a user and return (refresh_token, session)"""
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    secret = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    session = SessionModel(
+        business_id=user.business_id,
+        user_id=user.id,
+        token_hash=_hash_secret(secret),
+        token_version=user.token_version,
+        user_agent=(user_agent or "")[:256] or None,
+        ip_address=ip_address,
+        created_at=now,
+        last_used_at=now,
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    
+    session_dict = session.model_dump(by_alias=True)
+    session_dict["_id"] = session.id
+    session_dict["business_id"] = session.business_id
+    session_dict["user_id"] = session.user_id
+    await db.sessions.insert_one(session_dict)
+    
+    await _enforce_session_limit(db, user.business_id, user.id)
+    
+    return f"{session.id}.{secret}", session
+
+async def _enforce_session_limit(db, business_id, user_id) -> None:
+    """Drop the least recently used sessions beyond MAX_SESSIONS_PER_USER"""
+    stale = await db.sessions.find(
+        {"business_id": business_id, "user_id": user_id},
+        {"_id": 1}
+    ).sort("last_used_at", -1).skip(settings.MAX_SESSIONS_PER_USER).to_list(None)
+    
+    if stale:
+        ids = [doc["_id"] for doc in stale]
+        await db.sessions.delete_many({"_id": {"$in": ids}})
+        for session_id in ids:
+            _mark_session_revoked(session_id)
+
+async def rotate_session(refresh_token: str, db=None) -> Optional[Tuple[str, SessionModel]]:
+    """
+    Exchange a refresh token for a new one.
+    
+    The stored hash is swapped in a single conditional update, so a refresh
+    token can only be used once. Presenting an already rotated token is
+    treated as theft and ends the session. Returns (new_refresh_token, session)
+    or None if the token is not valid.
+    """
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    parts = _split_refresh_token(refresh_token)
+    if parts is None:
+        return None
+    session_id, secret = parts
+    
+    presented_hash = _hash_secret(secret)
+    new_secret = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    
+    updated = await db.sessions.find_one_and_update(
+        {
+            "_id": PyObjectId(session_id),
+            "token_hash": presented_hash,
+            "expires_at": {"$gt": now}
+        },
+        {
+            "$set": {
+                "token_hash": _hash_secret(new_secret),
+                "previous_hash": presented_hash,
+                "last_used_at": now
+            },
+            "$inc": {"rotation_count": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if updated is None:
+        reused = await db.sessions.find_one_and_delete(
+            {"_id": PyObjectId(session_id), "previous_hash": presented_hash},
+            projection={"_id": 1}
+        )
+        if reused:
+            print(f"Refresh token reuse detected, session {session_id} revoked")
+            _mark_session_revoked(session_id)
+        return None
+    
+    return f"{session_id}.{new_secret}", SessionModel(**updated)
+
+async def list_sessions(
+    business_id: str,
+    user_id: str,
+    current_session_id: Optional[str] = None,
+    db=None
+) -> List[SessionInfo]:
+    """List a user's active sessions, most recently used first"""
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    cursor = db.sessions.find(
+        {
+            "business_id": PyObjectId(business_id),
+            "user_id": PyObjectId(user_id),
+            "expires_at": {"$gt": datetime.utcnow()}
+        },
+        {"user_agent": 1, "ip_address": 1, "created_at": 1, "last_used_at": 1, "expires_at": 1}
+    ).sort("last_used_at", -1)
+    
+    return [
+        SessionInfo(
+            id=str(doc["_id"]),
+            user_agent=doc.get("user_agent"),
+            ip_address=doc.get("ip_address"),
+            created_at=doc["created_at"],
+            last_used_at=doc["last_used_at"],
+            expires_at=doc["expires_at"],
+            current=str(doc["_id"]) == str(current_session_id)
+        )
+        async for doc in cursor
+    ]
+
+async def revoke_session(business_id: str, user_id: str, session_id: str, db=None) -> bool:
+    """End one of a user's sessions"""
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    if not PyObjectId.is_valid(session_id):
+        return False
+    
+    result = await db.sessions.delete_one({
+        "_id": PyObjectId(session_id),
+        "business_id": PyObjectId(business_id),
+        "user_id": PyObjectId(user_id)
+    })
+    if result.deleted_count:
+        _mark_session_revoked(session_id)
+    return result.deleted_count > 0
+
+async def revoke_refresh_token(refresh_token: str, db=None) -> bool:
+    """End the session a refresh token belongs to (logout)"""
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    parts = _split_refresh_token(refresh_token)
+    if parts is None:
+        return False
+    session_id, secret = parts
+    
+    result = await db.sessions.delete_one({
+        "_id": PyObjectId(session_id),
+        "token_hash": _hash_secret(secret)
+    })
+    if result.deleted_count:
+        _mark_session_revoked(session_id)
+    return result.deleted_count > 0
+
+async def revoke_all_sessions(
+    business_id: str,
+    user_id: str,
+    except_session_id: Optional[str] = None,
+    db=None
+) -> int:
+    """End all of a user's sessions, optionally keeping the current one"""
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = {"business_id": PyObjectId(business_id), "user_id": PyObjectId(user_id)}
+    if except_session_id and PyObjectId.is_valid(except_session_id):
+        query["_id"] = {"$ne": PyObjectId(except_session_id)}
+    
+    ids = await db.sessions.distinct("_id", query)
+    if not ids:
+        return 0
+    
+    result = await db.sessions.delete_many({"_id": {"$in": ids}})
+    for session_id in ids:
+        _mark_session_revoked(session_id)
+    return result.deleted_count
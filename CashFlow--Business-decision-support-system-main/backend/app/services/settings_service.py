@@ -6,6 +6,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from config import settings
 from app.models.settings import SettingsUpdate, SettingsModel, DisplaySettings
 from app.models.base import PyObjectId
+from app.services.alert_service import reevaluate_low_stock
 from bson import ObjectId
 from typing import Optional, List, Dict, Any
 
@@ -164,6 +165,10 @@ async def update_settings(business_id: str, settings_update: SettingsUpdate, db=
         
         logger.info(f"Update result: matched={result.matched_count}, modified={result.modified_count}")
         
+        # Alert settings changed: crossings are re-checked against the new threshold
+        if {"low_stock_alerts", "low_stock_threshold"} & update_data.keys():
+            await reevaluate_low_stock(db, business_id)
+        
         # Get updated document
         updated_doc = await db.settings.find_one({"_id": settings_id})
         if not updated_doc:
@@ -0,0 +1,488 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from app.models.stock import (
+    StockAdjustmentMode, StockAdjustmentRequest, StockAdjustmentModel,
+    StockAdjustmentSummary, StockAdjustmentPage, StockVarianceLine,
+    StockMovementType, StockMovementModel, StockMovementPage, StockLevel
+)
+from app.models.base import PyObjectId
+from app.database import run_in_transaction
+from app.services.alert_service import schedule_low_stock_check
+from app.services.reservation_service import reserved_guard
+from config import settings
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def ensure_stock_indexes(db) -> None:
+    await db.stock_adjustments.create_index([("business_id", 1), ("_id", -1)])
+    await db.stock_movements.create_index([("business_id", 1), ("product_id", 1), ("timestamp", -1)])
+    await db.stock_movements.create_index([("business_id", 1), ("timestamp", -1)])
+    await db.stock_snapshots.create_index([("business_id", 1), ("timestamp", -1)])
+
+def stock_movement(
+    business_id,
+    product_id,
+    movement_type: StockMovementType,
+    delta: int,
+    quantity_after: int,
+    reference_id=None,
+    timestamp: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Build a stock_movements document"""
+    return {
+        "_id": PyObjectId(),
+        "business_id": PyObjectId(str(business_id)),
+        "product_id": PyObjectId(str(product_id)),
+        "type": movement_type.value,
+        "delta": int(delta),
+        "quantity_after": int(quantity_after),
+        "reference_id": PyObjectId(str(reference_id)) if reference_id else None,
+        "timestamp": timestamp or datetime.utcnow()
+    }
+
+async def record_stock_movements(db, movements: List[Dict[str, Any]], session=None) -> None:
+    """
+    Append movements to the ledger.
+    
+    Outside a transaction a failed ledger write is logged rather than raised,
+    since the stock change it describes has already happened.
+    """
+    if not movements:
+        return
+    if session is not None:
+        await db.stock_movements.insert_many(movements, ordered=False, session=session)
+        return
+    try:
+        await db.stock_movements.insert_many(movements, ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to record {len(movements)} stock movements: {str(e)}")
+
+async def _resolve_adjustment_lines(
+    db,
+    business_id: PyObjectId,
+    request: StockAdjustmentRequest
+) -> Tuple[Dict[Any, int], Dict[Any, Dict], List[Dict[str, Any]]]:
+    """
+    Map request lines to products with one query.
+    Returns (product_id -> delta or counted value, product_id -> product, errors).
+    """
+    ids = list({PyObjectId(line.product_id) for line in request.lines if line.product_id})
+    skus = list({line.sku.strip().upper() for line in request.lines if line.sku})
+    barcodes = list({line.barcode.strip() for line in request.lines if line.barcode})
+    
+    clauses = []
+    if ids:
+        clauses.append({"_id": {"$in": ids}})
+    if skus:
+        clauses.append({"sku": {"$in": skus}})
+    if barcodes:
+        clauses.append({"barcode": {"$in": barcodes}})
+    
+    by_id: Dict[Any, Dict] = {}
+    by_sku: Dict[str, Dict] = {}
+    by_barcode: Dict[str, Dict] = {}
+    cursor = db.inventory.find(
+        {"business_id": business_id, "$or": clauses},
+        {"name": 1, "sku": 1, "barcode": 1, "price": 1}
+    )
+    async for product in cursor:
+        by_id[product["_id"]] = product
+        if product.get("sku"):
+            by_sku[product["sku"]] = product
+        if product.get("barcode"):
+            by_barcode[product["barcode"]] = product
+    
+    values: Dict[Any, int] = {}
+    errors: List[Dict[str, Any]] = []
+    for index, line in enumerate(request.lines):
+        if line.product_id:
+            product = by_id.get(PyObjectId(line.product_id))
+        elif line.sku:
+            product = by_sku.get(line.sku.strip().upper())
+        else:
+            product = by_barcode.get(line.barcode.strip())
+        
+        if not product:
+            errors.append({"line": index, "error": "Product not found"})
+            continue
+        
+        if request.mode == StockAdjustmentMode.DELTA:
+            if line.delta is None:
+                errors.append({"line": index, "error": "delta is required in delta mode"})
+                continue
+            # Several deltas for one product are combined
+            values[product["_id"]] = values.get(product["_id"], 0) + line.delta
+        else:
+            if line.counted is None:
+                errors.append({"line": index, "error": "counted is required in count mode"})
+                continue
+            if product["_id"] in values:
+                errors.append({"line": index, "error": f"Product {product['name'].title()} counted more than once"})
+                continue
+            values[product["_id"]] = line.counted
+    
+    return values, {product["_id"]: product for product in by_id.values()}, errors
+
+async def _set_quantities_without_transaction(db, business_id: PyObjectId, writes: List[Tuple[Any, int, int]]) -> bool:
+    """
+    Apply (product_id, before, after) changes one at a time with the same
+    guards as the transactional path. If one no longer matches, the ones
+    already written are set back and False is returned.
+    """
+    applied: List[Tuple[Any, int, int]] = []
+    for product_id, before, after in writes:
+        result = await db.inventory.update_one(
+            {"_id": product_id, "business_id": business_id, "quantity": before, **reserved_guard(after)},
+            {"$set": {"quantity": after}}
+        )
+        if result.matched_count == 0:
+            for done_id, done_before, done_after in reversed(applied):
+                try:
+                    await db.inventory.update_one(
+                        {"_id": done_id, "quantity": done_after},
+                        {"$set": {"quantity": done_before}}
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to restore stock for product {done_id}: {str(e)}")
+            return False
+        applied.append((product_id, before, after))
+    return True
+
+async def apply_stock_adjustments(
+    business_id: str,
+    request: StockAdjustmentRequest,
+    performed_by: str,
+    db=None
+) -> StockAdjustmentModel:
+    """
+    Apply a batch of stock deltas or stocktake counts in one transaction.
+    
+    Products are resolved with one query, quantities are changed with a single
+    bulk_write and the batch is recorded in the stock_adjustments ledger. Either
+    every line is applied or none is. Returns the ledger entry, which doubles
+    as the variance report.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    values, products, errors = await _resolve_adjustment_lines(db, business_oid, request)
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": "Stock adjustment rejected", "errors": errors}
+        )
+    
+    async def apply(session) -> Dict[str, Any]:
+        current = {
+            doc["_id"]: doc
+            async for doc in db.inventory.find(
+                {"_id": {"$in": list(values)}, "business_id": business_oid},
+                {"quantity": 1, "reserved": 1},
+                session=session
+            )
+        }
+        
+        lines: List[StockVarianceLine] = []
+        # (product_id, quantity read, new quantity) for lines that change stock
+        writes: List[Tuple[Any, int, int]] = []
+        for product_id, value in values.items():
+            product = products[product_id]
+            before = current.get(product_id, {}).get("quantity", 0)
+            reserved = current.get(product_id, {}).get("reserved", 0)
+            after = before + value if request.mode == StockAdjustmentMode.DELTA else value
+            if after < 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Adjustment would make stock of {product['name'].title()} negative ({before} on hand)"
+                )
+            if after < reserved:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Adjustment would leave {product['name'].title()} below the {reserved} units reserved by pending orders"
+                )
+            
+            variance = after - before
+            unit_price = float(product.get("price", 0))
+            lines.append(StockVarianceLine(
+                product_id=product_id,
+                product_name=product["name"].title(),
+                sku=product.get("sku"),
+                before=before,
+                after=after,
+                variance=variance,
+                unit_price=unit_price,
+                value_variance=round(variance * unit_price, 2)
+            ))
+            
+            if variance:
+                writes.append((product_id, before, after))
+        
+        if writes:
+            if session is not None:
+                # Guarded on the quantity read above, and on reservations still
+                # fitting, so a concurrent change is detected
+                result = await db.inventory.bulk_write([
+                    UpdateOne(
+                        {"_id": product_id, "business_id": business_oid, "quantity": before, **reserved_guard(after)},
+                        {"$set": {"quantity": after}}
+                    )
+                    for product_id, before, after in writes
+                ], ordered=True, session=session)
+                matched = result.matched_count == len(writes)
+            else:
+                matched = await _set_quantities_without_transaction(db, business_oid, writes)
+            if not matched:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Stock changed while the adjustment was being applied, please retry"
+                )
+        
+        changed = [line for line in lines if line.variance]
+        entry = {
+            "_id": PyObjectId(),
+            "business_id": business_oid,
+            "mode": request.mode.value,
+            "reason": request.reason.strip(),
+            "notes": request.notes.strip() if request.notes else None,
+            "performed_by": PyObjectId(performed_by),
+            "timestamp": datetime.utcnow(),
+            "lines": [line.model_dump() for line in sorted(lines, key=lambda l: l.product_name)],
+            "lines_changed": len(changed),
+            "total_variance": sum(line.variance for line in changed),
+            "total_value_variance": round(sum(line.value_variance for line in changed), 2)
+        }
+        await db.stock_adjustments.insert_one(entry, session=session)
+        
+        movement_type = StockMovementType.ADJUSTMENT if request.mode == StockAdjustmentMode.DELTA else StockMovementType.STOCKTAKE
+        await record_stock_movements(db, [
+            stock_movement(business_oid, line.product_id, movement_type, line.variance, line.after, entry["_id"], entry["timestamp"])
+            for line in changed
+        ], session=session)
+        return entry
+    
+    entry = await run_in_transaction(db, apply)
+    schedule_low_stock_check(db, business_oid, [line["product_id"] for line in entry["lines"] if line["variance"]])
+    print(f"Stock adjustment {entry['_id']} for business {business_id}: {entry['lines_changed']} items changed")
+    return StockAdjustmentModel.model_validate(entry)
+
+async def get_stock_adjustments(
+    business_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db=None
+) -> StockAdjustmentPage:
+    """List adjustment ledger entries, newest first, without their lines"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = {"business_id": PyObjectId(business_id)}
+    if cursor:
+        if not PyObjectId.is_valid(cursor):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query["_id"] = {"$lt": PyObjectId(cursor)}
+    
+    docs = await db.stock_adjustments.find(query, {"lines": 0}).sort("_id", -1).limit(limit + 1).to_list(None)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return StockAdjustmentPage(
+        items=[StockAdjustmentSummary.model_validate(doc) for doc in docs],
+        next_cursor=str(docs[-1]["_id"]) if has_more else None
+    )
+
+async def get_stock_adjustment(business_id: str, adjustment_id: str, db=None) -> Optional[StockAdjustmentModel]:
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    if not PyObjectId.is_valid(adjustment_id):
+        return None
+    
+    doc = await db.stock_adjustments.find_one({
+        "_id": PyObjectId(adjustment_id),
+        "business_id": PyObjectId(business_id)
+    })
+    return StockAdjustmentModel.model_validate(doc) if doc else None
+
+
+async def get_stock_movements(
+    business_id: str,
+    product_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db=None
+) -> StockMovementPage:
+    """A product's stock movements, newest first"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = {"business_id": PyObjectId(business_id), "product_id": PyObjectId(product_id)}
+    if cursor:
+        if not PyObjectId.is_valid(cursor):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query["_id"] = {"$lt": PyObjectId(cursor)}
+    
+    docs = await db.stock_movements.find(query).sort("_id", -1).limit(limit + 1).to_list(None)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return StockMovementPage(
+        items=[StockMovementModel.model_validate(doc) for doc in docs],
+        next_cursor=str(docs[-1]["_id"]) if has_more else None
+    )
+
+async def get_stock_at(business_id: str, product_id: str, at: datetime, db=None) -> Optional[StockLevel]:
+    """
+    A product's stock level at a point in time.
+    
+    Every movement stores the quantity after it, so this is one indexed
+    lookup: the last movement at or before `at`. Before the first recorded
+    movement, the level is that movement's starting quantity.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query = {"business_id": PyObjectId(business_id), "product_id": PyObjectId(product_id)}
+    
+    last = await db.stock_movements.find_one(
+        {**query, "timestamp": {"$lte": at}},
+        {"quantity_after": 1, "timestamp": 1},
+        sort=[("timestamp", -1), ("_id", -1)]
+    )
+    if last:
+        return StockLevel(product_id=product_id, quantity=last["quantity_after"], as_of=last["timestamp"], source="movement")
+    
+    first = await db.stock_movements.find_one(
+        query,
+        {"quantity_after": 1, "delta": 1, "timestamp": 1},
+        sort=[("timestamp", 1), ("_id", 1)]
+    )
+    if first:
+        return StockLevel(product_id=product_id, quantity=first["quantity_after"] - first["delta"], as_of=at, source="movement")
+    
+    product = await db.inventory.find_one(
+        {"_id": PyObjectId(product_id), "business_id": PyObjectId(business_id)},
+        {"quantity": 1}
+    )
+    if not product:
+        return None
+    return StockLevel(product_id=product_id, quantity=product.get("quantity", 0), as_of=datetime.utcnow(), source="current")
+
+async def get_stock_levels_at(business_id: str, at: datetime, db=None) -> Dict[str, int]:
+    """
+    Every product's stock level at a point in time.
+    
+    Starts from the nearest snapshot at or before `at` and replays only the
+    movements between that snapshot and `at`. Products with no snapshot or
+    movement in range fall back to their current quantity.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    levels: Dict[str, int] = {
+        str(doc["_id"]): doc.get("quantity", 0)
+        async for doc in db.inventory.find({"business_id": business_oid}, {"quantity": 1})
+    }
+    
+    snapshot = await db.stock_snapshots.find_one(
+        {"business_id": business_oid, "timestamp": {"$lte": at}},
+        sort=[("timestamp", -1)]
+    )
+    movement_query = {"business_id": business_oid, "timestamp": {"$lte": at}}
+    if snapshot:
+        levels.update(snapshot["quantities"])
+        movement_query["timestamp"]["$gt"] = snapshot["timestamp"]
+    
+    # Last movement per product in the window gives its level at `at`
+    pipeline = [
+        {"$match": movement_query},
+        {"$sort": {"timestamp": 1, "_id": 1}},
+        {"$group": {"_id": "$product_id", "quantity": {"$last": "$quantity_after"}}}
+    ]
+    async for row in db.stock_movements.aggregate(pipeline):
+        levels[str(row["_id"])] = row["quantity"]
+    
+    if not snapshot:
+        # No checkpoint yet: products that only moved after `at` start from their pre-movement level
+        moved_before = {
+            str(row["_id"])
+            async for row in db.stock_movements.aggregate([
+                {"$match": movement_query},
+                {"$group": {"_id": "$product_id"}}
+            ])
+        }
+        pipeline = [
+            {"$match": {"business_id": business_oid, "timestamp": {"$gt": at}}},
+            {"$sort": {"timestamp": 1, "_id": 1}},
+            {"$group": {"_id": "$product_id", "first_after": {"$first": "$quantity_after"}, "delta": {"$first": "$delta"}}}
+        ]
+        async for row in db.stock_movements.aggregate(pipeline):
+            if str(row["_id"]) not in moved_before:
+                levels[str(row["_id"])] = row["first_after"] - row["delta"]
+    
+    return levels
+
+async def create_stock_snapshot(db, business_id) -> int:
+    """Checkpoint every product's current quantity for a business"""
+    business_oid = PyObjectId(str(business_id))
+    quantities = {
+        str(doc["_id"]): doc.get("quantity", 0)
+        async for doc in db.inventory.find({"business_id": business_oid}, {"quantity": 1})
+    }
+    await db.stock_snapshots.insert_one({
+        "_id": PyObjectId(),
+        "business_id": business_oid,
+        "timestamp": datetime.utcnow(),
+        "quantities": quantities
+    })
+    return len(quantities)
+
+async def create_stock_snapshots(db) -> int:
+    """Checkpoint stock for every business that has not had a snapshot within the interval"""
+    cutoff = datetime.utcnow() - timedelta(hours=settings.STOCK_SNAPSHOT_INTERVAL_HOURS)
+    count = 0
+    async for business in db.businesses.find({}, {"_id": 1}):
+        recent = await db.stock_snapshots.find_one(
+            {"business_id": business["_id"], "timestamp": {"$gt": cutoff}},
+            {"_id": 1}
+        )
+        if not recent:
+            await create_stock_snapshot(db, business["_id"])
+            count += 1
+    return count
+
+async def run_stock_snapshot_loop(db) -> None:
+    """Background task: take snapshot checkpoints on a fixed interval"""
+    while True:
+        try:
+            count = await create_stock_snapshots(db)
+            if count:
+                logger.info(f"Created stock snapshots for {count} businesses")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stock snapshot error: {str(e)}")
+        # Businesses missed or added since the last pass are picked up on the next interval
+        await asyncio.sleep(settings.STOCK_SNAPSHOT_INTERVAL_HOURS * 3600)
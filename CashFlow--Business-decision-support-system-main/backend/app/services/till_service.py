@@ -0,0 +1,345 @@
+"""
+Till close / Z-reports
+
+Takings are accumulated per (business, business day, payment method) in
+till_totals as sales and refunds are committed, so day and period reports
+read a handful of small documents instead of scanning sales. Closing a day
+snapshots its totals into z_reports. recompute_till_totals rebuilds the
+counters from sales and refunds for auditing, also from the command line:
+
+    python -m app.services.till_service <business_id> 2024-01-01 2024-01-31
+"""
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app.models.till import (
+    TillTotals, TillReport, ZReportModel, TillDiscrepancy, TillRecomputeResult
+)
+from app.models.base import PyObjectId
+from config import settings
+from datetime import datetime, date, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import argparse
+import asyncio
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Counters kept per (business, day, payment method) in till_totals
+TILL_COUNTERS = ["sales_count", "gross", "subtotal", "discount", "tax", "refund_count", "refunds", "refund_tax"]
+# Sales that count towards takings
+TILL_SALE_STATUSES = ["completed", "partial_refunded", "refunded"]
+MAX_REPORT_DAYS = 366
+
+async def ensure_till_indexes(db) -> None:
+    await db.till_totals.create_index([("business_id", 1), ("date", 1), ("payment_method", 1)], unique=True)
+    await db.z_reports.create_index([("business_id", 1), ("date", 1)], unique=True)
+
+def business_day(timestamp: datetime) -> str:
+    """Business day (YYYY-MM-DD in TILL_TIMEZONE) of a naive UTC timestamp"""
+    local = timestamp.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(settings.TILL_TIMEZONE))
+    return local.date().isoformat()
+
+def _parse_day(value: Optional[str], default: Optional[str] = None) -> str:
+    if value is None:
+        return default or business_day(datetime.utcnow())
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date {value}, expected YYYY-MM-DD"
+        )
+
+def _parse_range(start_day: Optional[str], end_day: Optional[str]) -> Tuple[str, str]:
+    """An inclusive range of business days, at most MAX_REPORT_DAYS long"""
+    start_day = _parse_day(start_day)
+    end_day = _parse_day(end_day)
+    if start_day > end_day:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start_date must not be after end_date"
+        )
+    if (date.fromisoformat(end_day) - date.fromisoformat(start_day)).days >= MAX_REPORT_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Date ranges cover at most {MAX_REPORT_DAYS} days"
+        )
+    return start_day, end_day
+
+def _method(doc: Dict) -> str:
+    method = doc["payment_method"]
+    return getattr(method, "value", method)
+
+async def _increment(db, business_id, day: str, payment_method: str, inc: Dict[str, Any], session=None) -> None:
+    await db.till_totals.update_one(
+        {"business_id": PyObjectId(str(business_id)), "date": day, "payment_method": payment_method},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        session=session
+    )
+
+async def record_till_sale(db, sale_doc: Dict, session=None) -> None:
+    """Add a committed sale to its day's takings for the payment method"""
+    await _increment(db, sale_doc["business_id"], business_day(sale_doc["timestamp"]), _method(sale_doc), {
+        "sales_count": 1,
+        "gross": sale_doc.get("total_amount", 0),
+        "subtotal": sale_doc.get("subtotal", 0),
+        "discount": sale_doc.get("discount", 0),
+        "tax": sale_doc.get("tax", 0)
+    }, session)
+
+async def record_till_refund(db, refund_doc: Dict, session=None) -> None:
+    """Add a committed refund to its day's payouts for the refund's payment method"""
+    await _increment(db, refund_doc["business_id"], business_day(refund_doc["timestamp"]), _method(refund_doc), {
+        "refund_count": 1,
+        "refunds": refund_doc.get("total_refund", 0),
+        "refund_tax": refund_doc.get("tax_refund", 0)
+    }, session)
+
+def log_till_failure(kind: str, doc: Dict, error: Exception) -> None:
+    """Log a till update that failed after its sale or refund was committed, with the recompute command"""
+    day = business_day(doc["timestamp"])
+    logger.error(
+        f"Failed to update till totals for {kind} {doc['_id']}: {str(error)}. "
+        f"Recompute them before closing the till: "
+        f"python -m app.services.till_service {doc['business_id']} {day} {day}"
+    )
+
+def _totals(docs: Iterable[Dict[str, Any]], payment_method: Optional[str] = None) -> TillTotals:
+    sums = {field: 0 for field in TILL_COUNTERS}
+    for doc in docs:
+        for field in TILL_COUNTERS:
+            sums[field] += doc.get(field, 0)
+    for field in TILL_COUNTERS:
+        if field not in ("sales_count", "refund_count"):
+            sums[field] = round(sums[field], 2)
+    return TillTotals(
+        payment_method=payment_method,
+        net=round(sums["gross"] - sums["refunds"], 2),
+        **sums
+    )
+
+async def _read_report(db, business_oid: PyObjectId, start_day: str, end_day: str) -> Tuple[List[TillTotals], TillTotals]:
+    """Per-method and overall totals from the materialized day documents"""
+    docs = await db.till_totals.find(
+        {"business_id": business_oid, "date": {"$gte": start_day, "$lte": end_day}},
+        {"_id": 0, "business_id": 0, "updated_at": 0}
+    ).to_list(None)
+    
+    by_method: Dict[str, List[Dict]] = {}
+    for doc in docs:
+        by_method.setdefault(doc["payment_method"], []).append(doc)
+    methods = [_totals(rows, method) for method, rows in sorted(by_method.items())]
+    return methods, _totals(docs)
+
+async def get_till_day(business_id: str, day: Optional[str] = None, db=None) -> TillReport:
+    """A day's takings by payment method (read from till_totals, not from sales)"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    day = _parse_day(day)
+    methods, totals = await _read_report(db, business_oid, day, day)
+    z_report = await db.z_reports.find_one({"business_id": business_oid, "date": day}, {"_id": 1})
+    return TillReport(
+        start_date=day, end_date=day, methods=methods, totals=totals,
+        closed=z_report is not None,
+        z_report_id=str(z_report["_id"]) if z_report else None
+    )
+
+async def get_till_period(business_id: str, start_day: str, end_day: Optional[str] = None, db=None) -> TillReport:
+    """Takings by payment method over a range of business days (inclusive)"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    start_day, end_day = _parse_range(start_day, end_day)
+    methods, totals = await _read_report(db, PyObjectId(business_id), start_day, end_day)
+    return TillReport(start_date=start_day, end_date=end_day, methods=methods, totals=totals)
+
+async def close_till(
+    business_id: str,
+    closed_by: str,
+    day: Optional[str] = None,
+    notes: Optional[str] = None,
+    db=None
+) -> ZReportModel:
+    """Close the till for a day, storing its Z-report (once per day)"""
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    day = _parse_day(day)
+    if day > business_day(datetime.utcnow()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot close a future day"
+        )
+    
+    methods, totals = await _read_report(db, business_oid, day, day)
+    report = {
+        "_id": PyObjectId(),
+        "business_id": business_oid,
+        "date": day,
+        "methods": [m.model_dump() for m in methods],
+        "totals": totals.model_dump(),
+        "closed_at": datetime.utcnow(),
+        "closed_by": PyObjectId(closed_by),
+        "notes": notes.strip() if notes else None
+    }
+    try:
+        await db.z_reports.insert_one(report)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Till already closed for {day}"
+        )
+    
+    logger.info(f"Till closed for business {business_id} on {day}: net {totals.net}")
+    return ZReportModel.model_validate(report)
+
+async def get_z_reports(
+    business_id: str,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    db=None
+) -> List[ZReportModel]:
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    query: Dict[str, Any] = {"business_id": PyObjectId(business_id)}
+    if start_day or end_day:
+        query["date"] = {}
+        if start_day:
+            query["date"]["$gte"] = _parse_day(start_day)
+        if end_day:
+            query["date"]["$lte"] = _parse_day(end_day)
+    
+    docs = await db.z_reports.find(query).sort("date", -1).limit(MAX_REPORT_DAYS).to_list(None)
+    return [ZReportModel.model_validate(doc) for doc in docs]
+
+def _utc_bounds(start_day: str, end_day: str) -> Tuple[datetime, datetime]:
+    """Naive UTC datetimes covering the business days start_day..end_day"""
+    tz = ZoneInfo(settings.TILL_TIMEZONE)
+    start = datetime.combine(date.fromisoformat(start_day), datetime.min.time(), tz)
+    end = datetime.combine(date.fromisoformat(end_day) + timedelta(days=1), datetime.min.time(), tz)
+    return (
+        start.astimezone(timezone.utc).replace(tzinfo=None),
+        end.astimezone(timezone.utc).replace(tzinfo=None)
+    )
+
+async def recompute_till_totals(
+    business_id: str,
+    start_day: str,
+    end_day: Optional[str] = None,
+    db=None
+) -> TillRecomputeResult:
+    """
+    Rebuild till_totals for a range of days from the sales and refunds
+    collections and report every counter that differed from what had been
+    accumulated. Used for auditing and to repair totals after a failure.
+    """
+    # Use provided db or create a new connection
+    if db is None:
+        client = AsyncIOMotorClient(settings.MONGODB_URL)
+        db = client[settings.MONGODB_NAME]
+    
+    business_oid = PyObjectId(business_id)
+    start_day, end_day = _parse_range(start_day, end_day)
+    start, end = _utc_bounds(start_day, end_day)
+    day_expr = {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp", "timezone": settings.TILL_TIMEZONE}}
+    
+    recomputed: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    async for doc in db.sales.aggregate([
+        {"$match": {
+            "business_id": business_oid,
+            "timestamp": {"$gte": start, "$lt": end},
+            "status": {"$in": TILL_SALE_STATUSES}
+        }},
+        {"$group": {
+            "_id": {"date": day_expr, "payment_method": "$payment_method"},
+            "sales_count": {"$sum": 1},
+            "gross": {"$sum": "$total_amount"},
+            "subtotal": {"$sum": "$subtotal"},
+            "discount": {"$sum": {"$ifNull": ["$discount", 0]}},
+            "tax": {"$sum": {"$ifNull": ["$tax", 0]}}
+        }}
+    ]):
+        key = (doc["_id"]["date"], doc["_id"]["payment_method"])
+        recomputed.setdefault(key, {}).update({f: doc[f] for f in ("sales_count", "gross", "subtotal", "discount", "tax")})
+    
+    async for doc in db.refunds.aggregate([
+        {"$match": {"business_id": business_oid, "timestamp": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"date": day_expr, "payment_method": "$payment_method"},
+            "refund_count": {"$sum": 1},
+            "refunds": {"$sum": "$total_refund"},
+            "refund_tax": {"$sum": {"$ifNull": ["$tax_refund", 0]}}
+        }}
+    ]):
+        key = (doc["_id"]["date"], doc["_id"]["payment_method"])
+        recomputed.setdefault(key, {}).update({f: doc[f] for f in ("refund_count", "refunds", "refund_tax")})
+    
+    stored = {
+        (doc["date"], doc["payment_method"]): doc
+        async for doc in db.till_totals.find({"business_id": business_oid, "date": {"$gte": start_day, "$lte": end_day}})
+    }
+    
+    discrepancies = []
+    for key in sorted(set(stored) | set(recomputed)):
+        for field in TILL_COUNTERS:
+            before = stored.get(key, {}).get(field, 0)
+            after = recomputed.get(key, {}).get(field, 0)
+            if round(before - after, 2) != 0:
+                discrepancies.append(TillDiscrepancy(
+                    date=key[0], payment_method=key[1], field=field,
+                    stored=round(before, 2), recomputed=round(after, 2)
+                ))
+    
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"business_id": business_oid, "date": day, "payment_method": method},
+            {"$set": {**{field: recomputed.get((day, method), {}).get(field, 0) for field in TILL_COUNTERS}, "updated_at": now}},
+            upsert=True
+        )
+        for day, method in set(stored) | set(recomputed)
+    ]
+    if operations:
+        await db.till_totals.bulk_write(operations, ordered=False)
+    
+    if discrepancies:
+        logger.warning(f"Till recompute for {business_id} {start_day}..{end_day}: {len(discrepancies)} discrepancies")
+    return TillRecomputeResult(
+        start_date=start_day,
+        end_date=end_day,
+        days=(date.fromisoformat(end_day) - date.fromisoformat(start_day)).days + 1,
+        discrepancies=discrepancies
+    )
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Recompute till totals from sales and refunds")
+    parser.add_argument("business_id")
+    parser.add_argument("start_date", help="First business day, YYYY-MM-DD")
+    parser.add_argument("end_date", nargs="?", help="Last business day (defaults to today)")
+    args = parser.parse_args(argv)
+    
+    result = asyncio.run(recompute_till_totals(args.business_id, args.start_date, args.end_date))
+    for d in result.discrepancies:
+        print(f"{d.date} {d.payment_method} {d.field}: stored {d.stored}, recomputed {d.recomputed}")
+    print(f"Recomputed {result.days} days, {len(result.discrepancies)} discrepancies")
+    return 1 if result.discrepancies else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
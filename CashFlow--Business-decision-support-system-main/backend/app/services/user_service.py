@@ -1,12 +1,73 @@
 from app.models.user import UserCreate, UserUpdate, UserInDB, UserRole
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from config import settings
-from passlib.context import CryptContext
 from app.models.base import PyObjectId
-from typing import Optional, List, Union
+from app.services.password_service import hash_password, verify_password
+from app.services.session_service import revoke_all_sessions
+from typing import Optional, List, Union, Dict, Tuple
 from fastapi import HTTPException, status
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Short-lived in-process cache of resolved users: (business_id, user_id) -> (user, expires_at)
+USER_CACHE: Dict[Tuple[str, str], Tuple[UserInDB, float]] = {}
+USER_CACHE_MAX_ENTRIES = 2048
+
+# Lowest token version still accepted per user id, raised when tokens are revoked
+TOKEN_VERSION_FLOOR: Dict[str, int] = {}
+
+def invalidate_user_cache(user_id: str, business_id: Optional[str] = None) -> None:
+    """Drop cached entries for a user so the next lookup hits the database"""
+    for key in list(USER_CACHE):
+        if key[1] == str(user_id) and (business_id is None or key[0] == str(business_id)):
+            USER_CACHE.pop(key, None)
+
+def is_token_version_revoked(user_id: str, token_version: int) -> bool:
+    """True if tokens with this version were revoked for the user in this process"""
+    return token_version < TOKEN_VERSION_FLOOR.get(str(user_id), 0)
+
+async def get_user_cached(business_id: str, user_id: str, db=None, fresh: bool = False) -> Optional[UserInDB]:
+    """
+    Get a user through the in-process cache.
+    
+    Entries live for USER_CACHE_TTL_SECONDS and are dropped explicitly when the
+    user is updated, deleted or their password changes. Pass fresh=True to
+    bypass the cache (and refresh it) for security-sensitive checks.
+    """
+    key = (str(business_id), str(user_id))
+    now = time.monotonic()
+    
+    if not fresh:
+        cached = USER_CACHE.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+    
+    user = await get_user(business_id, user_id, db)
+    if user is None:
+        USER_CACHE.pop(key, None)
+        return None
+    
+    if len(USER_CACHE) >= USER_CACHE_MAX_ENTRIES:
+        # Evict expired entries first, then the oldest inserted one
+        for expired in [k for k, (_, expires) in USER_CACHE.items() if expires <= now]:
+            USER_CACHE.pop(expired, None)
+        if len(USER_CACHE) >= USER_CACHE_MAX_ENTRIES:
+            USER_CACHE.pop(next(iter(USER_CACHE)), None)
+    
+    USER_CACHE[key] = (user, now + settings.USER_CACHE_TTL_SECONDS)
+    return user
+
+async def revoke_user_tokens(db, business_id: str, user_id: str) -> None:
+    """Invalidate all access tokens issued to a user by bumping their token version"""
+    result = await db.users.find_one_and_update(
+        {"_id": PyObjectId(user_id), "business_id": PyObjectId(business_id)},
+        {"$inc": {"token_version": 1}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if result:
+        TOKEN_VERSION_FLOOR[str(user_id)] = result.get("token_version", 0)
+    invalidate_user_cache(user_id, business_id)
 
 async def get_users(business_id: str, db=None) -> List[dict]:
     # Use provided db or create a new connection
@@ -51,7 +112,8 @@ async def get_user(business_id: str, user_id: str, db=None) -> Optional[UserInDB
                 username=user['username'],
                 email=user['email'],
                 role=user['role'],
-                hashed_password=user['hashed_password']
+                hashed_password=user['hashed_password'],
+                token_version=user.get('token_version', 0)
             )
         return None
         
@@ -113,7 +175,7 @@ async def create_user(business_id: str | PyObjectId, user: UserCreate, is_admin_
     
     try:
         # Hash the password
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = await hash_password(user.password)
         
         # Generate new ID and convert business_id to PyObjectId
         user_id = PyObjectId()
@@ -176,8 +238,12 @@ async def update_user(business_id: str, user_id: str, user: UserUpdate, db=None)
         },
         {"$set": update_data}
     )
+    invalidate_user_cache(user_id, business_id)
     
     if result.modified_count == 1:
+        # A role change must not keep working through older tokens' claims
+        if user.role is not None and user.role != existing_user.role:
+            await revoke_user_tokens(db, business_id, user_id)
         return await get_user(business_id, user_id, db)
     return None
 
@@ -202,7 +268,12 @@ async def delete_user(business_id: str, user_id: str, db=None) -> bool:
         "_id": PyObjectId(user_id), 
         "business_id": PyObjectId(business_id)
     })
-    return result.deleted_count == 1
+    invalidate_user_cache(user_id, business_id)
+    if result.deleted_count == 1:
+        # Tokens of a deleted user are rejected without a lookup in this process
+        TOKEN_VERSION_FLOOR[str(user_id)] = user.token_version + 1
+        return True
+    return False
 
 async def authenticate_user(username: str, password: str, db=None) -> Union[UserInDB, bool]:
     # Use provided db or create a new connection
@@ -225,10 +296,19 @@ async def authenticate_user(username: str, password: str, db=None) -> Union[User
         return False
     
     # Verify password
-    if not pwd_context.verify(password, user["hashed_password"]):
+    valid, new_hash = await verify_password(password, user["hashed_password"])
+    if not valid:
         print("Password verification failed")  # Debug print
         return False
     
+    # Upgrade hashes created with outdated cost parameters
+    if new_hash:
+        await db.users.update_one(
+            {"_id": user["_id"], "hashed_password": user["hashed_password"]},
+            {"$set": {"hashed_password": new_hash}}
+        )
+        user["hashed_password"] = new_hash
+    
     # Convert ObjectIds to PyObjectIds
     user['_id'] = PyObjectId(user['_id'])
     user['business_id'] = PyObjectId(user['business_id'])
@@ -237,9 +317,17 @@ async def authenticate_user(username: str, password: str, db=None) -> Union[User
     return UserInDB.model_validate(user)
 
 # Password management functions
-async def change_user_password(business_id: str, user_id: str, current_password: str, new_password: str, db=None) -> bool:
+async def change_user_password(
+    business_id: str,
+    user_id: str,
+    current_password: str,
+    new_password: str,
+    db=None,
+    current_session_id: Optional[str] = None
+) -> bool:
     """
     Changes a user's password after verifying the current password.
+    Every other session of the user is signed out.
     
     Args:
         business_id: The business ID
@@ -247,6 +335,7 @@ async def change_user_password(business_id: str, user_id: str, current_password:
         current_password: The current password
         new_password: The new password
         db: Optional database connection
+        current_session_id: Session making the change, which stays signed in
         
     Returns:
         True if password was changed successfully, False otherwise
@@ -265,14 +354,15 @@ async def change_user_password(business_id: str, user_id: str, current_password:
         return False
         
     # Verify current password
-    if not pwd_context.verify(current_password, user.hashed_password):
+    valid, _ = await verify_password(current_password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
         
     # Hash the new password
-    hashed_password = pwd_context.hash(new_password)
+    hashed_password = await hash_password(new_password)
     
     # Update the password
     result = await db.users.update_one(
@@ -282,8 +372,15 @@ async def change_user_password(business_id: str, user_id: str, current_password:
         },
         {"$set": {"hashed_password": hashed_password}}
     )
+    invalidate_user_cache(user_id, business_id)
     
-    return result.modified_count == 1
+    if result.modified_count != 1:
+        return False
+    
+    # A password change after a suspected compromise must also end the
+    # other sessions, so their refresh tokens can't mint new access tokens
+    await revoke_all_sessions(business_id, user_id, except_session_id=current_session_id, db=db)
+    return True
 
 async def reset_user_password(business_id: str, user_id: str, new_password: str, db=None) -> bool:
     """
@@ -310,7 +407,7 @@ async def reset_user_password(business_id: str, user_id: str, new_password: str,
         return False
         
     # Hash the new password
-    hashed_password = pwd_context.hash(new_password)
+    hashed_password = await hash_password(new_password)
     
     # Update the password
     result = await db.users.update_one(
@@ -321,4 +418,8 @@ async def reset_user_password(business_id: str, user_id: str, new_password: str,
         {"$set": {"hashed_password": hashed_password}}
     )
     
-    return result.modified_count == 1
\ No newline at end of file
+    # An admin reset also signs the user out of existing sessions
+    if result.modified_count == 1:
+        await revoke_user_tokens(db, business_id, user_id)
+        return True
+    return False
\ No newline at end of file
@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from bson import ObjectId
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 5000
+
+# An export column is (name, type) with type one of: string, int, float, bool, datetime
+ExportColumns = List[Tuple[str, str]]
+
+class ExportFormatError(ValueError):
+    """The requested export format can't be produced here"""
+
+def _plain(value: Any) -> Any:
+    """JSON/CSV-friendly version of a Mongo value"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def _parquet_value(value: Any, kind: str) -> Any:
+    if value is None:
+        return None
+    if kind == "datetime":
+        return value
+    if kind == "string":
+        return str(_plain(value))
+    if kind == "int":
+        return int(value)
+    if kind == "float":
+        return float(value)
+    return bool(value)
+
+class _ChunkSink:
+    """Write-only file that hands out what was written since the last drain"""
+    
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self.position
+    
+    def writable(self) -> bool:
+        return True
+    
+    def flush(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        self.closed = True
+    
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _parquet_modules():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportFormatError("Parquet export requires the pyarrow package")
+    return pyarrow, pyarrow.parquet
+
+def check_export_format(fmt: str) -> None:
+    """Raise ExportFormatError before streaming starts if `fmt` can't be written"""
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise ExportFormatError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet":
+        _parquet_modules()
+
+async def _encode_parquet(rows: AsyncIterator[Dict[str, Any]], columns: ExportColumns) -> AsyncIterator[bytes]:
+    pa, pq = _parquet_modules()
+    types = {"string": pa.string(), "int": pa.int64(), "float": pa.float64(),
+             "bool": pa.bool_(), "datetime": pa.timestamp("ms")}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    
+    batch: Dict[str, List[Any]] = {name: [] for name, _ in columns}
+    count = 0
+    
+    def flush_batch() -> bytes:
+        writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+        for values in batch.values():
+            values.clear()
+        return sink.drain()
+    
+    try:
+        async for row in rows:
+            for name, kind in columns:
+                batch[name].append(_parquet_value(row.get(name), kind))
+            count += 1
+            if count % PARQUET_ROW_GROUP_SIZE == 0:
+                yield flush_batch()
+        if count % PARQUET_ROW_GROUP_SIZE:
+            yield flush_batch()
+    finally:
+        writer.close()
+    # Footer
+    yield sink.drain()
+
+async def encode_rows(rows: AsyncIterator[Dict[str, Any]], fmt: str, columns: ExportColumns) -> AsyncIterator[Any]:
+    """
+    Encode flat rows as CSV (with a header), NDJSON or Parquet, producing
+    chunks as it goes so a response or file can be written without holding
+    the export in memory. Parquet is written one row group at a time.
+    """
+    names = [name for name, _ in columns]
+    if fmt == "parquet":
+        async for chunk in _encode_parquet(rows, columns):
+            yield chunk
+    elif fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        yield buffer.getvalue()
+        async for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([_plain(row.get(name)) for name in names])
+            yield buffer.getvalue()
+    else:
+        async for row in rows:
+            yield json.dumps({name: _plain(row.get(name)) for name in names}) + "\n"
+
+async def write_export_file(rows: AsyncIterator[Dict[str, Any]], fmt: str, columns: ExportColumns, path: str) -> int:
+    """Stream an export to a local file; returns the number of bytes written"""
+    written = 0
+    with open(path, "wb") as f:
+        async for chunk in encode_rows(rows, fmt, columns):
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            f.write(data)
+            written += len(data)
+    return written
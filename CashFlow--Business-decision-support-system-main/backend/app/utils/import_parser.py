@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from typing import Dict, Iterator, Optional, Tuple
+
+class ImportFormatError(ValueError):
+    """The uploaded file is not a readable CSV or NDJSON document"""
+
+def detect_import_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Return 'csv' or 'ndjson' from the upload's name or content type"""
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in ctype or "jsonl" in ctype:
+        return "ndjson"
+    if name.endswith(".csv") or "csv" in ctype or ctype.startswith("text/plain"):
+        return "csv"
+    raise ImportFormatError("Unsupported import format, upload a .csv or .ndjson file")
+
+def iter_import_rows(content: bytes, fmt: str) -> Iterator[Tuple[int, Dict, Optional[str]]]:
+    """
+    Yield (row_number, fields, error) for each record of an import file.
+    
+    Row numbers are 1-based data rows (the CSV header is not counted). Blank
+    CSV cells become None. A row that cannot be parsed is yielded with an
+    error message and empty fields instead of aborting the whole import.
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ImportFormatError("Import file must be UTF-8 encoded")
+    
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ImportFormatError("CSV file has no header row")
+        for row_number, row in enumerate(reader, start=1):
+            if None in row:
+                yield row_number, {}, "Row has more columns than the header"
+                continue
+            fields = {
+                key.strip(): (value.strip() if isinstance(value, str) and value.strip() else None)
+                for key, value in row.items() if key
+            }
+            if any(value is not None for value in fields.values()):
+                yield row_number, fields, None
+    elif fmt == "ndjson":
+        row_number = 0
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                fields = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, {}, f"Invalid JSON: {e.msg}"
+                continue
+            if not isinstance(fields, dict):
+                yield row_number, {}, "Each line must be a JSON object"
+                continue
+            yield row_number, fields, None
+    else:
+        raise ImportFormatError(f"Unknown import format: {fmt}")
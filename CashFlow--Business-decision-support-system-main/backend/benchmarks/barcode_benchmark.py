@@ -0,0 +1,431 @@
+"""
+Barcode pipeline benchmark and regression corpus
+
+Renders a synthetic corpus of EAN-13, UPC-A, Code 128 and QR images under
+noise, blur, rotation and lighting variations, runs them through
+BarcodeService and reports decode rate, p50/p95 latency and how often each
+preprocessing variant produced the hit.
+
+Run from the backend directory:
+
+    python -m benchmarks.barcode_benchmark
+    python -m benchmarks.barcode_benchmark --ablation --json results.json
+    python -m benchmarks.barcode_benchmark --save-corpus corpus/   # freeze a corpus
+    python -m benchmarks.barcode_benchmark --corpus corpus/ --baseline results.json
+
+With --baseline the run exits non-zero when the decode rate drops or the
+p95 latency grows beyond the given tolerances, so a change to
+_get_processed_images can be judged on speed and accuracy together.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode
+
+from app.services.barcode_service import BarcodeService
+
+# EAN-13 / UPC-A element patterns (1 = bar, 0 = space)
+EAN_L = ["0001101", "0011001", "0010011", "0111101", "0100011",
+         "0110001", "0101111", "0111011", "0110111", "0001011"]
+EAN_G = ["0100111", "0110011", "0011011", "0100001", "0011101",
+         "0111001", "0000101", "0010001", "0001001", "0010111"]
+EAN_R = ["1110010", "1100110", "1101100", "1000010", "1011100",
+         "1001110", "1010000", "1000100", "1001000", "1110100"]
+EAN_PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+              "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+# Code 128 symbol widths (bar, space, bar, ...), values 0-106
+CODE128_WIDTHS = [
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312",
+    "132212", "221213", "221312", "231212", "112232", "122132", "122231", "113222",
+    "123122", "123221", "223211", "221132", "221231", "213212", "223112", "312131",
+    "311222", "321122", "321221", "312212", "322112", "322211", "212123", "212321",
+    "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121",
+    "313121", "211331", "231131", "213113", "213311", "213131", "311123", "311321",
+    "331121", "312113", "312311", "332111", "314111", "221411", "431111", "111224",
+    "111422", "121124", "121421", "141122", "141221", "112214", "112412", "122114",
+    "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112",
+    "421211", "212141", "214121", "412121", "111143", "111341", "131141", "114113",
+    "114311", "411113", "411311", "113141", "114131", "311141", "411131", "211412",
+    "211214", "211232", "2331112",
+]
+CODE128_START_B = 104
+CODE128_STOP = 106
+
+SYMBOLOGIES = ["EAN13", "UPCA", "CODE128", "QRCODE"]
+
+
+def ean_check_digit(digits: str) -> str:
+    """Modulo-10 check digit for EAN-13 (12 digits in) or UPC-A (11 digits in)"""
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        total += int(d) * (3 if i % 2 == 0 else 1)
+    return str((10 - total % 10) % 10)
+
+
+def ean13_modules(code: str) -> str:
+    """Module string for a full 13-digit EAN-13 code"""
+    parity = EAN_PARITY[int(code[0])]
+    left = "".join(
+        (EAN_L if p == "L" else EAN_G)[int(d)] for p, d in zip(parity, code[1:7])
+    )
+    right = "".join(EAN_R[int(d)] for d in code[7:])
+    return "101" + left + "01010" + right + "101"
+
+
+def code128_modules(text: str) -> str:
+    """Module string for a Code 128 (code set B) symbol"""
+    values = [CODE128_START_B] + [ord(c) - 32 for c in text]
+    checksum = (values[0] + sum(i * v for i, v in enumerate(values[1:], start=1))) % 103
+    values += [checksum, CODE128_STOP]
+
+    modules = []
+    for value in values:
+        for i, width in enumerate(CODE128_WIDTHS[value]):
+            modules.append(("1" if i % 2 == 0 else "0") * int(width))
+    return "".join(modules)
+
+
+def render_linear(modules: str, module_px: int = 3, height: int = 160, quiet: int = 12) -> np.ndarray:
+    """Render a 1D module string as a white-background grayscale image"""
+    row = np.array([0 if m == "1" else 255 for m in modules], dtype=np.uint8)
+    row = np.repeat(row, module_px)
+    row = np.pad(row, quiet * module_px, constant_values=255)
+    img = np.tile(row, (height, 1))
+    return np.pad(img, ((quiet * module_px, quiet * module_px), (0, 0)), constant_values=255)
+
+
+def render_qr(text: str, module_px: int = 6) -> Optional[np.ndarray]:
+    """Render a QR code with OpenCV's encoder, or None when it isn't available"""
+    if not hasattr(cv2, "QRCodeEncoder"):
+        return None
+    qr = cv2.QRCodeEncoder.create().encode(text)
+    qr = cv2.resize(qr, None, fx=module_px, fy=module_px, interpolation=cv2.INTER_NEAREST)
+    return np.pad(qr, 4 * module_px, constant_values=255)
+
+
+def render_symbol(symbology: str, rng: random.Random) -> Tuple[Optional[np.ndarray], str]:
+    """Render a random symbol and return (image, expected decoded value)"""
+    if symbology == "EAN13":
+        body = "".join(str(rng.randint(0, 9)) for _ in range(12))
+        code = body + ean_check_digit(body)
+        return render_linear(ean13_modules(code)), code
+    if symbology == "UPCA":
+        body = "".join(str(rng.randint(0, 9)) for _ in range(11))
+        code = body + ean_check_digit(body)
+        # UPC-A is EAN-13 with an implicit leading zero
+        return render_linear(ean13_modules("0" + code)), code
+    if symbology == "CODE128":
+        alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ0123456789-"
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(6, 14)))
+        return render_linear(code128_modules(text), module_px=2), text
+    if symbology == "QRCODE":
+        text = f"https://example.com/p/{rng.randint(10**5, 10**9)}"
+        return render_qr(text), text
+    raise ValueError(f"Unknown symbology: {symbology}")
+
+
+def place_in_frame(symbol: np.ndarray, frame_size: Tuple[int, int], rng: random.Random) -> np.ndarray:
+    """Paste a symbol onto a textured background the size of a camera frame"""
+    width, height = frame_size
+    background = np.full((height, width), rng.randint(150, 230), dtype=np.uint8)
+    texture = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 12, (height // 8 + 1, width // 8 + 1))
+    texture = cv2.resize(texture, (width, height), interpolation=cv2.INTER_CUBIC)
+    background = np.clip(background + texture, 0, 255).astype(np.uint8)
+
+    # Scale the symbol to 15-40% of the frame width
+    target_w = int(width * rng.uniform(0.15, 0.4))
+    scale = target_w / symbol.shape[1]
+    symbol = cv2.resize(symbol, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    sh, sw = symbol.shape
+    if sh >= height or sw >= width:
+        symbol = cv2.resize(symbol, (min(sw, width - 2), min(sh, height - 2)))
+        sh, sw = symbol.shape
+
+    y = rng.randint(0, height - sh - 1)
+    x = rng.randint(0, width - sw - 1)
+    background[y:y + sh, x:x + sw] = symbol
+    return cv2.cvtColor(background, cv2.COLOR_GRAY2BGR)
+
+
+def apply_rotation(img: np.ndarray, angle: float) -> np.ndarray:
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+
+def apply_blur(img: np.ndarray, kernel: int) -> np.ndarray:
+    return cv2.GaussianBlur(img, (kernel, kernel), 0)
+
+
+def apply_noise(img: np.ndarray, sigma: float, seed: int) -> np.ndarray:
+    noise = np.random.default_rng(seed).normal(0, sigma, img.shape)
+    return np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def apply_lighting(img: np.ndarray, gain: float, gradient: float) -> np.ndarray:
+    """Global brightness gain plus a left-to-right illumination falloff"""
+    width = img.shape[1]
+    ramp = np.linspace(1.0, 1.0 - gradient, width, dtype=np.float32)[None, :, None]
+    return np.clip(img.astype(np.float32) * gain * ramp, 0, 255).astype(np.uint8)
+
+
+# Distortion presets applied to every rendered symbol
+DISTORTIONS: Dict[str, Dict[str, Any]] = {
+    "clean": {},
+    "noise": {"noise": 18},
+    "blur": {"blur": 5},
+    "rotate_15": {"rotate": 15},
+    "rotate_90": {"rotate": 90},
+    "dim": {"lighting": (0.55, 0.0)},
+    "uneven_light": {"lighting": (1.0, 0.6)},
+    "combined": {"rotate": 8, "blur": 3, "noise": 10, "lighting": (0.8, 0.3)},
+}
+
+
+def distort(img: np.ndarray, params: Dict[str, Any], seed: int) -> np.ndarray:
+    if "rotate" in params:
+        img = apply_rotation(img, params["rotate"])
+    if "blur" in params:
+        img = apply_blur(img, params["blur"])
+    if "lighting" in params:
+        img = apply_lighting(img, *params["lighting"])
+    if "noise" in params:
+        img = apply_noise(img, params["noise"], seed)
+    return img
+
+
+def generate_corpus(per_case: int, frame_size: Tuple[int, int], seed: int) -> List[Dict[str, Any]]:
+    """Render per_case samples for every symbology x distortion combination"""
+    rng = random.Random(seed)
+    corpus = []
+
+    for symbology in SYMBOLOGIES:
+        for distortion, params in DISTORTIONS.items():
+            for n in range(per_case):
+                symbol, expected = render_symbol(symbology, rng)
+                if symbol is None:
+                    continue
+                frame = place_in_frame(symbol, frame_size, rng)
+                corpus.append({
+                    "name": f"{symbology.lower()}_{distortion}_{n:03d}",
+                    "symbology": symbology,
+                    "distortion": distortion,
+                    "expected": expected,
+                    "image": distort(frame, params, rng.randint(0, 2**31)),
+                })
+
+    return corpus
+
+
+def save_corpus(corpus: List[Dict[str, Any]], directory: str):
+    """Write the corpus as PNG files plus a manifest.json"""
+    os.makedirs(directory, exist_ok=True)
+    manifest = []
+    for sample in corpus:
+        filename = f"{sample['name']}.png"
+        cv2.imwrite(os.path.join(directory, filename), sample["image"])
+        manifest.append({k: v for k, v in sample.items() if k != "image"} | {"file": filename})
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_corpus(directory: str) -> List[Dict[str, Any]]:
+    """Load a corpus previously written by save_corpus"""
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    corpus = []
+    for entry in manifest:
+        image = cv2.imread(os.path.join(directory, entry["file"]), cv2.IMREAD_COLOR)
+        if image is not None:
+            corpus.append({**entry, "image": image})
+    return corpus
+
+
+def matches(expected: str, value: str) -> bool:
+    """Compare decoded data, allowing zbar's EAN-13 form of UPC-A codes"""
+    return value == expected or value == "0" + expected or "0" + value == expected
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def rate(hits: int, total: int) -> float:
+    return round(hits / total, 4) if total else 0.0
+
+
+def run_pipeline(service: BarcodeService, corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Decode every sample with decode_frame and aggregate accuracy and latency"""
+    latencies = []
+    hits = 0
+    variant_hits: Dict[str, int] = {}
+    by_group: Dict[str, Dict[str, int]] = {}
+    failures = []
+
+    for sample in corpus:
+        start = time.perf_counter()
+        results = service.decode_frame(sample["image"])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        hit = next((r for r in results if matches(sample["expected"], r["data"])), None)
+        for key in (f"symbology:{sample['symbology']}", f"distortion:{sample['distortion']}"):
+            group = by_group.setdefault(key, {"hits": 0, "total": 0})
+            group["total"] += 1
+            group["hits"] += 1 if hit else 0
+
+        if hit:
+            hits += 1
+            variant = hit.get("variant", "unknown")
+            variant_hits[variant] = variant_hits.get(variant, 0) + 1
+        else:
+            failures.append(sample["name"])
+
+    return {
+        "samples": len(corpus),
+        "decode_rate": rate(hits, len(corpus)),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "mean": round(float(np.mean(latencies)), 2) if latencies else 0.0,
+        },
+        "variant_hit_rate": {name: rate(count, hits) for name, count in sorted(variant_hits.items())},
+        "groups": {key: rate(g["hits"], g["total"]) for key, g in sorted(by_group.items())},
+        "failures": failures,
+    }
+
+
+def run_ablation(service: BarcodeService, corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Decode every preprocessing variant on its own, on the full frame, to see
+    which variants earn their cost
+    """
+    variant_stats: Dict[str, Dict[str, float]] = {}
+    preprocessing_ms = []
+
+    for sample in corpus:
+        frame, _ = service._downscale(sample["image"], service.FALLBACK_MAX_DIM)
+        start = time.perf_counter()
+        # Materialize every variant so preprocessing is timed on its own
+        processed = list(service._get_processed_images(frame))
+        preprocessing_ms.append((time.perf_counter() - start) * 1000)
+
+        for i, proc_img in enumerate(processed):
+            name = service._variant_name(i)
+            stats = variant_stats.setdefault(name, {"hits": 0, "decode_ms": 0.0})
+            start = time.perf_counter()
+            found = decode(proc_img)
+            stats["decode_ms"] += (time.perf_counter() - start) * 1000
+            if any(matches(sample["expected"], b.data.decode("utf-8", "replace")) for b in found):
+                stats["hits"] += 1
+
+    total = len(corpus)
+    return {
+        "preprocessing_ms_mean": round(float(np.mean(preprocessing_ms)), 2) if preprocessing_ms else 0.0,
+        "variants": {
+            name: {
+                "hit_rate": rate(int(stats["hits"]), total),
+                "decode_ms_mean": round(stats["decode_ms"] / total, 2) if total else 0.0,
+            }
+            for name, stats in variant_stats.items()
+        },
+    }
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any],
+                        rate_tolerance: float, latency_tolerance: float) -> List[str]:
+    """Return regressions of report against a previous JSON report"""
+    problems = []
+    old_rate = baseline["pipeline"]["decode_rate"]
+    new_rate = report["pipeline"]["decode_rate"]
+    if new_rate < old_rate - rate_tolerance:
+        problems.append(f"decode rate dropped {old_rate:.2%} -> {new_rate:.2%}")
+
+    old_p95 = baseline["pipeline"]["latency_ms"]["p95"]
+    new_p95 = report["pipeline"]["latency_ms"]["p95"]
+    if old_p95 and new_p95 > old_p95 * (1 + latency_tolerance):
+        problems.append(f"p95 latency grew {old_p95:.1f}ms -> {new_p95:.1f}ms")
+    return problems
+
+
+def print_report(report: Dict[str, Any]):
+    pipeline = report["pipeline"]
+    latency = pipeline["latency_ms"]
+    print(f"samples:      {pipeline['samples']}")
+    print(f"decode rate:  {pipeline['decode_rate']:.2%}")
+    print(f"latency (ms): p50={latency['p50']:.1f}  p95={latency['p95']:.1f}  mean={latency['mean']:.1f}")
+
+    print("\nhits by preprocessing variant:")
+    for name, value in pipeline["variant_hit_rate"].items():
+        print(f"  {name:<26}{value:.2%}")
+
+    print("\ndecode rate by group:")
+    for name, value in pipeline["groups"].items():
+        print(f"  {name:<26}{value:.2%}")
+
+    if "ablation" in report:
+        ablation = report["ablation"]
+        print(f"\nablation (full frame, preprocessing {ablation['preprocessing_ms_mean']:.1f}ms/frame):")
+        for name, stats in ablation["variants"].items():
+            print(f"  {name:<26}hit {stats['hit_rate']:.2%}  decode {stats['decode_ms_mean']:.1f}ms")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the barcode decoding pipeline")
+    parser.add_argument("--corpus", help="Load a saved corpus directory instead of generating one")
+    parser.add_argument("--save-corpus", help="Write the generated corpus to this directory")
+    parser.add_argument("--per-case", type=int, default=5, help="Samples per symbology x distortion")
+    parser.add_argument("--frame-size", default="1920x1080", help="Generated frame size, WIDTHxHEIGHT")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--ablation", action="store_true", help="Also measure each preprocessing variant alone")
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Fail if results regress against this JSON report")
+    parser.add_argument("--rate-tolerance", type=float, default=0.02, help="Allowed absolute decode-rate drop")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="Allowed relative p95 increase")
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        width, height = (int(v) for v in args.frame_size.lower().split("x"))
+        corpus = generate_corpus(args.per_case, (width, height), args.seed)
+        if args.save_corpus:
+            save_corpus(corpus, args.save_corpus)
+
+    if not corpus:
+        print("Corpus is empty", file=sys.stderr)
+        return 1
+
+    service = BarcodeService()
+    report: Dict[str, Any] = {"pipeline": run_pipeline(service, corpus)}
+    if args.ablation:
+        report["ablation"] = run_ablation(service, corpus)
+
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare_to_baseline(report, json.load(f), args.rate_tolerance, args.latency_tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}", file=sys.stderr)
+        if problems:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,6 +20,33 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-super-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    USER_CACHE_TTL_SECONDS: int = 60
+    TOKEN_CACHE_MAX_ENTRIES: int = 4096
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    MAX_SESSIONS_PER_USER: int = 10
+    
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_CONCURRENCY: int = 8
+    
+    # Inventory
+    STOCK_SNAPSHOT_INTERVAL_HOURS: int = 24
+    
+    # Orders hold their stock until the delivery date plus this grace period
+    ORDER_RESERVATION_GRACE_HOURS: int = 24
+    ORDER_RESERVATION_SWEEP_MINUTES: int = 15
+    
+    # Till close: timezone that decides which business day a sale belongs to
+    TILL_TIMEZONE: str = "UTC"
+    
+    # Exports: documents fetched per cursor round trip
+    EXPORT_BATCH_SIZE: int = 1000
+    
+    # Reorder recommendations
+    REORDER_LEAD_TIME_DAYS: int = 7
+    REORDER_TARGET_COVER_DAYS: int = 14
+    REORDER_REFRESH_INTERVAL_MINUTES: int = 60
 
     # Environment configuration
     model_config = ConfigDict(
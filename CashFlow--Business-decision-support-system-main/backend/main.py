@@ -6,12 +6,16 @@ import os
 from pathlib import Path
 
 from app.database import connect_to_mongodb, close_mongodb_connection
+from app.services.stock_service import run_stock_snapshot_loop
+from app.services.reorder_service import run_reorder_refresh_loop
+from app.services.reservation_service import run_reservation_sweep_loop
 from app.models import settings
 from app.routers import (
     auth, barcode, users, inventory, sales, customers,
-    categories, orders, predictions
+    categories, orders, predictions, exports, analytics, tills
 )
 from app.routers import settings as settings_router
+import asyncio
 import logging
 
 # Set up logging
@@ -38,9 +42,16 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_db_client():
     app.mongodb = await connect_to_mongodb()
+    app.background_tasks = [
+        asyncio.create_task(run_stock_snapshot_loop(app.mongodb)),
+        asyncio.create_task(run_reorder_refresh_loop(app.mongodb)),
+        asyncio.create_task(run_reservation_sweep_loop(app.mongodb))
+    ]
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in getattr(app, "background_tasks", []):
+        task.cancel()
     await close_mongodb_connection()
 
 # Root endpoint for basic health check
@@ -64,6 +75,9 @@ app.include_router(settings_router.router, prefix="/api/settings", tags=["Settin
 app.include_router(barcode.router, prefix="/api/barcode", tags=["Barcode"])
 app.include_router(debug_router, prefix="/api", tags=["Debug"])
 app.include_router(predictions.router, prefix="/api/predictions", tags=["Predictions"])
+app.include_router(exports.router, prefix="/api/exports", tags=["Exports"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
+app.include_router(tills.router, prefix="/api/tills", tags=["Tills"])
 
 # Check if static directory exists
 static_dir = Path("static")
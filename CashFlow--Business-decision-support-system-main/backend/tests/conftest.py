@@ -0,0 +1,141 @@
+"""
+Service-level test fixtures.
+
+Tests run against mongomock-motor, which has no sessions, so
+run_in_transaction takes its standalone path (callback(None)). That is the
+path where the write guards alone have to keep stock, refunds and orders
+consistent.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from app import database
+from app.auth import get_current_admin_principal, get_current_principal
+from app.models.base import PyObjectId
+from app.models.user import Principal, UserRole
+
+
+@pytest.fixture(autouse=True)
+def no_transactions(monkeypatch):
+    monkeypatch.setattr(database, "transactions_supported", False)
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["cashflow_test"]
+
+
+@pytest.fixture
+def business_id():
+    return str(PyObjectId())
+
+
+@pytest.fixture
+async def category(db, business_id):
+    doc = {"_id": PyObjectId(), "business_id": PyObjectId(business_id), "name": "groceries"}
+    await db.categories.insert_one(doc)
+    return doc
+
+
+@pytest.fixture
+def make_product(db, business_id, category):
+    async def make(name: str, quantity: int, price: float = 10.0, reserved: int = 0, category_id=None):
+        doc = {
+            "_id": PyObjectId(),
+            "business_id": PyObjectId(business_id),
+            "category_id": category_id or category["_id"],
+            "name": name,
+            "price": price,
+            "quantity": quantity,
+        }
+        if reserved:
+            doc["reserved"] = reserved
+        await db.inventory.insert_one(doc)
+        return doc
+    return make
+
+
+@pytest.fixture
+async def customer(db, business_id):
+    doc = {
+        "_id": PyObjectId(),
+        "business_id": PyObjectId(business_id),
+        "name": "Jane Perera",
+        "email": "jane@example.com",
+        "purchase_history": [],
+    }
+    await db.customers.insert_one(doc)
+    return doc
+
+
+@pytest.fixture
+def delivery_date():
+    return datetime.utcnow() + timedelta(days=3)
+
+
+@pytest.fixture
+def principal(business_id):
+    return Principal(id=PyObjectId(), business_id=PyObjectId(business_id), role=UserRole.ADMIN)
+
+
+def client_for(router, principal: Principal = None, db=None, prefix: str = "") -> TestClient:
+    """A test client for one router, signed in as `principal` and using `db`"""
+    app = FastAPI()
+    app.include_router(router, prefix=prefix)
+    if principal is not None:
+        app.dependency_overrides[get_current_principal] = lambda: principal
+        app.dependency_overrides[get_current_admin_principal] = lambda: principal
+    if db is not None:
+        app.dependency_overrides[database.get_db] = lambda: db
+    return TestClient(app)
+
+
+async def stock_of(db, product) -> dict:
+    return await db.inventory.find_one({"_id": product["_id"]}, {"quantity": 1, "reserved": 1})
+
+
+class RaceAfterRead:
+    """
+    Database wrapper that runs `hook` once, right after the first call of
+    `collection.method` returns: a concurrent writer committing between a
+    service's read and its guarded write.
+    """
+
+    def __init__(self, db, collection: str, method: str, hook):
+        self._db = db
+        self._collection = collection
+        self._method = method
+        self._hook = hook
+        self.raced = False
+
+    def __getattr__(self, name):
+        collection = getattr(self._db, name)
+        if name != self._collection:
+            return collection
+        return _RacingCollection(self, collection)
+
+    def __getitem__(self, name):
+        return self.__getattr__(name)
+
+
+class _RacingCollection:
+    def __init__(self, race: RaceAfterRead, collection):
+        self._race = race
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name != self._race._method or self._race.raced:
+            return attr
+
+        async def read_then_race(*args, **kwargs):
+            result = await attr(*args, **kwargs)
+            if not self._race.raced:
+                self._race.raced = True
+                await self._race._hook()
+            return result
+        return read_then_race
@@ -0,0 +1,76 @@
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.services import alert_service
+
+
+async def set_quantity(db, product, quantity):
+    await db.inventory.update_one({"_id": product["_id"]}, {"$set": {"quantity": quantity}})
+
+
+async def test_alerts_follow_threshold_crossings(db, business_id, make_product):
+    rice = await make_product("rice", 12)
+
+    async def check():
+        return await alert_service.check_low_stock(db, business_id, [rice["_id"]])
+
+    assert await check() == 0
+
+    await set_quantity(db, rice, 8)
+    assert await check() == 1
+    assert await check() == 0
+    alert = await db.stock_alerts.find_one({"product_id": rice["_id"]})
+    assert (alert["active"], alert["quantity"], alert["product_name"]) == (True, 8, "Rice")
+    triggered_at = alert["triggered_at"]
+
+    await set_quantity(db, rice, 5)
+    assert await check() == 1
+    alert = await db.stock_alerts.find_one({"product_id": rice["_id"]})
+    assert (alert["quantity"], alert["triggered_at"]) == (5, triggered_at)
+
+    await set_quantity(db, rice, 15)
+    assert await check() == 1
+    alert = await db.stock_alerts.find_one({"product_id": rice["_id"]})
+    assert (alert["active"], alert["quantity"]) == (False, 15)
+    assert alert["resolved_at"] is not None
+
+
+async def test_reserved_units_count_against_the_threshold(db, business_id, make_product):
+    rice = await make_product("rice", 15, reserved=6)
+
+    await alert_service.check_low_stock(db, business_id, [rice["_id"]])
+
+    alert = await db.stock_alerts.find_one({"product_id": rice["_id"]})
+    assert (alert["active"], alert["quantity"]) == (True, 9)
+
+
+async def test_threshold_change_reevaluates_and_disabled_alerts_resolve(db, business_id, make_product):
+    rice = await make_product("rice", 12)
+    beans = await make_product("beans", 30)
+    await alert_service.check_low_stock(db, business_id, [rice["_id"], beans["_id"]])
+    assert await db.stock_alerts.count_documents({}) == 0
+
+    await db.settings.insert_one({"business_id": PyObjectId(business_id), "low_stock_threshold": 20})
+    assert await alert_service.reevaluate_low_stock(db, business_id) == 1
+    assert (await db.stock_alerts.find_one({"product_id": rice["_id"]}))["active"] is True
+
+    await db.settings.update_one({"business_id": PyObjectId(business_id)}, {"$set": {"low_stock_alerts": False}})
+    assert await alert_service.reevaluate_low_stock(db, business_id) == 1
+    assert await db.stock_alerts.count_documents({"active": True}) == 0
+
+
+async def test_alert_pages_are_ordered_by_quantity(db, business_id, make_product):
+    products = [await make_product(name, quantity) for name, quantity in (("a", 5), ("b", 2), ("c", 5))]
+    await alert_service.check_low_stock(db, business_id, [p["_id"] for p in products])
+
+    first = await alert_service.get_stock_alerts(business_id, limit=2, db=db)
+    second = await alert_service.get_stock_alerts(business_id, limit=2, cursor=first.next_cursor, db=db)
+
+    assert [a.quantity for a in first.items + second.items] == [2, 5, 5]
+    assert len({a.product_name for a in first.items + second.items}) == 3
+    assert second.next_cursor is None
+
+    with pytest.raises(HTTPException) as error:
+        await alert_service.get_stock_alerts(business_id, cursor="x:y", db=db)
+    assert error.value.status_code == 400
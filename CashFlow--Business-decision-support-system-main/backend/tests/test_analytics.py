@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.sale import (
+    PaymentMethod, RefundCreate, RefundItemCreate, RefundReason, SaleCreate, SaleItemCreate
+)
+from app.services import analytics_service, sale_service
+
+
+@pytest.fixture
+async def sales(db, business_id, make_product):
+    drinks = PyObjectId()
+    await db.categories.insert_one({"_id": drinks, "business_id": PyObjectId(business_id), "name": "drinks"})
+    rice = await make_product("rice", 50, price=30.0)
+    tea = await make_product("tea", 50, price=10.0, category_id=drinks)
+
+    discounted = await sale_service.create_sale(
+        business_id,
+        SaleCreate(
+            items=[
+                SaleItemCreate(product_id=str(rice["_id"]), quantity=2),
+                SaleItemCreate(product_id=str(tea["_id"]), quantity=4),
+            ],
+            tax_percentage=10,
+            discount_percentage=20,
+            payment_method=PaymentMethod.CASH,
+        ),
+        db,
+    )
+    await sale_service.create_sale(
+        business_id,
+        SaleCreate(
+            items=[SaleItemCreate(product_id=str(tea["_id"]), quantity=1)],
+            tax_percentage=10,
+            payment_method=PaymentMethod.DEBIT_CARD,
+        ),
+        db,
+    )
+    await sale_service.create_refund(
+        business_id,
+        str(discounted.id),
+        RefundCreate(
+            items=[RefundItemCreate(product_id=str(tea["_id"]), quantity=1)],
+            reason=RefundReason.CHANGED_MIND,
+            payment_method=PaymentMethod.CASH,
+        ),
+        str(PyObjectId()),
+        db,
+    )
+    return drinks
+
+
+async def test_category_totals_reconcile_with_sale_totals(db, business_id, sales):
+    by_category = await analytics_service.get_revenue_by_category(business_id, db=db)
+    by_method = await analytics_service.get_revenue_by_payment_method(business_id, db=db)
+
+    for field in ("revenue", "net_sales", "tax", "discount", "refunds"):
+        assert getattr(by_category.totals, field) == pytest.approx(getattr(by_method.totals, field), abs=0.02), field
+    assert by_method.totals.revenue == 99.0
+
+    drinks = next(row for row in by_category.rows if row.key == str(sales))
+    # 40 of the discounted sale's 100 subtotal plus the full second sale
+    assert drinks.sales_count == 2
+    assert drinks.quantity == 5
+    assert drinks.discount == 8.0
+    assert drinks.net_sales == 42.0
+    assert drinks.revenue == 46.2
+
+
+async def test_aware_bounds_and_unknown_timezones(db, business_id, sales):
+    now = datetime.now(timezone.utc)
+    report = await analytics_service.get_revenue_by_payment_method(business_id, now - timedelta(days=1), now + timedelta(hours=1), db)
+    assert report.totals.sales_count == 2
+
+    with pytest.raises(HTTPException) as error:
+        await analytics_service.get_revenue_by_hour(business_id, timezone="Mars/Olympus_Mons", db=db)
+    assert error.value.status_code == 400
+
+
+
+async def test_history_summary_counts_each_sale_once(db, business_id, sales):
+    tea = await db.inventory.find_one({"name": "tea"})
+    await db.sales.update_one({"items": {"$size": 1}}, {"$set": {"timestamp": datetime.utcnow() - timedelta(days=9, hours=1)}})
+    await db.sales.insert_one({
+        "_id": PyObjectId(), "business_id": PyObjectId(), "timestamp": datetime.utcnow(),
+        "items": [{"product_id": tea["_id"], "category_name": "Elsewhere", "quantity": 50}],
+    })
+
+    summary = await analytics_service.get_sales_history_summary(business_id, db, refresh=True)
+
+    assert summary["sales_records"] == 2
+    assert summary["total_items_sold"] == 7
+    assert (summary["unique_products"], summary["unique_categories"]) == (2, 2)
+    assert summary["days_of_history"] == 10
+
+
+async def test_history_summary_is_cached_until_refreshed(db, business_id):
+    empty = await analytics_service.get_sales_history_summary(business_id, db, refresh=True)
+    assert (empty["sales_records"], empty["days_of_history"], empty["earliest"]) == (0, 0, None)
+
+    await db.sales.insert_one({
+        "_id": PyObjectId(), "business_id": PyObjectId(business_id), "timestamp": datetime.utcnow(),
+        "items": [{"product_id": PyObjectId(), "category_name": "Drinks", "quantity": 2}],
+    })
+
+    assert (await analytics_service.get_sales_history_summary(business_id, db))["sales_records"] == 0
+    assert (await analytics_service.get_sales_history_summary(business_id, db, refresh=True))["sales_records"] == 1
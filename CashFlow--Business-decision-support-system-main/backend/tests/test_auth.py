@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.auth import (
+    create_access_token,
+    decode_access_token,
+    deps,
+    get_current_admin_principal,
+    jwt_handler,
+    principal_from_token,
+)
+from app.models.base import PyObjectId
+from app.models.user import UserRole, UserUpdate
+from app.services import user_service
+
+
+@pytest.fixture
+def make_user(db, business_id, monkeypatch):
+    async def get_db():
+        return db
+    monkeypatch.setattr(deps, "get_db", get_db)
+
+    async def make(role: UserRole = UserRole.ADMIN, token_version: int = 0):
+        doc = {
+            "_id": PyObjectId(),
+            "business_id": PyObjectId(business_id),
+            "username": f"user{PyObjectId()}",
+            "email": f"{PyObjectId()}@example.com",
+            "role": role.value,
+            "hashed_password": "unused",
+            "token_version": token_version,
+        }
+        await db.users.insert_one(doc)
+        return doc
+    return make
+
+
+def token_for(user: dict, **claims) -> str:
+    return create_access_token({
+        "sub": str(user["_id"]),
+        "business": str(user["business_id"]),
+        "role": user["role"],
+        "ver": user["token_version"],
+        **claims,
+    })
+
+
+async def test_principal_comes_from_signed_claims(make_user):
+    user = await make_user()
+
+    principal = principal_from_token(token_for(user, sid="abc"))
+
+    assert str(principal.id) == str(user["_id"])
+    assert str(principal.business_id) == str(user["business_id"])
+    assert principal.role == UserRole.ADMIN
+    assert principal.session_id == "abc"
+
+
+def test_principal_rejects_missing_claims_and_bad_tokens():
+    token = create_access_token({"sub": str(PyObjectId()), "business": str(PyObjectId())})
+
+    for bad in (token, "not-a-jwt", ""):
+        with pytest.raises(HTTPException) as error:
+            principal_from_token(bad)
+        assert error.value.status_code == 401
+
+
+async def test_admin_routes_recheck_role_and_token_version(make_user, db, business_id):
+    admin = await make_user()
+    principal = principal_from_token(token_for(admin))
+    assert await get_current_admin_principal(principal) == principal
+
+    # Demoted after the token was issued: the claims still say admin
+    await db.users.update_one({"_id": admin["_id"]}, {"$set": {"role": UserRole.REGULAR.value}})
+    with pytest.raises(HTTPException) as error:
+        await get_current_admin_principal(principal)
+    assert error.value.status_code == 403
+
+    stale = await make_user(token_version=2)
+    with pytest.raises(HTTPException) as error:
+        await get_current_admin_principal(principal_from_token(token_for(stale, ver=1)))
+    assert error.value.status_code == 401
+
+
+async def test_user_cache_is_dropped_on_update(make_user, db, business_id):
+    user = await make_user(role=UserRole.REGULAR)
+    user_id = str(user["_id"])
+
+    cached = await user_service.get_user_cached(business_id, user_id, db)
+    await db.users.update_one({"_id": user["_id"]}, {"$set": {"email": "direct@example.com"}})
+    assert (await user_service.get_user_cached(business_id, user_id, db)).email == cached.email
+
+    await user_service.update_user(business_id, user_id, UserUpdate(email="new@example.com"), db)
+    assert (await user_service.get_user_cached(business_id, user_id, db)).email == "new@example.com"
+
+
+@pytest.fixture
+def token_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(jwt_handler, "_TOKEN_CACHE", cache)
+    return cache
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    calls = []
+    decode = jwt_handler.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+    monkeypatch.setattr(jwt_handler.jwt, "decode", counting_decode)
+    return calls
+
+
+def test_verified_tokens_are_cached_and_bounded(token_cache, verifications, monkeypatch):
+    monkeypatch.setattr(jwt_handler.settings, "TOKEN_CACHE_MAX_ENTRIES", 2)
+    tokens = [create_access_token({"sub": str(PyObjectId()), "n": n}) for n in range(3)]
+
+    assert decode_access_token(tokens[0])["n"] == 0
+    assert decode_access_token(tokens[0])["n"] == 0
+    assert len(verifications) == 1
+
+    decode_access_token(tokens[1])
+    decode_access_token(tokens[0])  # most recently used again
+    decode_access_token(tokens[2])
+
+    assert len(token_cache) == 2
+    decode_access_token(tokens[0])
+    assert len(verifications) == 3
+    decode_access_token(tokens[1])
+    assert len(verifications) == 4
+
+
+def test_expired_and_revoked_tokens_are_rejected_from_cache(token_cache, verifications, monkeypatch):
+    expired = create_access_token({"sub": str(PyObjectId())}, expires_delta=timedelta(minutes=-1))
+    assert decode_access_token(expired) is None
+    assert not token_cache
+
+    user_id = str(PyObjectId())
+    token = create_access_token({"sub": user_id, "ver": 0})
+    assert decode_access_token(token) is not None
+
+    monkeypatch.setitem(user_service.TOKEN_VERSION_FLOOR, user_id, 1)
+    assert decode_access_token(token) is None
+    assert not token_cache
+    assert len(verifications) == 2
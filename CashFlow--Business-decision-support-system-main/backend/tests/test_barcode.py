@@ -0,0 +1,125 @@
+import inspect
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+# The zbar shared library is a system package, so its absence is an ImportError
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+from app.services.barcode_service import BarcodeScanSession, BarcodeService  # noqa: E402
+from benchmarks.barcode_benchmark import place_in_frame, render_qr  # noqa: E402
+
+FRAME_SIZE = (1920, 1080)
+
+
+def qr_frame(text: str, seed: int = 1) -> np.ndarray:
+    return place_in_frame(render_qr(text), FRAME_SIZE, random.Random(seed))
+
+
+def blank_frame() -> np.ndarray:
+    return np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), 200, dtype=np.uint8)
+
+
+@pytest.fixture
+def service():
+    return BarcodeService()
+
+
+def test_large_frame_is_decoded_from_a_localized_region(service):
+    frame = qr_frame("ITEM-42")
+
+    results = service.decode_frame(frame)
+
+    assert [r["data"] for r in results] == ["ITEM-42"]
+    rect = results[0]["rect"]
+    center = (rect["x"] + rect["width"] // 2, rect["y"] + rect["height"] // 2)
+    # Coordinates are in the full frame, inside one of the located regions
+    assert any(
+        x <= center[0] < x + w and y <= center[1] < y + h
+        for x, y, w, h in service._locate_barcode_regions(frame)
+    )
+
+
+def test_frame_without_a_barcode_decodes_nothing(service):
+    assert service.decode_frame(blank_frame()) == []
+
+
+def test_downscale_bounds_the_longest_side(service):
+    small, scale = service._downscale(blank_frame(), service.LOCALIZATION_MAX_DIM)
+    assert max(small.shape[:2]) == service.LOCALIZATION_MAX_DIM
+    assert scale == pytest.approx(service.LOCALIZATION_MAX_DIM / FRAME_SIZE[0])
+
+    tiny = np.zeros((100, 200, 3), dtype=np.uint8)
+    assert service._downscale(tiny, service.LOCALIZATION_MAX_DIM) == (tiny, 1.0)
+
+
+def test_preprocessing_variants_are_generated_on_demand(service):
+    variants = service._get_processed_images(blank_frame())
+
+    assert inspect.isgenerator(variants)
+    assert next(variants).ndim == 2  # grayscale comes first
+    assert sum(1 for _ in variants) == len(service.PREPROCESSING_VARIANTS) - 1
+
+
+def png(frame: np.ndarray) -> bytes:
+    return cv2.imencode(".png", frame)[1].tobytes()
+
+
+def test_multi_frame_detection_stops_at_consensus():
+    # One worker makes the decode order deterministic
+    service = BarcodeService(max_workers=1)
+    frames = [png(qr_frame("ITEM-42", seed)) for seed in (1, 2)] + [png(blank_frame())] * 2
+
+    result = service.process_multi_frame_detection(frames)
+
+    assert result["success"] is True
+    assert result["barcode"] == "ITEM-42"
+    assert result["consensus"] is True
+    assert result["frames_processed"] == 2
+    assert [frame["status"] for frame in result["frames"]] == ["decoded", "decoded", "skipped", "skipped"]
+    # Confidence is over every submitted frame, agreement over the frames decoded
+    assert result["confidence"] == 0.5
+    assert result["agreement"] == 1.0
+
+
+def test_multi_frame_detection_without_barcodes(service):
+    result = service.process_multi_frame_detection([blank_frame(), blank_frame()])
+
+    assert result["success"] is False
+    assert result["frames_processed"] == 2
+    assert result["confidence"] == 0
+    assert result["agreement"] == 0
+
+    assert service.process_multi_frame_detection([])["message"] == "No frames provided"
+
+
+def test_scan_session_tracks_the_barcode_and_reports_once(service):
+    session = BarcodeScanSession(service, min_agreement=2)
+    frame = qr_frame("ITEM-42")
+
+    first = session.process_frame(frame)
+    second = session.process_frame(frame)
+    third = session.process_frame(frame)
+
+    assert (first["tracked"], first["consensus"]) == (False, None)
+    assert second["tracked"] is True
+    assert second["consensus"]["barcode"] == "ITEM-42"
+    assert second["consensus"]["votes"] == 2
+    # The value just reported isn't reported again while it stays in view
+    assert third["consensus"] is None
+
+    session.reset()
+    assert session.tracked_region is None
+    assert session.process_frame(frame)["tracked"] is False
+
+
+def test_scan_session_falls_back_to_full_frame_after_misses(service):
+    session = BarcodeScanSession(service)
+    session.process_frame(qr_frame("ITEM-42"))
+
+    results = [session.process_frame(blank_frame()) for _ in range(session.TRACKING_MAX_MISSES)]
+
+    assert [r["tracked"] for r in results] == [True] * (session.TRACKING_MAX_MISSES - 1) + [False]
+    assert session.tracked_region is None
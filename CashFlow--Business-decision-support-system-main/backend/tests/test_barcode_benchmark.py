@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+from benchmarks.barcode_benchmark import (  # noqa: E402
+    compare_to_baseline,
+    ean13_modules,
+    ean_check_digit,
+    generate_corpus,
+    load_corpus,
+    matches,
+    save_corpus,
+)
+
+
+def report(decode_rate, p95):
+    return {"pipeline": {"decode_rate": decode_rate, "latency_ms": {"p95": p95}}}
+
+
+def test_ean_check_digits_and_modules():
+    assert ean_check_digit("400638133393") == "1"
+    assert ean_check_digit("03600029145") == "2"
+
+    modules = ean13_modules("4006381333931")
+    assert len(modules) == 95
+    assert modules.startswith("101") and modules.endswith("101")
+
+
+def test_upc_a_matches_zbar_ean13_form():
+    assert matches("036000291452", "0036000291452")
+    assert not matches("036000291452", "036000291453")
+
+
+def test_corpus_is_reproducible_and_round_trips(tmp_path):
+    corpus = generate_corpus(1, (640, 480), seed=7)
+    again = generate_corpus(1, (640, 480), seed=7)
+
+    assert [s["expected"] for s in corpus] == [s["expected"] for s in again]
+    assert {s["symbology"] for s in corpus} == {"EAN13", "UPCA", "CODE128", "QRCODE"}
+
+    save_corpus(corpus, str(tmp_path))
+    loaded = load_corpus(str(tmp_path))
+
+    assert [s["name"] for s in loaded] == [s["name"] for s in corpus]
+    # PNG is lossless, so the frozen corpus decodes exactly like the generated one
+    assert np.array_equal(loaded[0]["image"], corpus[0]["image"])
+
+
+def test_baseline_comparison_flags_regressions_beyond_tolerance():
+    baseline = report(0.95, 40.0)
+
+    assert compare_to_baseline(report(0.94, 45.0), baseline, 0.02, 0.2) == []
+
+    problems = compare_to_baseline(report(0.90, 60.0), baseline, 0.02, 0.2)
+    assert len(problems) == 2
+    assert problems[0].startswith("decode rate dropped")
+    assert problems[1].startswith("p95 latency grew")
@@ -0,0 +1,101 @@
+import random
+
+import cv2
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)
+
+from app.auth import create_access_token  # noqa: E402
+from app.routers import barcode  # noqa: E402
+from benchmarks.barcode_benchmark import place_in_frame, render_qr  # noqa: E402
+from tests.conftest import client_for  # noqa: E402
+
+
+@pytest.fixture
+def client(principal):
+    return client_for(barcode.router, principal)
+
+
+def qr_png(text: str, seed: int = 1) -> bytes:
+    frame = place_in_frame(render_qr(text), (1280, 720), random.Random(seed))
+    return cv2.imencode(".png", frame)[1].tobytes()
+
+
+def test_binary_upload_and_raw_body_are_scanned(client):
+    image = qr_png("ITEM-42")
+
+    upload = client.post("/barcode/scan-upload", files={"file": ("frame.png", image, "image/png")})
+    raw = client.post("/barcode/scan-raw", content=image, headers={"Content-Type": "image/png"})
+
+    for response in (upload, raw):
+        assert response.status_code == 200
+        assert [b["data"] for b in response.json()["barcodes"]] == ["ITEM-42"]
+
+
+def test_uploads_are_rejected_before_decoding(client):
+    image = qr_png("ITEM-42")
+
+    too_many = client.post(
+        "/barcode/scan-capture-upload",
+        files=[("files", (f"{i}.png", image, "image/png")) for i in range(barcode.MAX_CAPTURE_FRAMES + 1)],
+    )
+    not_an_image = client.post("/barcode/scan-upload", files={"file": ("notes.txt", b"hello", "text/plain")})
+    raw_text = client.post("/barcode/scan-raw", content=b"hello", headers={"Content-Type": "text/plain"})
+
+    assert too_many.status_code == 400
+    assert not_an_image.status_code == 415
+    assert raw_text.status_code == 415
+
+
+def test_capture_upload_reports_consensus(client):
+    response = client.post(
+        "/barcode/scan-capture-upload",
+        files=[("files", (f"{i}.png", qr_png("ITEM-42", i), "image/png")) for i in range(3)],
+    )
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["success"] is True
+    assert body["barcode"]["data"] == "ITEM-42"
+
+
+@pytest.fixture
+def token(principal):
+    return create_access_token({"sub": str(principal.id), "business": str(principal.business_id), "role": principal.role.value})
+
+
+def test_stream_closes_without_an_auth_message(db, token):
+    client = client_for(barcode.router, db=db)
+
+    with client.websocket_connect("/barcode/stream") as ws:
+        ws.send_json({"token": token})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+
+    assert closed.value.code == 1008
+
+
+def test_stream_reports_agreed_barcode_and_resets(db, token):
+    client = client_for(barcode.router, db=db)
+    image = qr_png("ITEM-42")
+
+    with client.websocket_connect("/barcode/stream?min_agreement=2") as ws:
+        ws.send_json({"type": "auth", "token": token})
+        assert ws.receive_json() == {"type": "ready"}
+
+        ws.send_bytes(image)
+        assert ws.receive_json()["type"] == "frame"
+        ws.send_bytes(image)
+        frame = ws.receive_json()
+        result = ws.receive_json()
+
+        ws.send_text("reset")
+        reset = ws.receive_json()
+        ws.send_text("close")
+
+    assert frame["tracked"] is True
+    assert result["type"] == "result"
+    assert result["barcode"] == "ITEM-42"
+    assert result["exists"] is False
+    assert reset == {"type": "reset"}
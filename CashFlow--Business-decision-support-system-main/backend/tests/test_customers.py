@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.customer import CustomerCreate
+from app.models.sale import PaymentMethod, RefundCreate, RefundItemCreate, RefundReason, SaleCreate, SaleItemCreate
+from app.routers import customers
+from app.services import customer_service, sale_service
+from tests.conftest import client_for
+
+
+@pytest.fixture
+def add_customer(db, business_id):
+    async def add(name: str, email: str, phone: str = None):
+        return await customer_service.create_customer(
+            business_id, CustomerCreate(name=name, email=email, phone=phone), db
+        )
+    return add
+
+
+async def test_search_ranks_name_prefix_before_word_and_email_matches(db, business_id, add_customer):
+    await add_customer("Carl Doe", "annex@example.com")
+    await add_customer("Bob Annan", "bob@example.com")
+    await add_customer("Anna Smith", "smith@example.com")
+    await add_customer("Ann Lee", "lee@example.com")
+    await add_customer("Zed Young", "zed@example.com")
+
+    results = await customer_service.search_customers(business_id, "Ann", db)
+
+    assert [c.name for c in results] == ["Ann Lee", "Anna Smith", "Bob Annan", "Carl Doe"]
+
+
+async def test_search_matches_accents_phone_tails_and_every_term(db, business_id, add_customer):
+    await add_customer("José Silva", "jose@example.com", "555-123-9876")
+    await add_customer("Joseph Silk", "joseph@example.com")
+
+    assert [c.name for c in await customer_service.search_customers(business_id, "jose silv", db)] == ["José Silva"]
+    assert [c.name for c in await customer_service.search_customers(business_id, "9876", db)] == ["José Silva"]
+    assert len(await customer_service.search_customers(business_id, "jos", db, limit=1)) == 1
+
+
+async def test_search_treats_regex_characters_as_text(db, business_id, add_customer):
+    await add_customer("Ann Lee", "lee@example.com")
+
+    assert await customer_service.search_customers(business_id, ".*", db) == []
+    assert await customer_service.search_customers(business_id, "(a", db) != []
+    assert await customer_service.search_customers(business_id, "   ", db) == []
+
+
+async def test_customer_pages_follow_the_cursor(db, business_id, add_customer):
+    for n in range(3):
+        await add_customer(f"Customer {n}", f"c{n}@example.com")
+
+    first = await customer_service.get_customers_page(business_id, limit=2, db=db)
+    second = await customer_service.get_customers_page(business_id, limit=2, cursor=first.next_cursor, db=db)
+
+    assert [c.name for c in first.items + second.items] == ["Customer 0", "Customer 1", "Customer 2"]
+    assert second.next_cursor is None
+    assert "purchase_history" not in first.items[0].model_dump()
+
+    with pytest.raises(HTTPException) as error:
+        await customer_service.get_customers_page(business_id, cursor="nope", db=db)
+    assert error.value.status_code == 400
+
+
+async def test_csv_import_reports_bad_and_duplicate_rows(db, business_id, principal, add_customer):
+    await add_customer("Existing", "taken@example.com")
+    csv_file = (
+        "name,email,phone\n"
+        "Ann Lee,ann@example.com,555 123 4567\n"
+        "Ann Again,ANN@example.com,\n"
+        "Taken,taken@example.com,\n"
+        "Bad Email,not-an-email,\n"
+        "Bad Phone,bad@example.com,123\n"
+    )
+
+    response = client_for(customers.router, principal, db, prefix="/customers").post(
+        "/customers/import", files={"file": ("customers.csv", csv_file.encode(), "text/csv")}
+    )
+
+    body = response.json()
+    assert response.status_code == 200
+    assert (body["total_rows"], body["inserted"], body["failed"]) == (5, 1, 4)
+    assert [e["row"] for e in body["errors"]] == [2, 3, 4, 5]
+    assert body["errors"][0]["error"].startswith("Duplicate email in file")
+    assert body["errors"][1]["error"] == "Email already registered"
+
+    stored = await db.customers.find_one({"email": "ann@example.com"})
+    assert stored["phone"] == "555-123-4567"
+    assert "ann" in stored["search_tokens"]
+
+
+async def test_ndjson_import_and_unsupported_files(db, principal):
+    client = client_for(customers.router, principal, db, prefix="/customers")
+    ndjson = '{"name": "Ann Lee", "email": "ann@example.com"}\n{oops\n[1]\n'
+
+    body = client.post("/customers/import", files={"file": ("customers.ndjson", ndjson.encode())}).json()
+    assert (body["inserted"], body["failed"]) == (1, 2)
+    assert body["errors"][0]["error"].startswith("Invalid JSON")
+
+    response = client.post("/customers/import", files={"file": ("customers.xlsx", b"PK", "application/zip")})
+    assert response.status_code == 400
+
+
+async def test_sales_and_refunds_keep_customer_stats(db, business_id, customer, make_product):
+    rice = await make_product("rice", 20, price=10.0)
+    customer_id = str(customer["_id"])
+
+    sales = []
+    for quantity in (2, 3):
+        sales.append(await sale_service.create_sale(
+            business_id,
+            SaleCreate(
+                customer_id=customer["_id"],
+                items=[SaleItemCreate(product_id=str(rice["_id"]), quantity=quantity)],
+                payment_method=PaymentMethod.CASH,
+            ),
+            db,
+        ))
+    await sale_service.create_refund(
+        business_id,
+        str(sales[0].id),
+        RefundCreate(
+            items=[RefundItemCreate(product_id=str(rice["_id"]), quantity=1)],
+            reason=RefundReason.CHANGED_MIND,
+            payment_method=PaymentMethod.CASH,
+        ),
+        str(PyObjectId()),
+        db,
+    )
+
+    stats = await customer_service.get_customer_stats(business_id, customer_id, db)
+
+    assert stats.purchase_count == 2
+    assert stats.lifetime_value == 40.0
+    assert stats.refund_total == 10.0
+    assert stats.average_purchase == 20.0
+    assert stats.recent_purchases == [str(sales[1].id), str(sales[0].id)]
+    assert [(c.amount, c.quantity) for c in stats.top_categories] == [(40.0, 4)]
+
+
+async def test_recent_purchases_are_bounded(db, business_id, customer, monkeypatch):
+    monkeypatch.setattr(customer_service, "CUSTOMER_RECENT_PURCHASES", 2)
+    start = datetime(2026, 1, 1)
+    sale_ids = [PyObjectId() for _ in range(3)]
+    for day, sale_id in enumerate(sale_ids):
+        await customer_service.record_customer_purchase(
+            db, business_id, str(customer["_id"]),
+            {"_id": sale_id, "items": [], "total_amount": 5.0, "timestamp": start + timedelta(days=day)}
+        )
+
+    stats = await customer_service.get_customer_stats(business_id, str(customer["_id"]), db)
+
+    assert stats.recent_purchases == [str(sale_ids[2]), str(sale_ids[1])]
+    assert stats.purchase_count == 3
+    assert (stats.first_purchase_at, stats.last_purchase_at) == (start, start + timedelta(days=2))
+    assert stats.top_categories == []
+    assert await customer_service.get_customer_stats(business_id, str(PyObjectId()), db) is None
@@ -0,0 +1,50 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.sale import PaymentMethod, SaleCreate, SaleItemCreate
+from app.services import export_service, sale_service
+from app.utils.export_writer import encode_rows
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+async def test_sale_items_export_has_one_row_per_line_in_range(db, business_id, make_product):
+    rice = await make_product("rice", 10)
+    dhal = await make_product("dhal", 10)
+    sale = await sale_service.create_sale(
+        business_id,
+        SaleCreate(
+            items=[
+                SaleItemCreate(product_id=str(rice["_id"]), quantity=1),
+                SaleItemCreate(product_id=str(dhal["_id"]), quantity=2),
+            ],
+            payment_method=PaymentMethod.CASH,
+        ),
+        db,
+    )
+    now = datetime.utcnow()
+
+    rows = await collect(export_service.iter_export_rows(business_id, "sale_items", now - timedelta(hours=1), now + timedelta(hours=1), db))
+    assert [(row["sale_id"], row["product_name"], row["quantity"]) for row in rows] == [
+        (sale.id, "Rice", 1), (sale.id, "Dhal", 2)
+    ]
+    assert await collect(export_service.iter_export_rows(business_id, "sale_items", now + timedelta(hours=1), None, db)) == []
+
+    columns = export_service.EXPORT_COLUMNS["sale_items"]
+    chunks = await collect(encode_rows(export_service.iter_export_rows(business_id, "sale_items", db=db), "csv", columns))
+    header, *lines = list(csv.reader(io.StringIO("".join(chunks))))
+    assert header == [name for name, _ in columns]
+    assert [line[header.index("subtotal")] for line in lines] == ["10.0", "20.0"]
+
+
+async def test_orders_are_not_an_export_dataset(db, business_id):
+    with pytest.raises(HTTPException) as error:
+        await collect(export_service.iter_export_rows(business_id, "order_items", db=db))
+
+    assert error.value.status_code == 400
@@ -0,0 +1,74 @@
+import json
+
+from app.routers import inventory
+from app.services import inventory_service
+from app.utils.import_parser import iter_import_rows
+from tests.conftest import client_for, stock_of
+
+
+def csv_rows(text: str):
+    return list(iter_import_rows(text.encode(), "csv"))
+
+
+async def run_import(db, business_id, text: str, upsert: bool = False):
+    results = [r async for r in inventory_service.import_inventory_items(business_id, csv_rows(text), upsert, db)]
+    return results[:-1], results[-1]["summary"]
+
+
+async def test_import_creates_items_and_rejects_bad_rows(db, business_id, category, make_product):
+    await make_product("flour", 5)
+
+    results, summary = await run_import(db, business_id, (
+        "name,category,price,quantity,sku\n"
+        "Rice,Groceries,2.5,40,r-1\n"
+        "Beans,groceries,3,,R-1\n"
+        "Salt,Spices,1,5,\n"
+        "Flour,groceries,1,5,\n"
+        "Sugar,groceries,abc,5,\n"
+    ))
+
+    assert summary == {"total_rows": 5, "created": 1, "updated": 0, "failed": 4}
+    errors = {r["row"]: r["error"] for r in results if r["status"] == "error"}
+    assert errors[2] == "Duplicate sku in file (first seen on row 1)"
+    assert errors[3] == "Category 'Spices' not found"
+    assert errors[4] == "Item with name 'flour' already exists"
+    assert errors[5] == "price: must be a number"
+
+    rice = await db.inventory.find_one({"sku": "R-1"})
+    assert (rice["name"], rice["quantity"], rice["category_id"]) == ("rice", 40, category["_id"])
+    movements = await db.stock_movements.find({"product_id": rice["_id"]}).to_list(None)
+    assert [(m["type"], m["delta"]) for m in movements] == [("import", 40)]
+
+
+async def test_upsert_updates_by_name_but_keeps_reserved_units(db, business_id, make_product):
+    rice = await make_product("rice", 10, price=2.0)
+    beans = await make_product("beans", 10, reserved=6)
+
+    results, summary = await run_import(db, business_id, (
+        "name,price,quantity\n"
+        "rice,2.75,12\n"
+        "beans,,4\n"
+        "lentils,1,3\n"
+    ), upsert=True)
+
+    assert summary == {"total_rows": 3, "created": 0, "updated": 1, "failed": 2}
+    by_row = {r["row"]: r for r in results}
+    assert by_row[1]["status"] == "updated"
+    assert by_row[2]["error"] == "quantity: can't be below the 6 units reserved by pending orders"
+    assert by_row[3]["error"] == "category: Field required for new items"
+
+    updated = await db.inventory.find_one({"_id": rice["_id"]})
+    assert (updated["price"], updated["quantity"]) == (2.75, 12)
+    assert (await stock_of(db, beans))["quantity"] == 10
+
+
+async def test_import_endpoint_streams_ndjson_results(db, principal, category):
+    client = client_for(inventory.router, principal, db, prefix="/inventory")
+    csv_file = "name,category,price\nRice,groceries,2\n"
+
+    response = client.post("/inventory/import", files={"file": ("items.csv", csv_file.encode(), "text/csv")})
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert lines[0]["status"] == "created"
+    assert lines[-1] == {"summary": {"total_rows": 1, "created": 1, "updated": 0, "failed": 0}}
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.order import OrderCreate, OrderItemCreate, OrderSort, OrderStatus
+from app.models.sale import PaymentMethod, SaleCreate, SaleItemCreate
+from app.services import order_service, sale_service
+from tests.conftest import RaceAfterRead, stock_of
+
+
+def order_request(customer, delivery_date, *lines):
+    return OrderCreate(
+        customer_id=customer["_id"],
+        items=[OrderItemCreate(product_id=str(product["_id"]), quantity=quantity) for product, quantity in lines],
+        delivery_date=delivery_date,
+    )
+
+
+async def test_order_completes_once(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 10)
+    order = await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 4)), db)
+    assert (await stock_of(db, rice))["reserved"] == 4
+
+    completed = await order_service.complete_order(business_id, str(order.id), db)
+    with pytest.raises(HTTPException) as error:
+        await order_service.complete_order(business_id, str(order.id), db)
+
+    assert error.value.status_code == 400
+    assert completed.status == OrderStatus.COMPLETED
+    assert await stock_of(db, rice) == {"_id": rice["_id"], "quantity": 6, "reserved": 0}
+    assert await db.sales.count_documents({}) == 1
+
+
+async def test_concurrent_completion_is_rejected_by_order_claim(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 10)
+    order = await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 4)), db)
+
+    async def competing_completion():
+        await order_service.complete_order(business_id, str(order.id), db)
+
+    # The competing call completes the order after this one has read it as pending
+    racing_db = RaceAfterRead(db, "orders", "find_one", competing_completion)
+    with pytest.raises(HTTPException) as error:
+        await order_service.complete_order(business_id, str(order.id), racing_db)
+
+    assert racing_db.raced
+    assert error.value.status_code == 409
+    assert await stock_of(db, rice) == {"_id": rice["_id"], "quantity": 6, "reserved": 0}
+    assert await db.sales.count_documents({}) == 1
+    assert await db.stock_movements.count_documents({}) == 1
+
+
+async def test_failed_completion_reopens_order_and_restores_stock(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 10)
+    dhal = await make_product("dhal", 10)
+    order = await order_service.create_order(
+        business_id, order_request(customer, delivery_date, (rice, 2), (dhal, 3)), db
+    )
+
+    async def product_deleted():
+        # Between the stock read and the decrement of its line
+        await db.inventory.delete_one({"_id": dhal["_id"]})
+
+    racing_db = RaceAfterRead(db, "orders", "update_one", product_deleted)
+    with pytest.raises(HTTPException) as error:
+        await order_service.complete_order(business_id, str(order.id), racing_db)
+
+    assert error.value.status_code == 409
+    assert await stock_of(db, rice) == {"_id": rice["_id"], "quantity": 10, "reserved": 2}
+    doc = await db.orders.find_one({"_id": order.id})
+    assert doc["status"] == OrderStatus.PENDING
+    assert doc["reserved"] is True
+    assert "sale_id" not in doc
+    assert await db.sales.count_documents({}) == 0
+
+
+async def test_unrelated_stock_change_does_not_block_completion(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 10)
+    order = await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 4)), db)
+
+    async def walk_in_sale():
+        # Unreserved stock sold between the stock read and the decrement
+        await sale_service.create_sale(
+            business_id,
+            SaleCreate(items=[SaleItemCreate(product_id=str(rice["_id"]), quantity=5)], payment_method=PaymentMethod.CASH),
+            db,
+        )
+
+    racing_db = RaceAfterRead(db, "orders", "update_one", walk_in_sale)
+    await order_service.complete_order(business_id, str(order.id), racing_db)
+
+    assert racing_db.raced
+    assert await stock_of(db, rice) == {"_id": rice["_id"], "quantity": 1, "reserved": 0}
+    assert await db.sales.count_documents({}) == 2
+    completed = await db.orders.find_one({"_id": order.id})
+    movement = await db.stock_movements.find_one({"reference_id": completed["sale_id"]})
+    assert movement["quantity_after"] == 1
+
+
+@pytest.fixture
+def listing_projection(monkeypatch):
+    # mongomock can't evaluate $size in a find projection
+    projection = {k: v for k, v in order_service.ORDER_LIST_PROJECTION.items() if k != "item_count"}
+    monkeypatch.setattr(order_service, "ORDER_LIST_PROJECTION", projection)
+
+
+async def test_order_pages_follow_the_cursor_through_ties(
+    db, business_id, make_product, customer, delivery_date, listing_projection
+):
+    rice = await make_product("rice", 10)
+    orders = [
+        await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 1)), db)
+        for _ in range(3)
+    ]
+    # Two orders created in the same instant are ordered by id
+    await db.orders.update_many({}, {"$set": {"created_at": datetime(2026, 5, 1)}})
+    await db.orders.update_one({"_id": orders[0].id}, {"$set": {"created_at": datetime(2026, 4, 1)}})
+
+    first = await order_service.get_orders_page(business_id, limit=2, db=db)
+    second = await order_service.get_orders_page(business_id, limit=2, cursor=first.next_cursor, db=db)
+
+    assert [o.id for o in first.items + second.items] == [orders[2].id, orders[1].id, orders[0].id]
+    assert second.next_cursor is None
+
+
+async def test_order_filters_and_bad_input(db, business_id, make_product, customer, delivery_date, listing_projection):
+    rice = await make_product("rice", 10)
+    soon = await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 1)), db)
+    later = await order_service.create_order(
+        business_id, order_request(customer, delivery_date + timedelta(days=7), (rice, 1)), db
+    )
+    await order_service.cancel_order(business_id, str(later.id), db)
+
+    by_delivery = await order_service.get_orders_page(
+        business_id, delivery_to=delivery_date + timedelta(days=1), sort=OrderSort.DELIVERY_DATE, db=db
+    )
+    cancelled = await order_service.get_orders_page(
+        business_id, status_filter=OrderStatus.CANCELLED, customer_id=str(customer["_id"]), db=db
+    )
+    assert [o.id for o in by_delivery.items] == [soon.id]
+    assert [o.id for o in cancelled.items] == [later.id]
+    assert (await order_service.get_orders_page(business_id, customer_id=str(PyObjectId()), db=db)).items == []
+
+    for bad in ({"cursor": "yesterday:123"}, {"customer_id": "nope"}):
+        with pytest.raises(HTTPException) as error:
+            await order_service.get_orders_page(business_id, db=db, **bad)
+        assert error.value.status_code == 400
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import pytest
+from passlib.hash import bcrypt
+
+from app.services import password_service
+from app.services.password_service import PASSWORD_HASH_METRICS, hash_password, verify_password
+
+
+@pytest.fixture(autouse=True)
+def fresh_semaphore(monkeypatch):
+    # The semaphore binds to the first event loop that waits on it
+    monkeypatch.setattr(password_service, "_semaphore", None)
+
+
+async def test_hash_and_verify_round_trip():
+    hashed = await hash_password("s3cret")
+
+    assert await verify_password("s3cret", hashed) == (True, None)
+    assert await verify_password("wrong", hashed) == (False, None)
+    assert await verify_password("s3cret", "not-a-hash") == (False, None)
+
+
+async def test_outdated_cost_is_rehashed(monkeypatch):
+    monkeypatch.setitem(PASSWORD_HASH_METRICS, "rehashes", 0)
+    cheap = bcrypt.using(rounds=4).hash("s3cret")
+
+    valid, new_hash = await verify_password("s3cret", cheap)
+
+    assert valid is True
+    assert new_hash and new_hash != cheap
+    assert await verify_password("s3cret", new_hash) == (True, None)
+    assert PASSWORD_HASH_METRICS["rehashes"] == 1
+
+
+async def test_concurrency_cap_queues_without_blocking_the_loop(monkeypatch):
+    monkeypatch.setattr(password_service.settings, "PASSWORD_HASH_CONCURRENCY", 1)
+    monkeypatch.setitem(PASSWORD_HASH_METRICS, "max_in_flight", 0)
+    monkeypatch.setitem(PASSWORD_HASH_METRICS, "max_waiting", 0)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.gather(*(password_service._run_limited(time.sleep, 0.05) for _ in range(3)))
+    ticking.cancel()
+
+    assert PASSWORD_HASH_METRICS["max_in_flight"] == 1
+    assert PASSWORD_HASH_METRICS["max_waiting"] == 2
+    assert ticks > 10
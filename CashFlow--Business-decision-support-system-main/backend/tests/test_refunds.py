@@ -0,0 +1,153 @@
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.sale import (
+    PaymentMethod, RefundCreate, RefundItemCreate, RefundReason, SaleCreate, SaleItemCreate, SaleStatus
+)
+from app.services import sale_service
+from tests.conftest import RaceAfterRead, stock_of
+
+
+def refund_request(*lines):
+    return RefundCreate(
+        items=[RefundItemCreate(product_id=str(product["_id"]), quantity=quantity) for product, quantity in lines],
+        reason=RefundReason.CHANGED_MIND,
+        payment_method=PaymentMethod.CASH,
+    )
+
+
+@pytest.fixture
+async def sale(db, business_id, make_product):
+    rice = await make_product("rice", 10)
+    sale = await sale_service.create_sale(
+        business_id,
+        SaleCreate(items=[SaleItemCreate(product_id=str(rice["_id"]), quantity=3)], payment_method=PaymentMethod.CASH),
+        db,
+    )
+    return sale, rice
+
+
+async def test_refund_cannot_exceed_quantity_sold(db, business_id, sale):
+    sale, rice = sale
+    processed_by = str(PyObjectId())
+
+    await sale_service.create_refund(business_id, str(sale.id), refund_request((rice, 2)), processed_by, db)
+    with pytest.raises(HTTPException) as error:
+        await sale_service.create_refund(business_id, str(sale.id), refund_request((rice, 2)), processed_by, db)
+
+    assert error.value.status_code == 400
+    doc = await db.sales.find_one({"_id": sale.id})
+    assert doc["items"][0]["refunded_quantity"] == 2
+    assert doc["status"] == SaleStatus.PARTIAL_REFUNDED
+    assert (await stock_of(db, rice))["quantity"] == 9
+    assert await db.refunds.count_documents({"sale_id": sale.id}) == 1
+
+
+async def test_concurrent_refund_is_rejected_by_counter_guard(db, business_id, sale):
+    sale, rice = sale
+
+    async def competing_refund():
+        await db.sales.update_one({"_id": sale.id}, {"$inc": {"items.0.refunded_quantity": 3}})
+
+    racing_db = RaceAfterRead(db, "sales", "find_one", competing_refund)
+    with pytest.raises(HTTPException) as error:
+        await sale_service.create_refund(business_id, str(sale.id), refund_request((rice, 1)), str(PyObjectId()), racing_db)
+
+    assert racing_db.raced
+    assert error.value.status_code == 409
+    doc = await db.sales.find_one({"_id": sale.id})
+    assert doc["items"][0]["refunded_quantity"] == 3
+    assert (await stock_of(db, rice))["quantity"] == 7
+    assert await db.refunds.count_documents({}) == 0
+
+
+async def test_failed_sale_restores_stock_and_leaves_no_ledger_entries(db, business_id, make_product, monkeypatch):
+    rice = await make_product("rice", 5)
+    dhal = await make_product("dhal", 5)
+    validate = sale_service.validate_products_and_quantities
+
+    async def validate_then_sell_out(*args):
+        items = await validate(*args)
+        # Another sale takes the last dhal before this one writes
+        await db.inventory.update_one({"_id": dhal["_id"]}, {"$set": {"quantity": 0}})
+        return items
+
+    monkeypatch.setattr(sale_service, "validate_products_and_quantities", validate_then_sell_out)
+
+    with pytest.raises(HTTPException) as error:
+        await sale_service.create_sale(
+            business_id,
+            SaleCreate(
+                items=[
+                    SaleItemCreate(product_id=str(rice["_id"]), quantity=2),
+                    SaleItemCreate(product_id=str(dhal["_id"]), quantity=2),
+                ],
+                payment_method=PaymentMethod.CASH,
+            ),
+            db,
+        )
+
+    assert error.value.status_code == 400
+    assert (await stock_of(db, rice))["quantity"] == 5
+    assert await db.sales.count_documents({}) == 0
+    assert await db.stock_movements.count_documents({}) == 0
+    assert await db.till_totals.count_documents({}) == 0
+
+
+@pytest.fixture
+async def two_line_sale(db, business_id, make_product):
+    rice = await make_product("rice", 10)
+    dhal = await make_product("dhal", 10)
+    sale = await sale_service.create_sale(
+        business_id,
+        SaleCreate(
+            items=[
+                SaleItemCreate(product_id=str(rice["_id"]), quantity=2),
+                SaleItemCreate(product_id=str(dhal["_id"]), quantity=2),
+            ],
+            payment_method=PaymentMethod.CASH,
+        ),
+        db,
+    )
+    return sale, rice, dhal
+
+
+async def assert_nothing_refunded(db, sale, rice):
+    doc = await db.sales.find_one({"_id": sale.id})
+    assert [line["refunded_quantity"] for line in doc["items"]] == [0, 0]
+    assert doc.get("refund_total", 0) == 0
+    assert doc["status"] == SaleStatus.COMPLETED
+    assert (await stock_of(db, rice))["quantity"] == 8
+    assert await db.refunds.count_documents({}) == 0
+
+
+async def test_refund_of_deleted_product_changes_nothing(db, business_id, two_line_sale):
+    sale, rice, dhal = two_line_sale
+    await db.inventory.delete_one({"_id": dhal["_id"]})
+
+    with pytest.raises(HTTPException) as error:
+        await sale_service.create_refund(
+            business_id, str(sale.id), refund_request((rice, 1), (dhal, 1)), str(PyObjectId()), db
+        )
+
+    assert error.value.status_code == 404
+    await assert_nothing_refunded(db, sale, rice)
+
+
+async def test_failed_refund_puts_counters_and_stock_back(db, business_id, two_line_sale):
+    sale, rice, dhal = two_line_sale
+
+    async def product_deleted():
+        await db.inventory.delete_one({"_id": dhal["_id"]})
+
+    # Deleted after the rice has gone back on the shelf
+    racing_db = RaceAfterRead(db, "inventory", "find_one_and_update", product_deleted)
+    with pytest.raises(HTTPException) as error:
+        await sale_service.create_refund(
+            business_id, str(sale.id), refund_request((rice, 1), (dhal, 1)), str(PyObjectId()), racing_db
+        )
+
+    assert racing_db.raced
+    assert error.value.status_code == 404
+    await assert_nothing_refunded(db, sale, rice)
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.reorder import ReorderUrgency
+from app.services import reorder_service
+
+
+@pytest.fixture(autouse=True)
+def no_models(monkeypatch):
+    async def load_model(business_id, horizon):
+        return None
+    monkeypatch.setattr(reorder_service, "load_model", load_model)
+
+
+async def sell(db, business_id, product, quantity, days_ago):
+    await db.sales.insert_one({
+        "_id": PyObjectId(),
+        "business_id": PyObjectId(business_id),
+        "status": "completed",
+        "timestamp": datetime.utcnow() - timedelta(days=days_ago),
+        "items": [{"product_id": product["_id"], "quantity": quantity, "subtotal": quantity * product["price"]}],
+    })
+
+
+async def test_recommendations_from_sales_history(db, business_id, make_product):
+    rice = await make_product("rice", 100)
+    beans = await make_product("beans", 20)
+    salt = await make_product("salt", 20, reserved=15)
+    await sell(db, business_id, rice, 30, days_ago=10)
+    await sell(db, business_id, beans, 60, days_ago=5)
+
+    result = await reorder_service.refresh_reorder_recommendations(business_id, db)
+    page = await reorder_service.get_reorder_recommendations(business_id, db=db)
+
+    assert result["products"] == 3
+    rows = {r.product_name: r for r in page.items}
+    assert [r.product_name for r in page.items] == ["Salt", "Beans", "Rice"]
+    assert (rows["Salt"].urgency, rows["Salt"].current_stock, rows["Salt"].suggested_quantity) == (
+        ReorderUrgency.CRITICAL, 5, 5
+    )
+    assert (rows["Beans"].urgency, rows["Beans"].daily_demand, rows["Beans"].suggested_quantity) == (
+        ReorderUrgency.REORDER, 2.0, 32
+    )
+    assert (rows["Rice"].urgency, rows["Rice"].days_of_cover, rows["Rice"].suggested_quantity) == (
+        ReorderUrgency.OK, 100.0, 0
+    )
+    assert rows["Salt"].days_of_cover is None
+    assert {r.demand_source for r in page.items} == {"history"}
+    assert str(salt["_id"]) == rows["Salt"].product_id
+
+
+async def test_model_forecasts_replace_history_and_runs_are_swapped(db, business_id, make_product, monkeypatch):
+    rice = await make_product("rice", 10)
+    await sell(db, business_id, rice, 300, days_ago=3)
+
+    class Flat:
+        def predict(self, features):
+            return np.full(len(features), 7.0)
+
+    async def load_model(business_id, horizon):
+        return Flat() if horizon == "weekly" else None
+    monkeypatch.setattr(reorder_service, "load_model", load_model)
+
+    await reorder_service.refresh_reorder_recommendations(business_id, db)
+    await reorder_service.refresh_reorder_recommendations(business_id, db)
+    page = await reorder_service.get_reorder_recommendations(business_id, urgency=ReorderUrgency.CRITICAL, db=db)
+
+    assert await db.reorder_recommendations.count_documents({}) == 1
+    assert [(r.demand_source, r.daily_demand, r.forecast) for r in page.items] == [("model", 1.0, {"weekly": 7.0})]
+
+    with pytest.raises(HTTPException) as error:
+        await reorder_service.get_reorder_recommendations(business_id, cursor="next", db=db)
+    assert error.value.status_code == 400
+
+
+async def test_no_run_yet_returns_an_empty_page(db, business_id):
+    page = await reorder_service.get_reorder_recommendations(business_id, db=db)
+
+    assert page.items == []
+    assert page.generated_at is None
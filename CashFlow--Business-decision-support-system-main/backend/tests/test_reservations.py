@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.models.base import PyObjectId
+from app.models.order import OrderCreate, OrderItemCreate
+from app.models.sale import PaymentMethod, SaleCreate, SaleItemCreate
+from app.services import alert_service, order_service, reservation_service, sale_service
+from tests.conftest import RaceAfterRead, stock_of
+
+
+def order_request(customer, delivery_date, *lines):
+    return OrderCreate(
+        customer_id=customer["_id"],
+        items=[OrderItemCreate(product_id=str(product["_id"]), quantity=quantity) for product, quantity in lines],
+        delivery_date=delivery_date,
+    )
+
+
+async def test_orders_cannot_reserve_more_than_available(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 5)
+    await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 3)), db)
+
+    with pytest.raises(HTTPException) as error:
+        await order_service.create_order(business_id, order_request(customer, delivery_date, (rice, 3)), db)
+
+    assert error.value.status_code == 400
+    assert (await stock_of(db, rice))["reserved"] == 3
+    assert await db.orders.count_documents({}) == 1
+
+
+async def test_sale_cannot_take_reserved_stock(db, business_id, make_product):
+    rice = await make_product("rice", 5, reserved=4)
+
+    with pytest.raises(HTTPException) as error:
+        await sale_service.create_sale(
+            business_id,
+            SaleCreate(items=[SaleItemCreate(product_id=str(rice["_id"]), quantity=2)], payment_method=PaymentMethod.CASH),
+            db,
+        )
+
+    assert error.value.status_code == 400
+    assert await stock_of(db, rice) == {"_id": rice["_id"], "quantity": 5, "reserved": 4}
+
+
+async def test_update_moves_holds_to_the_new_lines(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 10)
+    dhal = await make_product("dhal", 10)
+    order = await order_service.create_order(
+        business_id, order_request(customer, delivery_date, (rice, 4), (dhal, 2)), db
+    )
+
+    await order_service.update_order(
+        business_id, str(order.id), order_request(customer, delivery_date, (rice, 1), (dhal, 5)), db
+    )
+
+    assert (await stock_of(db, rice))["reserved"] == 1
+    assert (await stock_of(db, dhal))["reserved"] == 5
+
+
+async def test_failed_update_puts_holds_back(db, business_id, make_product, customer, delivery_date):
+    rice = await make_product("rice", 10)
+    dhal = await make_product("dhal", 10)
+    order = await order_service.create_order(
+        business_id, order_request(customer, delivery_date, (rice, 4), (dhal, 2)), db
+    )
+
+    async def reservation_expires():
+        await db.orders.update_one({"_id": order.id}, {"$set": {"reservation_expires_at": datetime.utcnow() - timedelta(hours=1)}})
+        assert await reservation_service.release_expired_reservations(db) == 1
+
+    # The sweep releases the order's holds after the update has read it as reserved
+    racing_db = RaceAfterRead(db, "orders", "find_one", reservation_expires)
+    with pytest.raises(HTTPException) as error:
+        await order_service.update_order(
+            business_id, str(order.id), order_request(customer, delivery_date, (rice, 1), (dhal, 5)), racing_db
+        )
+
+    assert error.value.status_code == 409
+    assert (await stock_of(db, rice))["reserved"] == 0
+    assert (await stock_of(db, dhal))["reserved"] == 0
+
+
+@pytest.mark.parametrize("quantity", [0, -2])
+def test_order_lines_need_a_positive_quantity(quantity):
+    with pytest.raises(ValidationError):
+        OrderItemCreate(product_id=str(PyObjectId()), quantity=quantity)
+
+
+async def test_low_stock_alerts_count_reserved_stock_as_gone(db, business_id, make_product):
+    rice = await make_product("rice", 30, reserved=25)
+    dhal = await make_product("dhal", 30)
+
+    assert await alert_service.check_low_stock(db, business_id, [rice["_id"], dhal["_id"]]) == 1
+
+    alert = await db.stock_alerts.find_one({"product_id": rice["_id"]})
+    assert alert["active"] is True
+    assert alert["quantity"] == 5
+    assert await db.stock_alerts.count_documents({"product_id": dhal["_id"]}) == 0
@@ -0,0 +1,71 @@
+import pytest
+
+from app.models.base import PyObjectId
+from app.models.user import UserInDB, UserRole
+from app.services import session_service, user_service
+from app.services.password_service import hash_password
+
+
+@pytest.fixture
+async def user(db, business_id):
+    doc = {
+        "_id": PyObjectId(),
+        "business_id": PyObjectId(business_id),
+        "username": "till1",
+        "email": "till1@example.com",
+        "role": UserRole.REGULAR.value,
+        "hashed_password": await hash_password("old-password"),
+    }
+    await db.users.insert_one(doc)
+    return UserInDB.model_validate(doc)
+
+
+async def test_refresh_tokens_rotate_and_reuse_ends_the_session(db, user):
+    first, session = await session_service.create_session(user, user_agent="till", db=db)
+
+    second, rotated = await session_service.rotate_session(first, db)
+
+    assert second != first
+    assert rotated.id == session.id
+    assert rotated.rotation_count == 1
+
+    # Replaying the rotated-out token looks like theft: the whole session ends
+    assert await session_service.rotate_session(first, db) is None
+    assert await db.sessions.count_documents({}) == 0
+    assert session_service.is_session_revoked(str(session.id))
+    assert await session_service.rotate_session(second, db) is None
+
+
+async def test_malformed_or_unknown_refresh_tokens_are_rejected(db, user):
+    await session_service.create_session(user, db=db)
+
+    for token in ("", "garbage", f"{PyObjectId()}.secret"):
+        assert await session_service.rotate_session(token, db) is None
+    assert await db.sessions.count_documents({}) == 1
+
+
+async def test_listing_and_revoking_sessions(db, user, business_id):
+    _, current = await session_service.create_session(user, db=db)
+    _, other = await session_service.create_session(user, db=db)
+
+    sessions = await session_service.list_sessions(business_id, str(user.id), str(current.id), db)
+    assert {s.id: s.current for s in sessions} == {str(current.id): True, str(other.id): False}
+
+    assert await session_service.revoke_session(business_id, str(user.id), str(other.id), db)
+    assert not await session_service.revoke_session(business_id, str(user.id), str(other.id), db)
+    assert session_service.is_session_revoked(str(other.id))
+
+
+async def test_password_change_signs_out_other_sessions(db, user, business_id):
+    _, current = await session_service.create_session(user, db=db)
+    _, other = await session_service.create_session(user, db=db)
+
+    changed = await user_service.change_user_password(
+        business_id, str(user.id), "old-password", "new-password", db, current_session_id=str(current.id)
+    )
+
+    assert changed is True
+    remaining = await db.sessions.distinct("_id", {})
+    assert remaining == [current.id]
+    assert session_service.is_session_revoked(str(other.id))
+    assert not session_service.is_session_revoked(str(current.id))
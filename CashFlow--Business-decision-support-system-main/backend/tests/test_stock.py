@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.sale import PaymentMethod, SaleCreate, SaleItemCreate
+from app.models.stock import StockAdjustmentLine, StockAdjustmentMode, StockAdjustmentRequest, StockMovementType
+from app.services import sale_service, stock_service
+from tests.conftest import RaceAfterRead, stock_of
+
+
+def adjustment(mode: StockAdjustmentMode, *lines: dict) -> StockAdjustmentRequest:
+    return StockAdjustmentRequest(mode=mode, reason="stocktake", lines=[StockAdjustmentLine(**line) for line in lines])
+
+
+async def test_deltas_are_combined_and_recorded(db, business_id, make_product):
+    rice = await make_product("rice", 10, price=2.0)
+    await db.inventory.update_one({"_id": rice["_id"]}, {"$set": {"sku": "R-1"}})
+
+    entry = await stock_service.apply_stock_adjustments(business_id, adjustment(
+        StockAdjustmentMode.DELTA,
+        {"product_id": str(rice["_id"]), "delta": -3},
+        {"sku": "r-1", "delta": 5},
+    ), str(PyObjectId()), db)
+
+    assert (await stock_of(db, rice))["quantity"] == 12
+    assert (entry.lines_changed, entry.total_variance, entry.total_value_variance) == (1, 2, 4.0)
+    movements = await db.stock_movements.find({"product_id": rice["_id"]}).to_list(None)
+    assert [(m["type"], m["delta"], m["quantity_after"]) for m in movements] == [("adjustment", 2, 12)]
+
+
+async def test_stocktake_reports_variance_per_product(db, business_id, make_product):
+    rice = await make_product("rice", 10, price=2.0)
+    beans = await make_product("beans", 4, price=1.5)
+    salt = await make_product("salt", 7)
+
+    entry = await stock_service.apply_stock_adjustments(business_id, adjustment(
+        StockAdjustmentMode.COUNT,
+        {"product_id": str(rice["_id"]), "counted": 8},
+        {"product_id": str(beans["_id"]), "counted": 6},
+        {"product_id": str(salt["_id"]), "counted": 7},
+    ), str(PyObjectId()), db)
+
+    assert [(l.product_name, l.before, l.after, l.variance) for l in entry.lines] == [
+        ("Beans", 4, 6, 2), ("Rice", 10, 8, -2), ("Salt", 7, 7, 0)
+    ]
+    assert (entry.lines_changed, entry.total_variance, entry.total_value_variance) == (2, 0, -1.0)
+    assert await db.stock_adjustments.count_documents({}) == 1
+
+
+async def test_adjustments_are_rejected_whole(db, business_id, make_product):
+    rice = await make_product("rice", 10)
+    beans = await make_product("beans", 10, reserved=4)
+
+    with pytest.raises(HTTPException) as error:
+        await stock_service.apply_stock_adjustments(business_id, adjustment(
+            StockAdjustmentMode.COUNT,
+            {"product_id": str(rice["_id"]), "counted": 2},
+            {"product_id": str(beans["_id"]), "counted": 3},
+        ), str(PyObjectId()), db)
+    assert error.value.status_code == 400
+    assert "below the 4 units reserved" in error.value.detail
+
+    with pytest.raises(HTTPException) as error:
+        await stock_service.apply_stock_adjustments(business_id, adjustment(
+            StockAdjustmentMode.DELTA,
+            {"product_id": str(rice["_id"]), "delta": 1},
+            {"sku": "MISSING", "delta": 1},
+        ), str(PyObjectId()), db)
+    assert error.value.detail["errors"] == [{"line": 1, "error": "Product not found"}]
+
+    assert (await stock_of(db, rice))["quantity"] == 10
+    assert await db.stock_adjustments.count_documents({}) == 0
+
+
+async def test_concurrent_change_undoes_lines_already_written(db, business_id, make_product):
+    rice = await make_product("rice", 10)
+    beans = await make_product("beans", 10)
+
+    async def concurrent_sale():
+        await db.inventory.update_one({"_id": beans["_id"]}, {"$inc": {"quantity": -1}})
+
+    racing_db = RaceAfterRead(db, "inventory", "update_one", concurrent_sale)
+    with pytest.raises(HTTPException) as error:
+        await stock_service.apply_stock_adjustments(business_id, adjustment(
+            StockAdjustmentMode.COUNT,
+            {"product_id": str(rice["_id"]), "counted": 12},
+            {"product_id": str(beans["_id"]), "counted": 12},
+        ), str(PyObjectId()), racing_db)
+
+    assert racing_db.raced
+    assert error.value.status_code == 409
+    assert (await stock_of(db, rice))["quantity"] == 10
+    assert (await stock_of(db, beans))["quantity"] == 9
+    assert await db.stock_adjustments.count_documents({}) == 0
+    assert await db.stock_movements.count_documents({}) == 0
+
+
+DAY = datetime(2026, 3, 1)
+
+
+async def record(db, business_id, product, *changes):
+    """Ledger entries (day offset, delta, quantity after) for a product"""
+    await stock_service.record_stock_movements(db, [
+        stock_service.stock_movement(
+            business_id, product["_id"], StockMovementType.MANUAL, delta, after, timestamp=DAY + timedelta(days=day)
+        )
+        for day, delta, after in changes
+    ])
+
+
+async def test_sales_write_the_ledger(db, business_id, make_product):
+    rice = await make_product("rice", 10)
+
+    sale = await sale_service.create_sale(
+        business_id,
+        SaleCreate(items=[SaleItemCreate(product_id=str(rice["_id"]), quantity=3)], payment_method=PaymentMethod.CASH),
+        db,
+    )
+
+    movement = await db.stock_movements.find_one({"product_id": rice["_id"]})
+    assert (movement["type"], movement["delta"], movement["quantity_after"]) == ("sale", -3, 7)
+    assert movement["reference_id"] == sale.id
+    level = await stock_service.get_stock_at(business_id, str(rice["_id"]), datetime.utcnow(), db)
+    assert (level.quantity, level.source) == (7, "movement")
+
+
+async def test_stock_at_a_point_in_time(db, business_id, make_product):
+    rice = await make_product("rice", 4)
+    beans = await make_product("beans", 9)
+    await record(db, business_id, rice, (1, 10, 20), (3, -16, 4))
+
+    async def rice_at(day):
+        return (await stock_service.get_stock_at(business_id, str(rice["_id"]), DAY + timedelta(days=day), db)).quantity
+
+    assert [await rice_at(day) for day in (0, 1, 2, 3, 4)] == [10, 20, 20, 4, 4]
+
+    # No ledger entries: the current quantity is all there is
+    level = await stock_service.get_stock_at(business_id, str(beans["_id"]), DAY, db)
+    assert (level.quantity, level.source) == (9, "current")
+    assert await stock_service.get_stock_at(business_id, str(PyObjectId()), DAY, db) is None
+
+
+async def test_levels_replay_from_the_nearest_snapshot(db, business_id, make_product):
+    rice = await make_product("rice", 4)
+    beans = await make_product("beans", 9)
+    await record(db, business_id, rice, (1, 10, 20), (3, -16, 4))
+    await db.stock_snapshots.insert_one({
+        "_id": PyObjectId(),
+        "business_id": PyObjectId(business_id),
+        "timestamp": DAY + timedelta(days=2),
+        "quantities": {str(rice["_id"]): 20, str(beans["_id"]): 7},
+    })
+
+    before_snapshot = await stock_service.get_stock_levels_at(business_id, DAY, db)
+    after_snapshot = await stock_service.get_stock_levels_at(business_id, DAY + timedelta(days=4), db)
+
+    assert before_snapshot == {str(rice["_id"]): 10, str(beans["_id"]): 9}
+    assert after_snapshot == {str(rice["_id"]): 4, str(beans["_id"]): 7}
+
+
+async def test_snapshots_skip_recently_checkpointed_businesses(db, business_id, make_product):
+    await make_product("rice", 4)
+    await db.businesses.insert_one({"_id": PyObjectId(business_id), "name": "Shop"})
+
+    assert await stock_service.create_stock_snapshots(db) == 1
+    assert await stock_service.create_stock_snapshots(db) == 0
+
+    snapshot = await db.stock_snapshots.find_one({"business_id": PyObjectId(business_id)})
+    assert list(snapshot["quantities"].values()) == [4]
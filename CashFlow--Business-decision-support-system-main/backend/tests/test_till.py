@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.base import PyObjectId
+from app.models.sale import PaymentMethod, RefundCreate, RefundItemCreate, RefundReason, SaleCreate, SaleItemCreate
+from app.services import sale_service, till_service
+
+
+async def test_till_accumulates_committed_sales_and_refunds(db, business_id, make_product):
+    rice = await make_product("rice", 10, price=25.0)
+    dhal = await make_product("dhal", 10, price=40.0)
+
+    sale = await sale_service.create_sale(
+        business_id,
+        SaleCreate(items=[SaleItemCreate(product_id=str(rice["_id"]), quantity=2)], payment_method=PaymentMethod.CASH),
+        db,
+    )
+    await sale_service.create_sale(
+        business_id,
+        SaleCreate(items=[SaleItemCreate(product_id=str(dhal["_id"]), quantity=1)], payment_method=PaymentMethod.CREDIT_CARD),
+        db,
+    )
+    await sale_service.create_refund(
+        business_id,
+        str(sale.id),
+        RefundCreate(
+            items=[RefundItemCreate(product_id=str(rice["_id"]), quantity=1)],
+            reason=RefundReason.CHANGED_MIND,
+            payment_method=PaymentMethod.CASH,
+        ),
+        str(PyObjectId()),
+        db,
+    )
+
+    report = await till_service.get_till_day(business_id, till_service.business_day(datetime.utcnow()), db)
+
+    by_method = {totals.payment_method: totals for totals in report.methods}
+    assert by_method["cash"].sales_count == 1
+    assert by_method["cash"].gross == 50.0
+    assert by_method["cash"].refund_count == 1
+    assert by_method["cash"].refunds == 25.0
+    assert by_method["credit_card"].gross == 40.0
+    assert report.totals.sales_count == 2
+    assert report.totals.net == 65.0
+
+
+async def test_period_report_range_is_bounded(db, business_id):
+    report = await till_service.get_till_period(business_id, "2024-01-01", "2024-12-31", db)
+    assert report.totals.sales_count == 0
+
+    with pytest.raises(HTTPException) as error:
+        await till_service.get_till_period(business_id, "2020-01-01", "2024-12-31", db)
+
+    assert error.value.status_code == 400